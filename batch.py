@@ -0,0 +1,397 @@
+"""N games of CyberPunk-Man stepped at once with NumPy.
+
+BatchGame keeps the state of every game in flat arrays and advances all of
+them with one call to step(). The rules mirror engine.GameState tick for tick
+(movement, dot eating, power mode, collisions, level progression); only the
+random streams differ, since ghosts here draw from one NumPy generator for the
+whole batch instead of a random.Random per game.
+"""
+
+import numpy as np
+
+from engine import (
+    AMBUSH_LOOKAHEAD,
+    CELL_SIZE,
+    CHASE_TICKS,
+    DIRECTIONS,
+    DOT_SCORE,
+    GHOST_AI_MODES,
+    GHOST_PERSONALITIES,
+    GHOST_SCORE,
+    PELLET_SCORE,
+    POWER_TICKS,
+    SCATTER_TICKS,
+    SHY_DISTANCE,
+    get_levels,
+)
+from maze import NO_HOP, UNREACHABLE
+
+HALF = CELL_SIZE // 2
+RADIUS = CELL_SIZE // 2 - 4
+GHOST_SPEED = CELL_SIZE // 16
+START_SPEED = CELL_SIZE // 4
+NORMAL_SPEED = CELL_SIZE // 8
+POWER_SPEED = 3 * CELL_SIZE // 16
+CATCH_DISTANCE = (CELL_SIZE // 2) ** 2
+
+DX = np.array([d[0] for d in DIRECTIONS], dtype=np.int64)
+DY = np.array([d[1] for d in DIRECTIONS], dtype=np.int64)
+
+# For every 4-bit direction mask: how many directions it holds and which they are
+MASK_COUNTS = np.array([bin(mask).count("1") for mask in range(16)], dtype=np.int64)
+MASK_CHOICES = np.zeros((16, 4), dtype=np.int64)
+for _mask in range(16):
+    _dirs = [d for d in range(4) if _mask >> d & 1]
+    MASK_CHOICES[_mask, : len(_dirs)] = _dirs
+
+
+def unpack_mask(mask, width, height):
+    # A cell bitmask as a (height, width) array of 0/1
+    data = np.frombuffer(mask.to_bytes((width * height + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(data, bitorder="little")[: width * height].reshape(height, width)
+
+
+def compile_levels(level_list=None):
+    # Padded with a ring of walls so neighbour lookups never leave the array
+    level_list = get_levels() if level_list is None else level_list
+    walls = np.array(
+        [unpack_mask(level.walls, level.width, level.height) for level in level_list],
+        dtype=bool,
+    )
+    count, height, width = walls.shape
+    open_cells = np.zeros((count, height + 2, width + 2), dtype=bool)
+    open_cells[:, 1:-1, 1:-1] = ~walls
+
+    # Legal-direction masks are the NavGraph ones compiled into the level pack
+    dir_masks = np.array(
+        [np.frombuffer(level.dir_mask, dtype=np.uint8) for level in level_list],
+        dtype=np.int64,
+    ).reshape(count, height, width)
+
+    dots = np.array(
+        [
+            unpack_mask(level.dots, width, height) + unpack_mask(level.pellets, width, height)
+            for level in level_list
+        ],
+        dtype=np.int8,
+    )
+    return open_cells, dir_masks, dots
+
+
+def compile_spawns(level_list=None):
+    # Pacman starts and ghost homes (L, 2), ghost starts (L, G, 2)
+    level_list = get_levels() if level_list is None else level_list
+    ghost_counts = {len(level.ghost_starts) for level in level_list}
+    if len(ghost_counts) != 1:
+        raise ValueError("BatchGame needs the same number of ghosts on every level")
+    pacman_starts = np.array([level.pacman_start for level in level_list], dtype=np.int64)
+    ghost_homes = np.array([level.ghost_home for level in level_list], dtype=np.int64)
+    ghost_starts = np.array([level.ghost_starts for level in level_list], dtype=np.int64)
+    return pacman_starts, ghost_homes, ghost_starts
+
+
+def compile_distance_tables(level_list=None):
+    # Per-level DistanceTable arrays padded to the largest open-cell count:
+    # cell_id (L, H * W), dist and next_hop (L, N, N)
+    level_list = get_levels() if level_list is None else level_list
+    mazes = [level.maze() for level in level_list]
+    tables = [maze.distances for maze in mazes]
+    size = max(table.n for table in tables)
+    cell_ids = np.array([np.asarray(table.cell_id) for table in tables], dtype=np.int64)
+    dist = np.full((len(tables), size, size), UNREACHABLE, dtype=np.int64)
+    next_hop = np.full((len(tables), size, size), NO_HOP, dtype=np.int64)
+    for index, table in enumerate(tables):
+        n = table.n
+        dist[index, :n, :n] = np.frombuffer(table.dist, dtype=np.uint16).reshape(n, n)
+        next_hop[index, :n, :n] = np.frombuffer(table.next_hop, dtype=np.uint8).reshape(n, n)
+    corners = np.array([maze.nav.corners for maze in mazes])
+    return cell_ids, dist, next_hop, corners
+
+
+class BatchGame:
+    def __init__(self, n, level=0, seed=None, level_list=None, ghost_ai="random"):
+        if ghost_ai not in GHOST_AI_MODES:
+            raise ValueError(f"unknown ghost AI {ghost_ai!r}")
+        level_list = get_levels() if level_list is None else level_list
+        self.ghost_ai = ghost_ai
+        self.n = n
+        self.level_count = len(level_list)
+        self.open_cells, self.dir_masks, self.initial_dots = compile_levels(level_list)
+        _, self.height, self.width = self.initial_dots.shape
+        self.pacman_starts, self.ghost_homes, self.ghost_starts = compile_spawns(level_list)
+        self.ghost_count = self.ghost_starts.shape[1]
+        self.rng = np.random.default_rng(seed)
+        if ghost_ai == "chase":
+            self.cell_ids, self.dist, self.next_hop, self.corners = compile_distance_tables(
+                level_list
+            )
+            self.personality = np.array(
+                [
+                    GHOST_PERSONALITIES[i % len(GHOST_PERSONALITIES)]
+                    for i in range(self.ghost_count)
+                ]
+            )
+
+        g = self.ghost_count
+        self.level = np.zeros(n, dtype=np.int64)
+        self.tick = np.zeros(n, dtype=np.int64)
+        self.x = np.zeros(n, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.direction = np.zeros(n, dtype=np.int64)
+        self.speed = np.zeros(n, dtype=np.int64)
+        self.power_mode = np.zeros(n, dtype=bool)
+        self.power_timer = np.zeros(n, dtype=np.int64)
+        self.lives = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.dots = np.zeros((n, self.height, self.width), dtype=np.int8)
+        self.dots_left = np.zeros(n, dtype=np.int64)
+        self.ghost_x = np.zeros((n, g), dtype=np.int64)
+        self.ghost_y = np.zeros((n, g), dtype=np.int64)
+        self.ghost_direction = np.zeros((n, g), dtype=np.int64)
+        self.ghost_flee = np.zeros((n, g), dtype=bool)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.victory = np.zeros(n, dtype=bool)
+        self.reset(level=level)
+
+    @property
+    def done(self):
+        return self.game_over | self.victory
+
+    def reset(self, mask=None, level=0):
+        # Restart the selected games (all of them by default) from scratch
+        mask = np.ones(self.n, dtype=bool) if mask is None else np.asarray(mask)
+        self.level[mask] = level
+        self.tick[mask] = 0
+        self.lives[mask] = 3
+        self.score[mask] = 0
+        self.game_over[mask] = False
+        self.victory[mask] = False
+        self._initialize_level(mask)
+
+    def _initialize_level(self, mask):
+        self.dots[mask] = self.initial_dots[self.level[mask]]
+        self.dots_left[mask] = np.count_nonzero(self.dots[mask], axis=(1, 2))
+        starts = self.ghost_starts[self.level[mask]]
+        self.ghost_x[mask] = starts[..., 0] * CELL_SIZE + HALF
+        self.ghost_y[mask] = starts[..., 1] * CELL_SIZE + HALF
+        self.ghost_direction[mask] = self.rng.integers(
+            0, 4, size=(np.count_nonzero(mask), self.ghost_count)
+        )
+        self.ghost_flee[mask] = False
+        self._reset_pacman(mask)
+
+    def _reset_pacman(self, mask):
+        start = self.pacman_starts[self.level[mask]]
+        self.x[mask] = start[:, 0] * CELL_SIZE + HALF
+        self.y[mask] = start[:, 1] * CELL_SIZE + HALF
+        self.speed[mask] = START_SPEED
+        self.direction[mask] = 0
+        self.power_mode[mask] = False
+        self.power_timer[mask] = 0
+
+    def _is_open(self, level, cell_x, cell_y):
+        return self.open_cells[level, cell_y + 1, cell_x + 1]
+
+    def _move_pacman(self, active):
+        dx = DX[self.direction] * self.speed
+        dy = DY[self.direction] * self.speed
+        new_x = self.x + dx
+        new_y = self.y + dy
+        cell_x = self.x // CELL_SIZE
+        cell_y = self.y // CELL_SIZE
+        target_x = cell_x + np.sign(dx)
+        target_y = cell_y + np.sign(dy)
+        valid = self._is_open(self.level, cell_x, cell_y) & self._is_open(
+            self.level, target_x, target_y
+        )
+
+        horizontal = dx != 0
+        locked_x = np.where(horizontal, new_x, cell_x * CELL_SIZE + HALF)
+        locked_y = np.where(horizontal, cell_y * CELL_SIZE + HALF, new_y)
+
+        # Blocked: slide up to the wall of the current cell on the moving axis
+        clamped_x = np.where(
+            dx > 0,
+            np.minimum(new_x, (cell_x + 1) * CELL_SIZE - RADIUS - 1),
+            np.where(dx < 0, np.maximum(new_x, cell_x * CELL_SIZE + RADIUS), self.x),
+        )
+        clamped_y = np.where(
+            dy > 0,
+            np.minimum(new_y, (cell_y + 1) * CELL_SIZE - RADIUS - 1),
+            np.where(dy < 0, np.maximum(new_y, cell_y * CELL_SIZE + RADIUS), self.y),
+        )
+
+        moved_x = np.where(valid, locked_x, clamped_x)
+        moved_y = np.where(valid, locked_y, clamped_y)
+        self.x = np.where(active, moved_x, self.x)
+        self.y = np.where(active, moved_y, self.y)
+
+    def _eat_dots(self, active):
+        rows = np.arange(self.n)
+        cell_x = self.x // CELL_SIZE
+        cell_y = self.y // CELL_SIZE
+        dot = np.where(active, self.dots[rows, cell_y, cell_x], 0)
+        eaten = dot != 0
+        pellet = dot == 2
+
+        self.dots[rows[eaten], cell_y[eaten], cell_x[eaten]] = 0
+        self.dots_left -= eaten
+        self.score += np.where(pellet, PELLET_SCORE, np.where(eaten, DOT_SCORE, 0))
+        self.power_mode |= pellet
+        self.power_timer = np.where(pellet, self.tick, self.power_timer)
+        self.ghost_flee |= pellet[:, None]
+
+        expired = (
+            active & self.power_mode & (self.tick - self.power_timer > POWER_TICKS)
+        )
+        self.power_mode &= ~expired
+        self.ghost_flee &= ~expired[:, None]
+
+    def _move_ghosts(self, active):
+        level = self.level[:, None]
+        cell_x = self.ghost_x // CELL_SIZE
+        cell_y = self.ghost_y // CELL_SIZE
+        centered = (self.ghost_x % CELL_SIZE == HALF) & (
+            self.ghost_y % CELL_SIZE == HALF
+        )
+
+        valid = self.dir_masks[level, cell_y, cell_x]
+        opposite = (self.ghost_direction + 2) % 4
+        filtered = valid & ~(1 << opposite)
+        # Dead end: turning back (or nothing) is all that is left
+        filtered = np.where(filtered == 0, valid, filtered)
+
+        keep = (filtered >> self.ghost_direction & 1).astype(bool) & (
+            self.rng.random(filtered.shape) < 0.25
+        )
+        counts = MASK_COUNTS[filtered]
+        pick = (self.rng.random(filtered.shape) * counts).astype(np.int64)
+        chosen = MASK_CHOICES[filtered, pick]
+        turn = centered & (counts > 0) & ~keep
+        if self.ghost_ai == "chase":
+            target, steered = self._steer_ghosts(cell_x, cell_y, filtered)
+            has_target = target >= 0
+            turn = np.where(has_target, centered & (counts > 0), turn)
+            chosen = np.where(has_target, steered, chosen)
+        direction = np.where(turn, chosen, self.ghost_direction)
+
+        dx = DX[direction]
+        new_x = np.where(dx != 0, self.ghost_x + dx * GHOST_SPEED, cell_x * CELL_SIZE + HALF)
+        new_y = np.where(
+            dx != 0, cell_y * CELL_SIZE + HALF, self.ghost_y + DY[direction] * GHOST_SPEED
+        )
+        ok = self._is_open(level, new_x // CELL_SIZE, new_y // CELL_SIZE)
+        new_x = np.where(ok, new_x, cell_x * CELL_SIZE + HALF)
+        new_y = np.where(ok, new_y, cell_y * CELL_SIZE + HALF)
+
+        moving = active[:, None]
+        self.ghost_direction = np.where(moving, direction, self.ghost_direction)
+        self.ghost_x = np.where(moving, new_x, self.ghost_x)
+        self.ghost_y = np.where(moving, new_y, self.ghost_y)
+
+    def _ghost_targets(self, cell_x, cell_y):
+        # Cell index each ghost steers towards, -1 for wanderers; mirrors
+        # GameState.update_ghost_targets
+        level = self.level
+        width = self.width
+        pacman_cell = (self.y // CELL_SIZE) * width + self.x // CELL_SIZE
+        scatter = self.tick % (SCATTER_TICKS + CHASE_TICKS) < SCATTER_TICKS
+        ghost_cell = cell_y * width + cell_x
+
+        # Ambush point: up to AMBUSH_LOOKAHEAD open cells ahead of pacman
+        ambush = pacman_cell.copy()
+        going = np.ones(self.n, dtype=bool)
+        step = DY[self.direction] * width + DX[self.direction]
+        flat_masks = self.dir_masks.reshape(len(self.dir_masks), -1)
+        for _ in range(AMBUSH_LOOKAHEAD):
+            going &= (flat_masks[level, ambush] >> self.direction & 1).astype(bool)
+            ambush += step * going
+
+        corners = self.corners[level][:, np.arange(self.ghost_count) % self.corners.shape[1]]
+        ids = self.cell_ids[level]
+        rows = np.arange(self.n)[:, None]
+        close = (
+            self.dist[level[:, None], ids[rows, ghost_cell], ids[rows, pacman_cell[:, None]]]
+            <= SHY_DISTANCE
+        )
+
+        pacman_target = np.broadcast_to(pacman_cell[:, None], ghost_cell.shape)
+        chase = np.select(
+            [self.personality == "ambusher", (self.personality == "shy") & close],
+            [np.broadcast_to(ambush[:, None], ghost_cell.shape), corners],
+            pacman_target,
+        )
+        target = np.where(scatter[:, None], corners, chase)
+        target = np.where(self.personality == "wanderer", -1, target)
+        return np.where(self.ghost_flee, pacman_target, target)
+
+    def _steer_ghosts(self, cell_x, cell_y, options):
+        # Ghost.steer for every ghost: the next hop when it is not a U-turn,
+        # otherwise the allowed direction closest to (or, fleeing, furthest
+        # from) the target
+        target = self._ghost_targets(cell_x, cell_y)
+        level = self.level[:, None]
+        ids = self.cell_ids[self.level]
+        rows = np.arange(self.n)[:, None]
+        here = cell_y * self.width + cell_x
+        target_id = ids[rows, np.maximum(target, 0)]
+
+        hop = self.next_hop[level, ids[rows, here], target_id]
+        hop_allowed = (hop != NO_HOP) & (options >> np.minimum(hop, 3) & 1).astype(bool)
+
+        neighbour = here[..., None] + (DY * self.width + DX)
+        neighbour_id = ids[rows[..., None], np.clip(neighbour, 0, ids.shape[1] - 1)]
+        distance = self.dist[level[..., None], neighbour_id, target_id[..., None]]
+        allowed = (options[..., None] >> np.arange(4) & 1).astype(bool)
+        nearest = np.argmin(np.where(allowed, distance, np.iinfo(np.int64).max), axis=-1)
+        furthest = np.argmax(np.where(allowed, distance, -1), axis=-1)
+
+        steered = np.where(self.ghost_flee, furthest, np.where(hop_allowed, hop, nearest))
+        return target, steered
+
+    def _collide(self, active):
+        # Ghosts are checked in order and a death stops the scan, as in engine
+        caught = np.zeros(self.n, dtype=bool)
+        for index in range(self.ghost_count):
+            ddx = self.x - self.ghost_x[:, index]
+            ddy = self.y - self.ghost_y[:, index]
+            close = active & ~caught & (ddx * ddx + ddy * ddy < CATCH_DISTANCE)
+            if not close.any():
+                continue
+            flee = self.ghost_flee[:, index]
+            eaten = close & self.power_mode & flee
+            home = self.ghost_homes[self.level[eaten]]
+            self.ghost_x[eaten, index] = home[:, 0] * CELL_SIZE + HALF
+            self.ghost_y[eaten, index] = home[:, 1] * CELL_SIZE + HALF
+            self.ghost_flee[eaten, index] = False
+            self.score += eaten * GHOST_SCORE
+
+            killed = close & ~self.power_mode & ~flee
+            self.lives -= killed
+            self.game_over |= killed & (self.lives <= 0)
+            self._reset_pacman(killed & (self.lives > 0))
+            caught |= killed
+
+    def step(self, actions=None):
+        # actions: per-game direction (0-3), or -1 to keep the current one
+        active = ~self.done
+        if actions is not None:
+            actions = np.asarray(actions)
+            self.direction = np.where(active & (actions >= 0), actions, self.direction)
+        self.tick += active
+
+        self._move_pacman(active)
+        self._eat_dots(active)
+        self._move_ghosts(active)
+        self._collide(active)
+
+        cleared = active & (self.dots_left == 0)
+        if cleared.any():
+            last = self.level >= self.level_count - 1
+            self.victory |= cleared & last
+            advance = cleared & ~last
+            if advance.any():
+                self.level += advance
+                self._initialize_level(advance)
+
+        self.speed = np.where(self.power_mode, POWER_SPEED, NORMAL_SPEED)
@@ -0,0 +1,455 @@
+"""Frame-time and simulation benchmarks, run under SDL's dummy video driver.
+
+    python bench.py --json bench.json
+    python bench.py --save-baseline bench-baseline.json
+    python bench.py --baseline bench-baseline.json --threshold 0.25
+
+Each benchmark times repeated calls of one piece of the game (drawing, UI,
+confetti, ghost movement, simulation ticks, agent environment steps,
+batched observation frames, multiplayer room ticks, level loading, whole
+game_loop frames, also on a generated maze bigger than the window and at
+the reduced quality presets) and reports the median and the 90th/99th
+percentiles in milliseconds. Given a baseline, any benchmark whose median
+got more than threshold slower fails the run with exit status 1.
+
+The level select menu and the HUD must not allocate any surface once their
+first frame has been drawn; the run fails if they do (checks.py menu).
+
+Startup is measured in fresh interpreters: importing the headless engine,
+importing main, and main up to its first drawn frame. Those fail the run on
+their own when they exceed STARTUP_TARGETS_MS, or when importing a module
+initializes any pygame subsystem; checks.py runs that last check alone.
+"""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pygame
+
+import capture
+import checks
+import env
+import levelpack
+import main
+import mazegen
+import netplay
+import raster
+from batch import BatchGame
+from engine import CELL_SIZE, GameState, get_levels
+
+SEED = 1234
+GAME_LOOP_FRAMES = 300
+GENERATED_SIZE = 256  # side of the generated maze the scrolling game_loop runs on
+RASTER_GAMES = 256  # batch size the rasterizer frames are timed on
+NOISE_FLOOR_MS = 0.005  # medians this close are equal whatever the ratio
+STARTUP_RUNS = 5
+STARTUP_TARGETS_MS = {
+    "startup: import engine": 50,
+    "startup: import main": 400,
+    "startup: first frame": 1000,
+}
+
+
+class FrameClock:
+    # Stands in for main.clock: never sleeps, reports one simulation tick per
+    # frame and records when each frame started
+    def __init__(self):
+        self.stamps = []
+        self.stopped = False
+
+    def tick(self, fps=0):
+        if not self.stopped:
+            self.stamps.append(time.perf_counter())
+        return 1000 / main.engine.TICKS_PER_SECOND
+
+
+def measure(fn, repeat, setup=None, warmup=5):
+    samples = []
+    for index in range(warmup + repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if index >= warmup:
+            samples.append(elapsed * 1000)
+    return samples
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    return {
+        "median_ms": round(float(np.median(ordered)), 4),
+        "p90_ms": round(percentile(90), 4),
+        "p99_ms": round(percentile(99), 4),
+        "mean_ms": round(sum(ordered) / len(ordered), 4),
+        "min_ms": round(ordered[0], 4),
+        "samples": len(ordered),
+    }
+
+
+def bench_drawing(repeat):
+    main.init_display()
+    results = {}
+    for level in range(len(get_levels())):
+        game = GameState(level, seed=SEED, pacman_cls=main.CyberPacman, ghost_cls=main.Ghost)
+        dots = list(game.iter_dots())
+        results[f"draw_maze[level {level}]"] = measure(
+            lambda: main.draw_maze(game.maze), repeat
+        )
+        results[f"draw_dots[level {level}]"] = measure(lambda: main.draw_dots(dots), repeat)
+
+    game = GameState(0, seed=SEED, pacman_cls=main.CyberPacman, ghost_cls=main.Ghost)
+    pacman, ghost = game.pacman, game.ghosts[0]
+    clock = iter(range(0, 10**9, 33))
+    results["CyberPacman.draw"] = measure(
+        lambda: pacman.draw(pacman.x, pacman.y, next(clock)), repeat * 10
+    )
+    results["Ghost.draw"] = measure(lambda: ghost.draw(ghost.x, ghost.y, next(clock)), repeat * 10)
+    results["CyberUI.draw_hud"] = measure(lambda: main.CyberUI.draw_hud(12340, 3, 1), repeat)
+    results["CyberUI.draw_glitch_text"] = measure(
+        lambda: main.CyberUI.draw_glitch_text("CYBERPUNK-MAN", 72, (100, 100)), repeat
+    )
+    return results
+
+
+def bench_confetti(repeat, particles=2000):
+    confetti = main.ConfettiManager(seed=SEED)
+
+    def refill():
+        # Keep the particle count steady as bursts age out
+        while confetti.count < particles:
+            confetti.add_confetti(main.WIDTH // 2, main.HEIGHT // 2, 100)
+
+    return {
+        f"ConfettiManager.update[{particles}]": measure(confetti.update, repeat, refill),
+        f"ConfettiManager.draw[{particles}]": measure(confetti.draw, repeat, refill),
+    }
+
+
+def bench_menu(repeat):
+    return {"level select frame": measure(checks.menu_frames(), repeat)}
+
+
+def bench_simulation(repeat):
+    results = {}
+    for level in range(len(get_levels())):
+        game = GameState(level, seed=SEED)
+
+        def move_ghosts():
+            for ghost in game.ghosts:
+                ghost.move(game.maze)
+
+        results[f"Ghost.move[level {level}]"] = measure(move_ghosts, repeat * 10)
+
+        # Ticks of a fresh game every time it ends, always heading right
+        state = {"game": GameState(level, seed=SEED)}
+
+        def fresh():
+            if state["game"].done:
+                state["game"] = GameState(level, seed=SEED)
+
+        results[f"GameState.step[level {level}]"] = measure(
+            lambda: state["game"].step(None), repeat * 10, fresh
+        )
+    return results
+
+
+def bench_env(repeat, n=16):
+    # Agent steps: one environment, and a vector of n stepped per call
+    results = {}
+    actions = np.random.default_rng(SEED).integers(0, env.ACTIONS, (repeat * 10 + 5, n))
+    for observation, scale in (("grid", 1.0), ("pixels", 0.25)):
+        name = observation if scale == 1 else f"{observation} {scale}"
+        single = env.PacmanEnv(observation, seed=SEED, render_scale=scale)
+        moves = iter(actions[:, 0].tolist())
+
+        def step():
+            if single.step(next(moves))[2]:
+                single.reset()
+
+        results[f"PacmanEnv.step[{name}]"] = measure(step, repeat * 10)
+        vector = env.VectorPacmanEnv(n, observation, seed=SEED, render_scale=scale)
+        rows = iter(actions)
+        results[f"VectorPacmanEnv.step[{name} x{n}]"] = measure(
+            lambda: vector.step(next(rows)), repeat
+        )
+    return results
+
+
+def bench_raster(repeat, n=RASTER_GAMES, tile=8):
+    # Observation frames of a whole BatchGame per call, from mid-game states
+    game = BatchGame(n, seed=SEED)
+    rng = np.random.default_rng(SEED)
+    for _ in range(100):
+        game.step(rng.integers(0, 4, n))
+    results = {}
+    for mode in raster.MODES:
+        rasterizer = raster.Rasterizer(tile, mode)
+        height, width = game.dots.shape[1:]
+        out = np.empty(rasterizer.frame_shape(n, width, height), dtype=np.uint8)
+        results[f"Rasterizer.render_batch[{mode} x{n}]"] = measure(
+            lambda: rasterizer.render_batch(game, out), max(repeat // 10, 5)
+        )
+    return results
+
+
+def bench_netplay(repeat, players=4):
+    # What a server room costs per tick without the sockets: stepping the
+    # game and encoding its snapshot, a fresh game every time one ends; then
+    # a client applying those snapshots
+    results = {}
+    actions = np.random.default_rng(SEED).integers(0, 4, (repeat * 10 + 5, players)).tolist()
+    for mode in netplay.MODES:
+        moves = iter(actions)
+        games = []  # the snapshots of every game played
+        state = {}
+
+        def fresh():
+            if not games or state["game"].done:
+                state["game"] = netplay.MultiGameState(players, mode, seed=SEED)
+                state["encoder"] = netplay.SnapshotEncoder(state["game"])
+                games.append([])
+
+        def room_tick():
+            games[-1].append(state["encoder"].encode(state["game"].step(next(moves))))
+
+        results[f"netplay room tick[{mode} x{players}]"] = measure(room_tick, repeat * 10, fresh)
+
+        snapshots = iter(
+            [(index == 0, body) for bodies in games for index, body in enumerate(bodies)]
+        )
+
+        def next_snapshot():
+            first, state["body"] = next(snapshots)
+            if first:
+                state["mirror"] = netplay.MultiGameState(players, mode, seed=SEED)
+
+        results[f"netplay apply_snapshot[{mode} x{players}]"] = measure(
+            lambda: netplay.apply_snapshot(state["mirror"], state["body"]),
+            repeat * 10,
+            next_snapshot,
+        )
+    return results
+
+
+def bench_levels(repeat):
+    # Opening the memory-mapped pack, and what the first visit to a level
+    # costs: decoding it and building its NavGraph
+    results = {"levelpack.load": measure(levelpack.load, repeat)}
+    pack = levelpack.load()
+    for level in range(len(pack)):
+        results[f"level decode[level {level}]"] = measure(
+            lambda: pack.decode(pack.offsets[level]).maze().nav, repeat
+        )
+    return results
+
+
+def game_loop_frames(level, frames, **kwargs):
+    # Frame times of game_loop(level) while the game is played. Once pacman
+    # wins or loses the clock stops taking stamps and the loop is told to
+    # quit, so the end screen is never timed
+    clock = FrameClock()
+    real_clock, real_run_tick = main.clock, main.run_tick
+
+    def run_tick(game, *args):
+        before = real_run_tick(game, *args)
+        if game.done and not clock.stopped:
+            pygame.event.post(pygame.event.Event(pygame.QUIT))
+            clock.stopped = True
+        return before
+
+    main.clock, main.run_tick = clock, run_tick
+    try:
+        main.game_loop(level, seed=SEED, max_frames=frames, **kwargs)
+    finally:
+        main.clock, main.run_tick = real_clock, real_run_tick
+    stamps = clock.stamps[1:]
+    return [(end - start) * 1000 for start, end in zip(stamps, stamps[1:])]
+
+
+def bench_game_loop(frames=GAME_LOOP_FRAMES):
+    # Whole frames of the real loop: input, simulation, board, sprites, HUD
+    results = {}
+    try:
+        for level in range(len(get_levels())):
+            results[f"game_loop[level {level}]"] = game_loop_frames(level, frames)
+        # A generated maze far bigger than the window: scrolling and culling
+        generated = [mazegen.generate(GENERATED_SIZE, GENERATED_SIZE, seed=SEED)]
+        results[f"game_loop[generated {GENERATED_SIZE}x{GENERATED_SIZE}]"] = game_loop_frames(
+            0, frames, level_list=generated
+        )
+        # The reduced quality presets, drawn at part resolution and stretched
+        for preset in ("medium", "low"):
+            main.set_quality(preset)
+            results[f"game_loop[level 0, {preset}]"] = game_loop_frames(0, frames)
+        main.set_quality()
+        # Recording a PNG sequence: only grab()'s copy should show up here
+        with tempfile.TemporaryDirectory() as directory:
+            recording = capture.FrameCapture(directory, main.init_display())
+            results["game_loop[level 0, capturing png]"] = game_loop_frames(
+                0, frames, capture=recording
+            )
+            recording.close()
+    finally:
+        main.set_quality()
+    return results
+
+
+def bench_startup(runs=STARTUP_RUNS):
+    results = {}
+    problems = []
+    for name, module, frame in (
+        ("startup: import engine", "engine", False),
+        ("startup: import main", "main", False),
+        ("startup: first frame", "main", True),
+    ):
+        samples = []
+        for _ in range(runs):
+            report = checks.run_startup(module, frame)
+            samples.append(report["ms"])
+            if report["subsystems"]:
+                problems.append(f"import {module} initialized {', '.join(report['subsystems'])}")
+        results[name] = samples
+    return results, sorted(set(problems))
+
+
+def check_startup(results, problems):
+    # Messages for every startup target missed, plus any import side effects
+    failures = list(problems)
+    for name, target in STARTUP_TARGETS_MS.items():
+        if name in results and results[name]["median_ms"] > target:
+            failures.append(f"{name}: {results[name]['median_ms']:.1f} ms > {target} ms")
+    return failures
+
+
+def run_benchmarks(repeat=200, only=None):
+    groups = [
+        lambda: bench_drawing(repeat),
+        lambda: bench_confetti(repeat),
+        lambda: bench_menu(repeat),
+        lambda: bench_simulation(repeat),
+        lambda: bench_env(repeat),
+        lambda: bench_raster(repeat),
+        lambda: bench_netplay(repeat),
+        lambda: bench_levels(repeat),
+        bench_game_loop,
+    ]
+    results = {}
+    for group in groups:
+        for name, samples in group().items():
+            if selected(name, only):
+                results[name] = summarize(samples)
+    return results
+
+
+def selected(name, only):
+    return only is None or any(pattern in name for pattern in only)
+
+
+def compare(results, baseline, threshold):
+    # (name, baseline median, current median, ratio, regressed) for shared names
+    rows = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        before, after = previous["median_ms"], current["median_ms"]
+        ratio = after / before if before else float("inf")
+        regressed = ratio > 1 + threshold and after - before > NOISE_FLOOR_MS
+        rows.append((name, before, after, ratio, regressed))
+    return rows
+
+
+def format_results(results):
+    lines = [f"{'benchmark':<36} {'median':>10} {'p90':>10} {'p99':>10}  (ms)"]
+    for name, summary in results.items():
+        lines.append(
+            f"{name:<36} {summary['median_ms']:>10.4f} "
+            f"{summary['p90_ms']:>10.4f} {summary['p99_ms']:>10.4f}"
+        )
+    return "\n".join(lines)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="CyberPunk-Man benchmarks")
+    parser.add_argument("--repeat", type=int, default=200, help="samples per benchmark")
+    parser.add_argument("--only", nargs="+", help="run benchmarks whose name contains these")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results saved earlier")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="fail when a median is this much slower than the baseline (0.25 = 25%%)",
+    )
+    parser.add_argument("--save-baseline", metavar="PATH", help="store the results as a baseline")
+    args = parser.parse_args(argv)
+
+    results = {}
+    problems = []
+    if any(selected(name, args.only) for name in STARTUP_TARGETS_MS):
+        samples, problems = bench_startup()
+        results.update(
+            (name, summarize(times)) for name, times in samples.items() if selected(name, args.only)
+        )
+    results.update(run_benchmarks(args.repeat, args.only))
+    print(format_results(results))
+    failures = check_startup(results, problems)
+    for failure in failures:
+        print(f"STARTUP: {failure}")
+    if selected("level select frame", args.only):
+        allocations = checks.check_menu_allocations() + checks.check_hud_allocations()
+        for failure in allocations:
+            print(f"ALLOCATIONS: {failure}")
+        failures += allocations
+    if selected("netplay", args.only):
+        prediction = checks.check_reconcile_power()
+        for failure in prediction:
+            print(f"NETPLAY: {failure}")
+        failures += prediction
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "video_driver": os.environ["SDL_VIDEODRIVER"],
+        },
+        "results": results,
+    }
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if not args.baseline:
+        return 1 if failures else 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    failed = False
+    print(f"\nagainst {args.baseline} (threshold +{args.threshold:.0%}):")
+    for name, before, after, ratio, regressed in compare(results, baseline, args.threshold):
+        failed |= regressed
+        flag = "REGRESSED" if regressed else ""
+        print(f"{name:<36} {before:>10.4f} -> {after:>10.4f}  x{ratio:.2f} {flag}")
+    return 1 if failed or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,181 @@
+"""Record the frames the game loop presents without stalling it.
+
+    python main.py --capture frames/        # PNG sequence: frames/frame-000000.png, ...
+    python main.py --capture session.raw    # raw video: every frame's pixels back to back
+
+FrameCapture keeps a pool of preallocated frame buffers. After each present,
+grab() copies the window's pixels into a free buffer (a plain memory copy),
+at most fps times a second, and puts it on a bounded queue. A writer thread
+encodes and writes the queued frames and hands the buffers back. When the
+writer falls behind and every buffer is still queued, grab() drops the frame
+instead of waiting, so recording never holds up the loop. PNG frames are
+numbered by capture slot, so the gaps in the sequence are the dropped ones.
+
+PNGs are encoded here with zlib rather than pygame.image.save, which holds
+the GIL for the whole encode. zlib and the NumPy pixel shuffle release it,
+so the game keeps running while a frame compresses. Raw streams hold the
+window's native 32-bit pixels (pixel_format(), e.g. "bgr0") with nothing
+in between; ffmpeg_command() turns one into a video.
+"""
+
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+
+CAPTURE_FPS = 30
+CAPTURE_BUFFERS = 8  # frames that can wait for the writer before grabs drop
+PNG_LEVEL = 1  # zlib level; the writer has about a frame's time per frame
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# IHDR: width, height, bit depth, color type, compression, filter, interlace
+PNG_HEADER = struct.Struct(">IIBBBBB")
+RAW_SUFFIX = ".raw"
+
+
+def pixel_format(surface):
+    # ffmpeg name of a 32-bit surface's byte order, such as "bgr0"
+    if surface.get_bytesize() != 4:
+        raise ValueError("frame capture needs a 32-bit window surface")
+    names = dict(zip(surface.get_shifts()[:3], "rgb"))
+    order = [names.get(8 * byte, "0") for byte in range(4)]
+    if sys.byteorder == "big":
+        order.reverse()
+    return "".join(order)
+
+
+def png_chunk(kind, data):
+    crc = zlib.crc32(data, zlib.crc32(kind))
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+
+class FrameCapture:
+    """Copies presented frames into pooled buffers for a writer thread.
+
+    path ending in RAW_SUFFIX is a raw stream, anything else a directory
+    of PNGs. captured, dropped and written count frames; max_depth is the
+    most frames ever queued for the writer. Call close() to finish writing.
+    """
+
+    def __init__(self, path, surface, fps=CAPTURE_FPS, buffers=CAPTURE_BUFFERS):
+        self.pixel_format = pixel_format(surface)
+        self.width, self.height = surface.get_size()
+        self.path = path
+        self.fps = fps
+        self.buffers = buffers
+        self.raw = path.endswith(RAW_SUFFIX)
+        if self.raw:
+            self.file = open(path, "wb")
+        else:
+            os.makedirs(path, exist_ok=True)
+            # PNG scanlines: a filter byte (0, none) then the RGB pixels
+            self.rows = np.zeros((self.height, 1 + self.width * 3), dtype=np.uint8)
+            self.pixels = self.rows[:, 1:].reshape(self.height, self.width, 3)
+            self.channels = [self.pixel_format.index(name) for name in "rgb"]
+
+        self.free = queue.SimpleQueue()
+        for _ in range(buffers):
+            self.free.put(np.empty((self.height, self.width * 4), dtype=np.uint8))
+        self.queue = queue.Queue(buffers + 1)  # every buffer, plus close()'s end marker
+        self.interval = 1 / fps
+        self.next_due = None
+        self.slots = 0  # frames due so far, captured or dropped
+        self.captured = 0
+        self.dropped = 0
+        self.written = 0
+        self.lost = 0  # frames the writer could not write after an error
+        self.max_depth = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.write_frames, name="frame capture", daemon=True)
+        self.thread.start()
+
+    def grab(self, surface):
+        # Called after every present; copies the frame when one is due
+        now = time.perf_counter()
+        if self.next_due is not None and now < self.next_due:
+            return False
+        # Due times keep to the fps grid unless the loop stalled past a slot
+        if self.next_due is None or now - self.next_due > self.interval:
+            self.next_due = now
+        self.next_due += self.interval
+        number = self.slots
+        self.slots += 1
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        pitch = surface.get_pitch()
+        view = surface.get_view("0")
+        pixels = np.frombuffer(view, dtype=np.uint8).reshape(self.height, pitch)
+        np.copyto(buffer, pixels[:, : self.width * 4])
+        del pixels, view  # unlocks the surface
+        self.queue.put_nowait((number, buffer))
+        self.captured += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def write_frames(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            number, buffer = item
+            if self.error is None:
+                try:
+                    self.write(number, buffer)
+                    self.written += 1
+                except OSError as error:
+                    self.error = error
+                    self.lost += 1
+            else:
+                self.lost += 1
+            self.free.put(buffer)
+
+    def write(self, number, buffer):
+        if self.raw:
+            self.file.write(buffer)
+            return
+        frame = buffer.reshape(self.height, self.width, 4)
+        for channel, byte in enumerate(self.channels):
+            np.copyto(self.pixels[..., channel], frame[..., byte])
+        header = PNG_HEADER.pack(self.width, self.height, 8, 2, 0, 0, 0)
+        path = os.path.join(self.path, f"frame-{number:06d}.png")
+        with open(path, "wb") as f:
+            f.write(PNG_SIGNATURE)
+            f.write(png_chunk(b"IHDR", header))
+            f.write(png_chunk(b"IDAT", zlib.compress(self.rows, PNG_LEVEL)))
+            f.write(png_chunk(b"IEND", b""))
+
+    def status(self):
+        return (
+            f"REC {self.captured} frames, {self.dropped} dropped, "
+            f"queue {self.queue.qsize()}/{self.buffers}"
+        )
+
+    def ffmpeg_command(self, output="capture.mp4"):
+        return (
+            f"ffmpeg -f rawvideo -pixel_format {self.pixel_format} "
+            f"-video_size {self.width}x{self.height} -framerate {self.fps} "
+            f"-i {self.path} {output}"
+        )
+
+    def close(self):
+        # Writes out the queued frames and returns a summary of the session
+        self.queue.put(None)
+        self.thread.join()
+        if self.raw:
+            self.file.close()
+        lines = [
+            f"{self.written} frames written to {self.path}, {self.dropped} dropped "
+            f"with the writer behind, at most {self.max_depth}/{self.buffers} queued"
+        ]
+        if self.error is not None:
+            lines.append(f"writing stopped after {self.error}; {self.lost} frames lost")
+        if self.raw and self.written:
+            lines.append(f"to encode: {self.ffmpeg_command()}")
+        return "\n".join(lines)
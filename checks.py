@@ -0,0 +1,205 @@
+"""Quick checks of what the game guarantees beyond its frame times.
+
+    python checks.py                # every check, in a few seconds
+    python checks.py imports        # only the checks named
+
+imports  importing engine or main initializes no pygame subsystem and
+         loads no level pack
+menu     the level select menu and the HUD allocate no surface per frame
+         once their first frame is drawn
+netplay  a client that ate a power pellet with inputs still pending keeps
+         its power and fleeing ghosts through reconcile()
+
+Each check returns a list of failure messages. The run prints them and exits
+with status 1 if there are any. bench.py runs the same checks next to its
+timings.
+"""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import subprocess
+import sys
+
+import pygame
+
+import main
+import netplay
+from engine import CELL_SIZE, POWER_TICKS
+from maze import iter_cells
+
+ALLOCATION_FRAMES = 120  # frames checked for surface allocations after the first
+
+# Run in a fresh interpreter; prints the milliseconds taken, which pygame
+# subsystems were initialized right after the imports and whether the level
+# pack was loaded by then
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+pygame = sys.modules.get("pygame")
+subsystems = []
+if pygame is not None:
+    if pygame.get_init():
+        subsystems.append("pygame")
+    for name in ("display", "font", "mixer", "joystick"):
+        if getattr(pygame, name).get_init():
+            subsystems.append(name)
+engine = sys.modules.get("engine")
+levels = engine is not None and engine.get_levels.cache_info().currsize > 0
+if {frame}:
+    main.game_loop(0, seed=1, max_frames=1)
+ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"ms": ms, "subsystems": subsystems, "levels": levels}}))
+"""
+
+
+def run_startup(module, frame=False):
+    # STARTUP_SCRIPT's report for importing module (and, with frame, drawing
+    # main's first frame) in a fresh interpreter
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT.format(module=module, frame=frame)],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def check_imports():
+    failures = []
+    for module in ("engine", "main"):
+        report = run_startup(module)
+        if report["subsystems"]:
+            failures.append(f"import {module} initialized {', '.join(report['subsystems'])}")
+        if report["levels"]:
+            failures.append(f"import {module} loaded the level pack")
+    return failures
+
+
+def menu_frames():
+    # One level select frame per call, 17 ms apart, with the first button
+    # hovered so its hologram animates
+    main.init_display()
+    buttons = main.CyberUI.level_select_buttons()
+    hover = buttons[0][0].center
+    clock = iter(range(0, 10**9, 17))
+    return lambda: main.CyberUI.draw_level_select(buttons, 0, next(clock), hover)
+
+
+def count_surfaces(fn, calls):
+    # pygame.Surface objects constructed during calls of fn
+    made = [0]
+    real_surface = pygame.Surface
+
+    class CountedSurface(real_surface):
+        def __init__(self, *args, **kwargs):
+            made[0] += 1
+            super().__init__(*args, **kwargs)
+
+    pygame.Surface = CountedSurface
+    try:
+        for _ in range(calls):
+            fn()
+    finally:
+        pygame.Surface = real_surface
+    return made[0]
+
+
+def check_allocations(name, frame, frames=ALLOCATION_FRAMES):
+    # After its first frame has filled the caches, frame should allocate no
+    # surfaces at all
+    frame()
+    made = count_surfaces(frame, frames)
+    if made:
+        return [f"{name}: {made} surfaces allocated in {frames} frames"]
+    return []
+
+
+def check_menu_allocations():
+    return check_allocations("level select menu", menu_frames())
+
+
+def check_hud_allocations():
+    main.init_display()
+    return check_allocations("HUD", lambda: main.CyberUI.draw_hud(1230, 3, 0))
+
+
+class NullWriter:
+    # Stands in for a client's stream writer: inputs go nowhere
+    def write(self, data):
+        pass
+
+
+def check_reconcile_power(pending=3, ticks=30):
+    # The server's player eats a pellet while the client has inputs in
+    # flight; after every snapshot the client's prediction should keep power
+    # mode and the ghosts fleeing, and its copy of the server state should
+    # match the server's
+    game = netplay.MultiGameState(1, seed=1)
+    encoder = netplay.SnapshotEncoder(game)
+    start = netplay.START.pack(1, 0, 0, 0, 1, 0, 30)
+    client = netplay.Client(None, NullWriter(), start)
+    # Late enough in the game that a power timer left at 0 has run out
+    game.tick = 4 * POWER_TICKS
+    player = game.players[0]
+    x, y = next(iter_cells(game.pellets, game.maze.width))
+    player.x, player.y = (x + 0.5) * CELL_SIZE, (y + 0.5) * CELL_SIZE
+    for _ in range(pending):
+        client.tick(None)
+
+    failures = []
+    for tick in range(ticks):
+        events = game.step([None])
+        client.tick(None)
+        ack = netplay.ACK.pack(client.sequence - pending)
+        client.reconcile(ack + encoder.encode(events))
+        if not game.players[0].power_mode:
+            failures.append(f"the server player never got power from the pellet at {x}, {y}")
+            break
+        predicted = client.game
+        if not predicted.players[0].power_mode:
+            failures.append(f"tick {tick}: the prediction lost power mode after reconcile()")
+        elif not all(ghost.flee for ghost in predicted.ghosts):
+            failures.append(f"tick {tick}: the predicted ghosts stopped fleeing")
+        if netplay.state_checksum(client.state) != netplay.state_checksum(game):
+            failures.append(f"tick {tick}: the client's server state differs from the server's")
+        if failures:
+            break
+    return failures
+
+
+CHECKS = {
+    "imports": check_imports,
+    "menu": lambda: check_menu_allocations() + check_hud_allocations(),
+    "netplay": check_reconcile_power,
+}
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="CyberPunk-Man checks")
+    parser.add_argument("checks", nargs="*", help=f"run only these of {', '.join(CHECKS)}")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks {', '.join(unknown)}, expected some of {', '.join(CHECKS)}")
+
+    failed = False
+    for name in args.checks or CHECKS:
+        failures = CHECKS[name]()
+        for failure in failures:
+            print(f"FAIL {name}: {failure}")
+        if not failures:
+            print(f"ok   {name}")
+        failed = failed or bool(failures)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,486 @@
+"""Headless game rules for CyberPunk-Man.
+
+Nothing in this module touches pygame: the rendered game in main.py and any
+headless consumer (tests, balancing scripts, agents) drive the same
+GameState.step() and only differ in how they read input and draw the result.
+"""
+
+import copy
+import functools
+import random
+
+import levelpack
+from maze import DIRECTIONS, cell_bits, iter_cells
+
+# Simulation settings
+CELL_SIZE = 64
+TICKS_PER_SECOND = 30
+POWER_TICKS = 7 * TICKS_PER_SECOND  # 7 seconds of power mode
+MAX_TICKS = 5 * 60 * TICKS_PER_SECOND  # headless games (tournaments, agents, netplay) stop here
+GHOST_SPEED = CELL_SIZE // 16  # pixels per tick
+
+
+# Ghost body colors, handed out in ghost start order (spawn points come from
+# each level, see levelpack)
+GHOST_COLORS = [(255, 0, 0), (0, 255, 0), (255, 192, 203), (255, 0, 255)]
+
+DOT_SCORE = 10
+PELLET_SCORE = 100
+GHOST_SCORE = 200
+
+# Ghost AI. "random" ghosts wander; with "chase" each ghost steers with the
+# maze's DistanceTable according to its personality (in ghost start order),
+# alternating scatter and chase phases, and runs from pacman while fleeing.
+GHOST_AI_MODES = ("random", "chase")
+GHOST_PERSONALITIES = ["chaser", "wanderer", "ambusher", "shy"]
+SCATTER_TICKS = 7 * TICKS_PER_SECOND
+CHASE_TICKS = 20 * TICKS_PER_SECOND
+AMBUSH_LOOKAHEAD = 4  # cells ahead of pacman the ambusher aims for
+SHY_DISTANCE = 8  # the shy ghost backs off to its corner when this close
+
+# Direction bit in a NavGraph.dir_mask for each (sign dx, sign dy) of a move
+MOVE_BITS = {
+    (dx, dy): 1 << direction for direction, (dx, dy) in enumerate(DIRECTIONS)
+}
+MOVE_BITS[0, 0] = 0
+
+@functools.lru_cache(maxsize=None)
+def get_levels():
+    # The default level pack. Loaded on first use rather than on import, as
+    # the first load reads the pack and may compile its memory-mapped cache
+    return levelpack.load()
+
+
+@functools.lru_cache(maxsize=None)
+def compile_level(level):
+    # Maze plus the starting dot and pellet bitmasks, built once per level
+    return level.maze(), level.dots, level.pellets
+
+
+class CyberPacman:
+    def __init__(self, start=(0, 0)):
+        self.start = start  # cell reset_state() puts pacman back on
+        self.reset_game()
+
+    def reset_state(self):
+        self.x = self.start[0] * CELL_SIZE + CELL_SIZE // 2
+        self.y = self.start[1] * CELL_SIZE + CELL_SIZE // 2
+        self.speed = CELL_SIZE // 4
+        self.direction = 0  # 0=Right, 1=Down, 2=Left, 3=Up
+        self.radius = CELL_SIZE // 2 - 4
+        self.power_mode = False
+        self.power_timer = 0
+
+    def reset_game(self):
+        self.reset_state()
+        self.lives = 3
+        self.score = 0
+
+    def update_speed(self):
+        # Applied once per tick after everything moved, like the original draw()
+        if self.power_mode:
+            self.speed = 3 * CELL_SIZE / 16
+        else:
+            self.speed = CELL_SIZE / 8
+
+    def move(self, dx, dy, current_maze):
+        new_x = self.x + dx
+        new_y = self.y + dy
+
+        current_cell_x = int(self.x // CELL_SIZE)
+        current_cell_y = int(self.y // CELL_SIZE)
+
+        target_cell_x = current_cell_x
+        target_cell_y = current_cell_y
+
+        if dx > 0:
+            target_cell_x = current_cell_x + 1
+        elif dx < 0:
+            target_cell_x = current_cell_x - 1
+        elif dy > 0:
+            target_cell_y = current_cell_y + 1
+        elif dy < 0:
+            target_cell_y = current_cell_y - 1
+
+        nav = current_maze.nav
+        index = nav.index(current_cell_x, current_cell_y)
+        current_cell_valid = current_maze.is_open(current_cell_x, current_cell_y)
+        target_cell_valid = current_cell_valid and bool(
+            nav.dir_mask[index] & MOVE_BITS[(dx > 0) - (dx < 0), (dy > 0) - (dy < 0)]
+        )
+
+        if dx != 0:
+            new_y = current_cell_y * CELL_SIZE + CELL_SIZE // 2
+            valid = current_cell_valid and target_cell_valid
+        else:
+            new_x = current_cell_x * CELL_SIZE + CELL_SIZE // 2
+            valid = current_cell_valid and target_cell_valid
+
+        if valid:
+            self.x = new_x
+            self.y = new_y
+        else:
+            cell_left = current_cell_x * CELL_SIZE
+            cell_right = (current_cell_x + 1) * CELL_SIZE
+            cell_top = current_cell_y * CELL_SIZE
+            cell_bottom = (current_cell_y + 1) * CELL_SIZE
+
+            if dx > 0:
+                self.x = min(new_x, cell_right - self.radius - 1)
+            elif dx < 0:
+                self.x = max(new_x, cell_left + self.radius)
+            elif dy > 0:
+                self.y = min(new_y, cell_bottom - self.radius - 1)
+            elif dy < 0:
+                self.y = max(new_y, cell_top + self.radius)
+
+
+class Ghost:
+    def __init__(self, color, x, y, rng=random):
+        self.rng = rng
+        self.reset(color, x, y)
+
+    def reset(self, color, x, y):
+        self.x = x * CELL_SIZE + CELL_SIZE // 2
+        self.y = y * CELL_SIZE + CELL_SIZE // 2
+        self.color = color
+        self.direction = self.rng.choice([0, 1, 2, 3])
+        self.desired_direction = self.direction
+        self.speed = GHOST_SPEED
+        self.flee = False
+        self.target = None  # cell index to steer towards (away from when fleeing)
+        self.base_color = color
+        self.radius = CELL_SIZE // 2 - 4
+
+    def get_valid_directions(self, current_maze):
+        nav = current_maze.nav
+        index = nav.index(int(self.x // CELL_SIZE), int(self.y // CELL_SIZE))
+        return list(nav.directions[index])
+
+    def steer(self, current_maze, index, options):
+        table = current_maze.distances
+        if not self.flee:
+            hop = table.hop(index, self.target)
+            if hop in options:
+                return hop
+        offsets = current_maze.nav.offsets
+        pick = max if self.flee else min
+        return pick(options, key=lambda d: table.distance(index + offsets[d], self.target))
+
+    def is_centered(self):
+        return (self.x % CELL_SIZE) == CELL_SIZE // 2 and (
+            self.y % CELL_SIZE
+        ) == CELL_SIZE // 2
+
+    def move(self, current_maze, steps=1):
+        # steps > 1 covers that many ticks of movement at once; from a cell
+        # centre, CELL_SIZE // speed steps land exactly on the next centre
+        nav = current_maze.nav
+        current_cell_x = int(self.x // CELL_SIZE)
+        current_cell_y = int(self.y // CELL_SIZE)
+        index = nav.index(current_cell_x, current_cell_y)
+
+        if self.is_centered():
+            # Open directions minus the U-turn, unless that is the only way out
+            filtered_directions = nav.ghost_options[index][self.direction]
+
+            # Choose new direction only if options exist
+            if filtered_directions and self.target is not None:
+                self.direction = self.steer(current_maze, index, filtered_directions)
+            elif filtered_directions:
+                # 25% chance to keep current direction if possible
+                if self.direction in filtered_directions and self.rng.random() < 0.25:
+                    new_direction = self.direction
+                else:
+                    new_direction = self.rng.choice(filtered_directions)
+
+                self.direction = new_direction
+
+        dx_movement, dy_movement = DIRECTIONS[self.direction]
+        new_x = self.x + dx_movement * self.speed * steps
+        new_y = self.y + dy_movement * self.speed * steps
+
+        # Axis locking
+        if dx_movement != 0:
+            new_y = current_cell_y * CELL_SIZE + CELL_SIZE // 2
+        else:
+            new_x = current_cell_x * CELL_SIZE + CELL_SIZE // 2
+
+        # Final position validation: staying in the cell is always fine,
+        # crossing into the next one needs an opening that way
+        target_cell_x = int(new_x // CELL_SIZE)
+        target_cell_y = int(new_y // CELL_SIZE)
+        if (
+            target_cell_x == current_cell_x and target_cell_y == current_cell_y
+        ) or nav.dir_mask[index] >> self.direction & 1:
+            self.x = new_x
+            self.y = new_y
+        else:
+            self.x = current_cell_x * CELL_SIZE + CELL_SIZE // 2
+            self.y = current_cell_y * CELL_SIZE + CELL_SIZE // 2
+
+
+class GameState:
+    """One running game: pacman, ghosts, dots, power mode and level progression.
+
+    step(action) advances the game by one tick. action is a direction
+    (0=Right, 1=Down, 2=Left, 3=Up) or None to keep going the same way. It
+    returns the list of events that happened during the tick so a client can
+    react to them (confetti, sounds, redraws):
+
+        ("dot", x, y)            a dot was eaten at cell (x, y)
+        ("pellet", x, y)         a power pellet was eaten at cell (x, y)
+        ("power_end",)           power mode ran out
+        ("ghost_eaten", x, y)    a fleeing ghost was eaten at pixel (x, y)
+        ("death", ghost_index)   pacman was caught
+        ("level", level)         the next level was loaded
+        ("game_over",)
+        ("victory",)
+
+    Every random draw comes from self.rng, seeded with seed, so a seed plus
+    the actions passed to step() reproduce a game exactly (see replay.py).
+
+    pacman_cls and ghost_cls let the rendered client plug in subclasses that
+    know how to draw themselves. level_list is the pack (or any list of
+    levelpack.Level, such as mazegen ones) the levels come from, None for
+    get_levels().
+
+    With active_radius set, only ghosts within that many cells of pacman
+    (or between two cells) move every tick and can catch pacman. The others
+    only get a turn every CELL_SIZE // GHOST_SPEED ticks, when they jump a
+    whole cell taking the same turns, so a tick costs the nearby ghosts plus
+    a fraction of the rest however big the maze. None moves every ghost
+    every tick.
+    Subclasses can replace the ghosts wholesale by overriding spawn_ghosts,
+    set_fleeing, move_ghosts and collide_ghosts (see swarm.SwarmGameState).
+    """
+
+    def __init__(
+        self,
+        level=0,
+        seed=None,
+        pacman_cls=CyberPacman,
+        ghost_cls=Ghost,
+        ghost_ai="random",
+        level_list=None,
+        active_radius=None,
+    ):
+        if ghost_ai not in GHOST_AI_MODES:
+            raise ValueError(f"unknown ghost AI {ghost_ai!r}")
+        self.ghost_ai = ghost_ai
+        self.level_list = get_levels() if level_list is None else level_list
+        self.active_radius = active_radius
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.ghost_cls = ghost_cls
+        self.pacman = pacman_cls()
+        self.reset(level)
+
+    def reset(self, level=0, seed=None):
+        # A new seed restarts the random stream, so the game can be replayed
+        if seed is not None:
+            self.seed = seed
+            self.rng.seed(seed)
+        self.level = level
+        self.tick = 0
+        self.game_over = False
+        self.victory = False
+        self.initialize_level()
+        self.pacman.reset_game()
+
+    def initialize_level(self):
+        # Dots and pellets are bitmasks over the maze cells (pellets are a
+        # subset of dots), so the whole grid state is two ints and a counter
+        self.layout = self.level_list[self.level]
+        self.maze, self.dots, self.pellets = compile_level(self.layout)
+        self.dots_left = bin(self.dots).count("1")
+        self.spawn_ghosts()
+        self.pacman.start = self.layout.pacman_start
+        self.pacman.reset_state()
+
+    def spawn_ghosts(self):
+        self.ghosts = [
+            self.ghost_cls(GHOST_COLORS[number % len(GHOST_COLORS)], x, y, self.rng)
+            for number, (x, y) in enumerate(self.layout.ghost_starts)
+        ]
+        self.awake = list(range(len(self.ghosts)))
+
+    @property
+    def done(self):
+        return self.game_over or self.victory
+
+    def dot_at(self, x, y):
+        bit = self.maze.bit(x, y)
+        if not self.dots & bit:
+            return 0
+        return 2 if self.pellets & bit else 1
+
+    def iter_dots(self):
+        # (x, y, dot) for every remaining dot, dot being 1 or 2 for a pellet
+        width = self.maze.width
+        pellets = cell_bits(self.pellets, width * self.maze.height)
+        for x, y in iter_cells(self.dots, width):
+            yield x, y, 2 if pellets[y * width + x] == "1" else 1
+
+    def copy(self):
+        # Grid state is immutable ints, so only the entities need copying
+        clone = copy.copy(self)
+        clone.rng = copy.copy(self.rng)
+        clone.pacman = copy.copy(self.pacman)
+        clone.ghosts = [copy.copy(ghost) for ghost in self.ghosts]
+        clone.awake = list(self.awake)
+        for ghost in clone.ghosts:
+            if ghost.rng is self.rng:
+                ghost.rng = clone.rng
+        return clone
+
+    def update_ghost_targets(self):
+        nav = self.maze.nav
+        table = self.maze.distances
+        pacman = self.pacman
+        pacman_cell = nav.index(int(pacman.x // CELL_SIZE), int(pacman.y // CELL_SIZE))
+        scatter = self.tick % (SCATTER_TICKS + CHASE_TICKS) < SCATTER_TICKS
+
+        for number, ghost in enumerate(self.ghosts):
+            personality = GHOST_PERSONALITIES[number % len(GHOST_PERSONALITIES)]
+            corner = nav.corners[number % len(nav.corners)]
+            if ghost.flee:
+                ghost.target = pacman_cell
+            elif personality == "wanderer":
+                ghost.target = None
+            elif scatter:
+                ghost.target = corner
+            elif personality == "ambusher":
+                # Aim a few open cells ahead of where pacman is heading
+                target = pacman_cell
+                for _ in range(AMBUSH_LOOKAHEAD):
+                    if not nav.dir_mask[target] >> pacman.direction & 1:
+                        break
+                    target += nav.offsets[pacman.direction]
+                ghost.target = target
+            elif personality == "shy":
+                ghost_cell = nav.index(int(ghost.x // CELL_SIZE), int(ghost.y // CELL_SIZE))
+                close = table.distance(ghost_cell, pacman_cell) <= SHY_DISTANCE
+                ghost.target = corner if close else pacman_cell
+            else:
+                ghost.target = pacman_cell
+
+    def set_fleeing(self, flee):
+        for ghost in self.ghosts:
+            ghost.flee = flee
+
+    def move_ghosts(self):
+        if self.ghost_ai == "chase":
+            self.update_ghost_targets()
+        if self.active_radius is None:
+            for ghost in self.ghosts:
+                ghost.move(self.maze)
+            return
+        # Awake ghosts move every tick. Asleep ones (far and on a cell centre)
+        # are only looked at on their turn, ghost index modulo cell_ticks, when
+        # they either jump a cell or wake up; so a tick costs the awake ghosts
+        # plus 1/cell_ticks of the rest
+        pacman = self.pacman
+        reach = self.active_radius * CELL_SIZE
+        cell_ticks = CELL_SIZE // GHOST_SPEED
+        turn = self.tick % cell_ticks
+        awake = []
+        for index in sorted(set(self.awake).union(range(turn, len(self.ghosts), cell_ticks))):
+            ghost = self.ghosts[index]
+            if (
+                abs(ghost.x - pacman.x) <= reach and abs(ghost.y - pacman.y) <= reach
+            ) or not ghost.is_centered():
+                ghost.move(self.maze)
+                awake.append(index)
+            elif index % cell_ticks == turn:
+                ghost.move(self.maze, cell_ticks)
+        self.awake = awake
+
+    def nearby_ghosts(self):
+        # (index, ghost) for every ghost that moved this tick; with
+        # active_radius set, the others are too far away to touch pacman
+        if self.active_radius is None:
+            return enumerate(self.ghosts)
+        return ((index, self.ghosts[index]) for index in self.awake)
+
+    def collide_ghosts(self, events):
+        pacman = self.pacman
+        # Squared distance check, same threshold as hypot(...) < CELL_SIZE // 2
+        catch_distance = (CELL_SIZE // 2) ** 2
+        for index, ghost in self.nearby_ghosts():
+            ddx = pacman.x - ghost.x
+            ddy = pacman.y - ghost.y
+            if ddx * ddx + ddy * ddy < catch_distance:
+                if pacman.power_mode and ghost.flee:
+                    events.append(("ghost_eaten", ghost.x, ghost.y))
+                    ghost.x = self.layout.ghost_home[0] * CELL_SIZE + CELL_SIZE // 2
+                    ghost.y = self.layout.ghost_home[1] * CELL_SIZE + CELL_SIZE // 2
+                    ghost.flee = False
+                    pacman.score += GHOST_SCORE
+
+                elif not pacman.power_mode and not ghost.flee:
+                    self.catch(index, events)
+                    break
+
+    def catch(self, index, events):
+        pacman = self.pacman
+        pacman.lives -= 1
+        events.append(("death", index))
+        if pacman.lives <= 0:
+            self.game_over = True
+            events.append(("game_over",))
+        else:
+            pacman.reset_state()
+            # Pacman is somewhere else now: look at every ghost next tick
+            self.awake = list(range(len(self.ghosts)))
+
+    def check_level_complete(self, events):
+        if not self.dots_left:
+            if self.level < len(self.level_list) - 1:
+                self.level += 1
+                self.initialize_level()
+                events.append(("level", self.level))
+            else:
+                self.victory = True
+                events.append(("victory",))
+
+    def step(self, action=None):
+        if self.done:
+            return []
+        events = []
+        pacman = self.pacman
+        self.tick += 1
+
+        if action is not None:
+            pacman.direction = action
+        dx, dy = DIRECTIONS[pacman.direction]
+        pacman.move(dx * pacman.speed, dy * pacman.speed, self.maze)
+
+        current_cell_x = int(pacman.x // CELL_SIZE)
+        current_cell_y = int(pacman.y // CELL_SIZE)
+        bit = self.maze.bit(current_cell_x, current_cell_y)
+        if self.dots & bit:
+            self.dots ^= bit
+            self.dots_left -= 1
+            if self.pellets & bit:
+                self.pellets ^= bit
+                pacman.power_mode = True
+                pacman.power_timer = self.tick
+                self.set_fleeing(True)
+                pacman.score += PELLET_SCORE
+                events.append(("pellet", current_cell_x, current_cell_y))
+            else:
+                pacman.score += DOT_SCORE
+                events.append(("dot", current_cell_x, current_cell_y))
+
+        if pacman.power_mode and self.tick - pacman.power_timer > POWER_TICKS:
+            pacman.power_mode = False
+            self.set_fleeing(False)
+            events.append(("power_end",))
+
+        self.move_ghosts()
+        self.collide_ghosts(events)
+        self.check_level_complete(events)
+
+        pacman.update_speed()
+        return events
@@ -0,0 +1,264 @@
+"""Gym-style environments for training agents on CyberPunk-Man.
+
+    env = PacmanEnv(observation="grid")
+    observation = env.reset(seed=1, level=0)
+    observation, reward, done, info = env.step(action)
+
+    envs = VectorPacmanEnv(64, observation="pixels", render_scale=0.25)
+    observations = envs.reset(seed=1)
+    observations, rewards, dones, infos = envs.step(actions)
+
+Actions are the engine directions (0=Right, 1=Down, 2=Left, 3=Up) or NOOP to
+keep going the same way. The reward is the score gained by the step; done
+is set when the game is won or lost, or after max_ticks ticks with
+info["truncated"] set.
+
+Observations are written in place into one preallocated array per
+environment (one per batch for VectorPacmanEnv) and returned without a copy,
+so they are only valid until the next step; copy them to keep them:
+
+    grid    uint8 (GRID_CHANNELS, height, width): walls, dots, pellets,
+            pacman, ghosts (count per cell), fleeing ghosts. Levels smaller
+            than the largest in level_list are padded with walls.
+    pixels  uint8 (height, width, 3) RGB of the play field as main.py draws
+            it, render_scale times the window resolution, following pacman
+            on levels bigger than the view.
+
+Pixel environments draw through a pygame Surface that wraps the observation
+memory (pygame.image.frombuffer), so reading the frame needs no copy and,
+unlike a pygame.surfarray view, never leaves the surface locked. They run
+under SDL's dummy video driver unless SDL_VIDEODRIVER says otherwise.
+"""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+import main
+from batch import unpack_mask
+from engine import CELL_SIZE, MAX_TICKS, TICKS_PER_SECOND, GameState, get_levels
+
+NOOP = 4
+ACTIONS = 5
+OBSERVATIONS = ("grid", "pixels")
+GRID_CHANNELS = 6
+WALLS, DOTS, PELLETS, PACMAN, GHOSTS, FLEEING = range(GRID_CHANNELS)
+
+
+def observation_shape(observation="grid", level_list=None, render_scale=1.0):
+    # Shape of the array an environment writes its observations into; pixel
+    # observations are the first three bytes of each RGBX pixel
+    if observation == "grid":
+        level_list = get_levels() if level_list is None else level_list
+        height = max(level.height for level in level_list)
+        width = max(level.width for level in level_list)
+        return GRID_CHANNELS, height, width
+    if observation == "pixels":
+        width, height = main.LevelCompositor(render_scale).play_area.size
+        return height, width, 4
+    raise ValueError(f"unknown observation {observation!r}, expected one of {OBSERVATIONS}")
+
+
+class GridRenderer:
+    """Keeps the symbolic observation of a game up to date in out.
+
+    Walls, dots and pellets are unpacked from the level bitmasks when a level
+    loads and then only cleared cell by cell as dots are eaten; the entity
+    channels are redrawn every step.
+    """
+
+    def __init__(self, out):
+        self.out = out
+
+    def load(self, game):
+        out = self.out
+        layout = game.layout
+        width, height = layout.width, layout.height
+        out[:] = 0
+        out[WALLS] = 1
+        out[WALLS, :height, :width] = unpack_mask(layout.walls, width, height)
+        pellets = unpack_mask(game.pellets, width, height)
+        out[DOTS, :height, :width] = unpack_mask(game.dots, width, height) - pellets
+        out[PELLETS, :height, :width] = pellets
+
+    def erase_dot(self, x, y):
+        self.out[DOTS, y, x] = 0
+        self.out[PELLETS, y, x] = 0
+
+    def update(self, game):
+        out = self.out
+        out[PACMAN:] = 0
+        out[PACMAN, int(game.pacman.y // CELL_SIZE), int(game.pacman.x // CELL_SIZE)] = 1
+        for ghost in game.ghosts:
+            channel = FLEEING if ghost.flee else GHOSTS
+            out[channel, int(ghost.y // CELL_SIZE), int(ghost.x // CELL_SIZE)] += 1
+
+
+class PixelRenderer:
+    """Draws the play field of a game into out, an (height, width, 4) array.
+
+    The board comes from a main.LevelCompositor at the render scale and the
+    sprites from the matching sprite atlas, exactly as game_loop draws them
+    (without interpolation, confetti or the HUD).
+    """
+
+    def __init__(self, out, render_scale=1.0):
+        main.init_display()
+        height, width, _ = out.shape
+        self.surface = pygame.image.frombuffer(out, (width, height), "RGBX")
+        self.scale = render_scale
+        self.compositor = main.LevelCompositor(render_scale)
+        self.atlas = main.get_sprite_atlas(self.compositor.scaled(0, 0, CELL_SIZE, CELL_SIZE).width)
+        self.camera = main.Camera()
+
+    def load(self, game):
+        self.compositor.load(game.maze, game.iter_dots())
+
+    def erase_dot(self, x, y):
+        self.compositor.erase_dot(x, y)
+
+    def update(self, game):
+        camera, scale, surface = self.camera, self.scale, self.surface
+        pacman = game.pacman
+        camera.follow(pacman.x, pacman.y, game.maze)
+        self.compositor.scroll(camera)
+        surface.blit(self.compositor.board, (0, 0))
+        time = game.tick * 1000 / TICKS_PER_SECOND
+        x, y = (pacman.x - camera.x) * scale, (pacman.y - camera.y) * scale
+        pacman.draw(x, y, time, surface, self.atlas)
+        for _, ghost in game.nearby_ghosts():
+            if camera.visible(ghost.x, ghost.y):
+                x, y = (ghost.x - camera.x) * scale, (ghost.y - camera.y) * scale
+                ghost.draw(x, y, time, surface, self.atlas)
+
+
+class PacmanEnv:
+    """One game behind a reset()/step() interface.
+
+    out, when given, is the array observations are written into (as made
+    for observation_shape()); VectorPacmanEnv passes each environment its
+    slice of one batch array.
+    """
+
+    def __init__(
+        self,
+        observation="grid",
+        level=0,
+        seed=None,
+        ghost_ai="random",
+        level_list=None,
+        render_scale=1.0,
+        max_ticks=MAX_TICKS,
+        out=None,
+    ):
+        shape = observation_shape(observation, level_list, render_scale)
+        if out is None:
+            out = np.zeros(shape, dtype=np.uint8)
+        elif out.shape != shape or out.dtype != np.uint8:
+            raise ValueError(f"observations go in a uint8 array of {shape}, not {out.shape}")
+        self.observation_type = observation
+        self.level = level
+        self.max_ticks = max_ticks
+        if observation == "grid":
+            self.renderer = GridRenderer(out)
+            self.observation = out
+            self.game = GameState(level, seed, ghost_ai=ghost_ai, level_list=level_list)
+        else:
+            self.renderer = PixelRenderer(out, render_scale)
+            self.observation = out[..., :3]
+            self.game = GameState(
+                level,
+                seed,
+                pacman_cls=main.CyberPacman,
+                ghost_cls=main.Ghost,
+                ghost_ai=ghost_ai,
+                level_list=level_list,
+            )
+        self.renderer.load(self.game)
+        self.renderer.update(self.game)
+
+    def reset(self, seed=None, level=None):
+        # A new game; without a seed the random stream carries on from the last one
+        self.game.reset(self.level if level is None else level, seed)
+        self.renderer.load(self.game)
+        self.renderer.update(self.game)
+        return self.observation
+
+    def step(self, action):
+        if action not in (0, 1, 2, 3, NOOP, None):
+            raise ValueError(f"action must be 0-3 or NOOP ({NOOP}), got {action!r}")
+        game = self.game
+        score = game.pacman.score
+        events = game.step(None if action == NOOP else action)
+        for event in events:
+            if event[0] in ("dot", "pellet"):
+                self.renderer.erase_dot(event[1], event[2])
+            elif event[0] == "level":
+                self.renderer.load(game)
+        self.renderer.update(game)
+
+        truncated = not game.done and game.tick >= self.max_ticks
+        info = {
+            "events": events,
+            "score": game.pacman.score,
+            "lives": game.pacman.lives,
+            "level": game.level,
+            "tick": game.tick,
+            "truncated": truncated,
+        }
+        return self.observation, game.pacman.score - score, game.done or truncated, info
+
+
+class VectorPacmanEnv:
+    """n PacmanEnvs stepped together, observations stacked in one array.
+
+    Every environment writes into its own row of observations, so step()
+    returns the whole batch without copying. A finished environment is reset
+    straight away; its last observation is kept in info["final_observation"].
+    Keyword arguments are passed on to every PacmanEnv.
+    """
+
+    def __init__(
+        self, n, observation="grid", seed=None, level_list=None, render_scale=1.0, **kwargs
+    ):
+        shape = observation_shape(observation, level_list, render_scale)
+        self.buffer = np.zeros((n,) + shape, dtype=np.uint8)
+        self.observations = self.buffer if observation == "grid" else self.buffer[..., :3]
+        self.envs = [
+            PacmanEnv(
+                observation,
+                seed=None if seed is None else seed + index,
+                level_list=level_list,
+                render_scale=render_scale,
+                out=self.buffer[index],
+                **kwargs,
+            )
+            for index in range(n)
+        ]
+        self.rewards = np.zeros(n, dtype=np.int64)
+        self.dones = np.zeros(n, dtype=bool)
+
+    def __len__(self):
+        return len(self.envs)
+
+    def reset(self, seed=None, level=None):
+        # Environment i gets seed + i
+        for index, env in enumerate(self.envs):
+            env.reset(None if seed is None else seed + index, level)
+        return self.observations
+
+    def step(self, actions):
+        infos = []
+        for index, (env, action) in enumerate(zip(self.envs, actions)):
+            observation, reward, done, info = env.step(int(action))
+            if done:
+                info["final_observation"] = observation.copy()
+                env.reset()
+            self.rewards[index] = reward
+            self.dones[index] = done
+            infos.append(info)
+        return self.observations, self.rewards, self.dones, infos
@@ -0,0 +1,320 @@
+"""Level packs: plain-text level files compiled once into a binary cache.
+
+    python levelpack.py levels/classic.txt     # compile it now and report
+
+A pack holds any number of levels, each a "= Name" line followed by its
+rows, one character per cell:
+
+    #  wall              .  dot               o  power pellet
+    _  open, no dot      P  pacman start      H  ghost home (eaten ghosts respawn)
+    1-9  ghost starts, in order
+
+P, H and the ghost starts sit on a dot. Lines starting with ";" and blank
+lines are ignored.
+
+The first load compiles every level into cache/levels-<hash>.bin, keyed by
+the SHA-1 of the pack text:
+
+    header   "<4sHI20s"  magic b"CPLV", version, level count, SHA-1
+    offsets  "<I" per level plus one for the end of the file
+    level    "<8H"       width, height, pacman x, y, home x, y, ghost count,
+                         name length; then the ghost starts ("<HH" each), the
+                         UTF-8 name, the wall, dot and pellet bitmasks
+                         ((width * height + 7) // 8 bytes each, little-endian)
+                         and the NavGraph.dir_mask neighbour masks (one byte
+                         per cell)
+
+Later loads memory-map the cache and check it against the hash of the pack,
+so editing the pack rebuilds it. A level is only decoded when the game first
+asks for it, which keeps startup flat however many levels the pack holds.
+"""
+
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+
+from maze import CACHE_DIR, Maze, direction_masks
+
+LEVELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels")
+DEFAULT_PACK = os.path.join(LEVELS_DIR, "classic.txt")
+
+MAGIC = b"CPLV"
+VERSION = 1
+HEADER = struct.Struct("<4sHI20s")
+LEVEL_HEADER = struct.Struct("<8H")
+SPAWN = struct.Struct("<HH")
+
+WALL = "#"
+DOT = "."
+PELLET = "o"
+EMPTY = "_"
+PACMAN = "P"
+HOME = "H"
+
+
+class Level:
+    """One level: walls, starting dots and pellets, and spawn points.
+
+    walls, dots and pellets are bitmasks over cell indices (y * width + x),
+    as in maze.Maze; pellets are a subset of dots. dir_mask holds the
+    NavGraph direction mask of every cell.
+    """
+
+    def __init__(
+        self,
+        name,
+        width,
+        height,
+        walls,
+        dots,
+        pellets,
+        pacman_start,
+        ghost_home,
+        ghost_starts,
+        dir_mask=None,
+    ):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.walls = walls
+        self.dots = dots
+        self.pellets = pellets
+        self.pacman_start = pacman_start
+        self.ghost_home = ghost_home
+        self.ghost_starts = ghost_starts
+        if dir_mask is None:
+            dir_mask = bytes(direction_masks(Maze.from_walls(width, height, walls)))
+        self.dir_mask = dir_mask
+
+    @property
+    def rows(self):
+        return self.maze().rows
+
+    def maze(self):
+        return Maze.from_walls(self.width, self.height, self.walls, self.dir_mask)
+
+
+def parse(text, path="<levels>"):
+    # Level objects for every level in the pack text
+    levels = []
+    name = None
+    rows = []
+
+    def finish():
+        if name is not None:
+            levels.append(parse_level(name, rows, path))
+
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.rstrip()
+        if not line or line.startswith(";"):
+            continue
+        if line.startswith("="):
+            finish()
+            name = line[1:].strip()
+            rows = []
+        elif name is None:
+            raise ValueError(f"{path}:{number}: rows before the first '= Name' line")
+        else:
+            rows.append((number, line))
+    finish()
+    if not levels:
+        raise ValueError(f"{path}: no levels")
+    return levels
+
+
+def parse_level(name, rows, path):
+    if not rows:
+        raise ValueError(f"{path}: level {name!r} has no rows")
+    width = len(rows[0][1])
+    walls = dots = pellets = 0
+    pacman = home = None
+    ghosts = {}
+    for y, (number, line) in enumerate(rows):
+        if len(line) != width:
+            raise ValueError(f"{path}:{number}: row is {len(line)} cells wide, expected {width}")
+        for x, cell in enumerate(line):
+            bit = 1 << (y * width + x)
+            if cell == WALL:
+                walls |= bit
+                continue
+            if cell != EMPTY:
+                dots |= bit
+            if cell == PELLET:
+                pellets |= bit
+            elif cell == PACMAN:
+                if pacman is not None:
+                    raise ValueError(f"{path}:{number}: second pacman start in {name!r}")
+                pacman = (x, y)
+            elif cell == HOME:
+                if home is not None:
+                    raise ValueError(f"{path}:{number}: second ghost home in {name!r}")
+                home = (x, y)
+            elif cell.isdigit() and cell != "0":
+                if cell in ghosts:
+                    raise ValueError(f"{path}:{number}: second ghost {cell} in {name!r}")
+                ghosts[cell] = (x, y)
+            elif cell not in (DOT, EMPTY):
+                raise ValueError(f"{path}:{number}: unknown cell {cell!r}")
+    if pacman is None or home is None:
+        raise ValueError(f"{path}: level {name!r} needs a pacman start (P) and ghost home (H)")
+    if sorted(ghosts) != [str(n) for n in range(1, len(ghosts) + 1)] or not ghosts:
+        raise ValueError(f"{path}: ghosts of level {name!r} must be numbered 1 to n")
+    starts = [ghosts[key] for key in sorted(ghosts)]
+    return Level(name, width, len(rows), walls, dots, pellets, pacman, home, starts)
+
+
+def encode(levels, digest):
+    records = []
+    for level in levels:
+        name = level.name.encode()
+        size = (level.width * level.height + 7) // 8
+        records.append(
+            LEVEL_HEADER.pack(
+                level.width,
+                level.height,
+                *level.pacman_start,
+                *level.ghost_home,
+                len(level.ghost_starts),
+                len(name),
+            )
+            + b"".join(SPAWN.pack(x, y) for x, y in level.ghost_starts)
+            + name
+            + level.walls.to_bytes(size, "little")
+            + level.dots.to_bytes(size, "little")
+            + level.pellets.to_bytes(size, "little")
+            + bytes(level.dir_mask)
+        )
+    offsets = [HEADER.size + 4 * (len(records) + 1)]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+    header = HEADER.pack(MAGIC, VERSION, len(records), digest)
+    return header + struct.pack(f"<{len(offsets)}I", *offsets) + b"".join(records)
+
+
+class LevelPack:
+    """The levels of a compiled pack, decoded lazily out of its cache bytes.
+
+    Indexing and len() work like the list of levels; data can be bytes or a
+    read-only mmap of the cache file.
+    """
+
+    def __init__(self, data, path=None):
+        self.data = data
+        self.path = path
+        _, _, count, self.digest = HEADER.unpack_from(data)
+        self.offsets = struct.unpack_from(f"<{count + 1}I", data, HEADER.size)
+        self.levels = [None] * count
+
+    @classmethod
+    def validate(cls, data, digest):
+        if len(data) < HEADER.size:
+            return False
+        magic, version, count, stored = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or stored != digest:
+            return False
+        if len(data) < HEADER.size + 4 * (count + 1):
+            return False
+        return struct.unpack_from("<I", data, HEADER.size + 4 * count)[0] == len(data)
+
+    @classmethod
+    def open(cls, path, digest):
+        # The memory-mapped cache at path, or None if missing or stale
+        try:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if not cls.validate(data, digest):
+            data.close()
+            return None
+        return cls(data, path)
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __getitem__(self, index):
+        index = range(len(self.levels))[index]
+        level = self.levels[index]
+        if level is None:
+            level = self.levels[index] = self.decode(self.offsets[index])
+        return level
+
+    def decode(self, offset):
+        data = self.data
+        width, height, px, py, hx, hy, ghost_count, name_length = LEVEL_HEADER.unpack_from(
+            data, offset
+        )
+        offset += LEVEL_HEADER.size
+        starts = [SPAWN.unpack_from(data, offset + SPAWN.size * n) for n in range(ghost_count)]
+        offset += SPAWN.size * ghost_count
+        name = data[offset : offset + name_length].decode()
+        offset += name_length
+        size = (width * height + 7) // 8
+        masks = []
+        for _ in range(3):
+            masks.append(int.from_bytes(data[offset : offset + size], "little"))
+            offset += size
+        walls, dots, pellets = masks
+        dir_mask = data[offset : offset + width * height]
+        return Level(
+            name, width, height, walls, dots, pellets, (px, py), (hx, hy), starts, dir_mask
+        )
+
+
+def cache_path(digest):
+    return os.path.join(CACHE_DIR, f"levels-{digest.hex()[:16]}.bin")
+
+
+def load(path=DEFAULT_PACK):
+    # The pack at path, memory-mapped from its cache when that is up to date
+    with open(path, "rb") as f:
+        source = f.read()
+    digest = hashlib.sha1(source).digest()
+    cache = cache_path(digest)
+    pack = LevelPack.open(cache, digest)
+    if pack is not None:
+        return pack
+    data = encode(parse(source.decode(), path), digest)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Written aside and renamed, so another process never maps half a file
+        partial = f"{cache}.{os.getpid()}.tmp"
+        with open(partial, "wb") as f:
+            f.write(data)
+        os.replace(partial, cache)
+    except OSError:
+        pass  # The cache only saves the compile on the next start
+    return LevelPack.open(cache, digest) or LevelPack(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile a CyberPunk-Man level pack")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PACK)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    pack = load(args.path)
+    loaded = time.perf_counter()
+    for level in pack:
+        level.maze().nav
+    elapsed = time.perf_counter() - loaded
+
+    print(f"{len(pack)} levels, cache {pack.path or '(not writable)'}")
+    print(
+        f"loaded in {(loaded - start) * 1000:.2f} ms, "
+        f"every level decoded with its NavGraph in {elapsed * 1000:.2f} ms"
+    )
+    for number, level in enumerate(pack):
+        print(
+            f"{number:>4}  {level.name:<24} {level.width}x{level.height}  "
+            f"{bin(level.dots).count('1')} dots  {len(level.ghost_starts)} ghosts"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
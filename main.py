@@ -1,17 +1,42 @@
+import argparse
+import collections
+import functools
+import hashlib
+import os
+import numpy as np
 import pygame
 import random
 import sys
 import math
 from pygame.locals import *
 
-# Initialize Pygame
-pygame.init()
+import engine
+import mazegen
+from capture import CAPTURE_FPS, FrameCapture
+from engine import CELL_SIZE, GameState
+from profiler import DEFAULT_FRAMES, NULL_PROFILER, FrameProfiler
+from replay import MAX_SEED, MAX_SWARM, Recorder
+from swarm import SwarmGameState
 
 # Game settings
-CELL_SIZE = 64
-WIDTH = 25 * CELL_SIZE
-HEIGHT = 15 * CELL_SIZE + 100
+VIEW_COLUMNS = 25  # cells of the level shown at once; bigger levels scroll
+VIEW_ROWS = 15
+HUD_HEIGHT = 100
+WIDTH = VIEW_COLUMNS * CELL_SIZE
+HEIGHT = VIEW_ROWS * CELL_SIZE + HUD_HEIGHT
+PLAY_AREA = (0, 0, WIDTH, HEIGHT - HUD_HEIGHT)
+CHUNK_CELLS = 8  # the board is pre-rendered in chunks this many cells square
+MAX_CHUNKS = 40  # chunks kept rendered; a screen needs at most 15
+GENERATED_SIZE = (256, 256)  # --maze-size default
+MAX_CHASE_CELLS = 64 * 64  # chase ghosts need all-pairs distances, n^2 in size
 FPS = 30
+RENDER_FPS = 60  # frame cap during play; the simulation stays at TICKS_PER_SECOND
+MIN_RENDER_SCALE = 0.25
+MAX_CATCHUP_TICKS = 5  # ticks run in one frame before falling behind real time
+PROFILER_GRAPH_FRAMES = 240
+PROFILER_TOP_PHASES = 5
+PROFILER_PANEL_WIDTH = 300
+PROFILER_PANEL_HEIGHT = 90 + 16 * PROFILER_TOP_PHASES
 CYBER_BLUE = (0, 255, 255)
 NEON_PINK = (255, 0, 255)
 NEON_YELLOW = (255, 255, 0)
@@ -20,18 +45,161 @@ DOT_COLOR = (255, 255, 255)
 NEON_PURPLE = (128, 0, 255)
 TERMINAL_GREEN = (0, 255, 64)
 GLITCH_OFFSET = 2
+GLITCH_TINTS = 8  # pre-tinted red levels per cached glitch text
+TEXT_CACHE_SIZE = 256
+GRID_SPACING = 40  # menu background grid
+HOLOGRAM_PHASES = 16  # scanline positions of a hovered button, one per 20 ms
+MENU_OPTIONS = [("NEURAL PATH", 0), ("CYBER CORE", 1), ("SYNTH MAZE", 2)]
+FLEE_COLOR = (0, 0, 255)
+FLASH_COLOR = (255, 255, 255)
+PACMAN_PHASES = 8  # mouth openings per direction in the sprite atlas
+GHOST_PHASES = 8  # skirt waves per ghost color in the sprite atlas
+SPRITE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+SPRITE_CACHE_VERSION = 1
+
+# Fonts are loaded, and the font module initialized, on first use
+@functools.lru_cache(maxsize=None)
+def get_font(size):
+    if not pygame.font.get_init():
+        pygame.font.init()
+    try:
+        return pygame.font.Font("fonts/cyberpunk.ttf", size)
+    except:
+        print("Missing cyberpunk.ttf - using fallback font")
+        return pygame.font.SysFont("couriernew", size)
+
+
+@functools.lru_cache(maxsize=None)
+def get_default_font(size):
+    if not pygame.font.get_init():
+        pygame.font.init()
+    return pygame.font.Font(None, size)
+
+
+@functools.lru_cache(maxsize=TEXT_CACHE_SIZE)
+def render_glitch_text(text, font_size, color, alpha=255):
+    # Rasterized text plus its red-shifted glitch copies; only the offsets
+    # and the choice of copy change per frame
+    text_surf = get_font(font_size).render(text, True, color)
+    text_surf.set_alpha(alpha)
+    variants = []
+    for i in range(GLITCH_TINTS):
+        glitch_surf = text_surf.copy()
+        glitch_surf.fill(
+            (255 * i // (GLITCH_TINTS - 1), 0, 0), special_flags=BLEND_RGB_ADD
+        )
+        variants.append(glitch_surf)
+    return text_surf, tuple(variants)
+
+
+@functools.lru_cache(maxsize=None)
+def menu_grid():
+    # The level select background: the grid lines over the dark fill, drawn
+    # once for the window and blitted every menu frame
+    surface = pygame.Surface((WIDTH, HEIGHT)).convert()
+    surface.fill(DARK_BG)
+    for y in range(0, HEIGHT, GRID_SPACING):
+        pygame.draw.line(surface, CYBER_BLUE, (0, y), (WIDTH, y))
+    for x in range(0, WIDTH, GRID_SPACING):
+        pygame.draw.line(surface, CYBER_BLUE, (x, 0), (x, HEIGHT))
+    return surface
+
+
+@functools.lru_cache(maxsize=None)
+def hologram_frames(size, color):
+    # Every scanline phase of the hologram over a hovered button of this
+    # size; only the first ten lines are visible before they fade out
+    width, height = size
+    frames = []
+    for phase in range(HOLOGRAM_PHASES):
+        hologram = pygame.Surface(size, SRCALPHA)
+        for i in range(height // 2):
+            alpha = max(50 - i * 5, 0)  # Prevent negative alpha values
+            y = i * 4 + phase
+            pygame.draw.line(hologram, (*color, alpha), (0, y), (width, y), 2)
+        frames.append(hologram)
+    return tuple(frames)
+
+
+@functools.lru_cache(maxsize=None)
+def hud_scanner():
+    # The translucent line that sweeps down the HUD, made once
+    scanner = pygame.Surface((WIDTH - 600, 4), SRCALPHA)
+    scanner.fill((*NEON_PINK, 50))
+    return scanner
+
+
+@functools.lru_cache(maxsize=None)
+def profiler_panel():
+    # The profiler overlay's panel, refilled and redrawn every frame it shows
+    return pygame.Surface((PROFILER_PANEL_WIDTH, PROFILER_PANEL_HEIGHT), SRCALPHA)
+
+
+@functools.lru_cache(maxsize=TEXT_CACHE_SIZE)
+def profiler_text(text, color):
+    # One overlay line, rendered again only when its numbers change
+    return get_default_font(20).render(text, True, color)
+
+
+# Importing this module initializes no pygame subsystem: the window (and
+# with it video and events) is opened by init_display() when a menu or the
+# game loop first needs it
+screen = None
+clock = pygame.time.Clock()
 
-# Load custom font
-try:
-    CYBER_FONT = pygame.font.Font("fonts/cyberpunk.ttf", 72)
-except:
-    CYBER_FONT = pygame.font.SysFont("couriernew", 72)
-    print("Missing cyberpunk.ttf - using fallback font")
 
-# Initialize screen and clock
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("CyberPunk-Man v2.0")
-clock = pygame.time.Clock()
+def init_display():
+    global screen
+    if screen is None:
+        pygame.display.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption("CyberPunk-Man")
+    return screen
+
+
+class Quality:
+    """How much work each frame is allowed, for slow machines.
+
+    render_scale is the fraction of the window's resolution the play field
+    is drawn at: below 1, game_loop draws the board and sprites onto a
+    smaller off-screen surface and stretches it over the window once per
+    frame, while the HUD and overlays stay sharp. The flags turn off the
+    glitch copies behind text, the hologram on hovered menu buttons, the
+    HUD scanner line and the confetti bursts.
+    """
+
+    def __init__(self, render_scale=1.0, glitch=True, hologram=True, scanner=True, confetti=True):
+        if not MIN_RENDER_SCALE <= render_scale <= 1:
+            raise ValueError(f"render scale must be between {MIN_RENDER_SCALE} and 1")
+        self.render_scale = render_scale
+        self.glitch = glitch
+        self.hologram = hologram
+        self.scanner = scanner
+        self.confetti = confetti
+
+
+QUALITY_PRESETS = {
+    "high": Quality(),
+    "medium": Quality(0.75, glitch=False, scanner=False),
+    "low": Quality(0.5, glitch=False, hologram=False, scanner=False, confetti=False),
+}
+quality = QUALITY_PRESETS["high"]
+
+
+def set_quality(preset="high", render_scale=None):
+    # Picks a preset, optionally with its own render scale, for everything
+    # drawn from now on
+    global quality
+    quality = QUALITY_PRESETS[preset]
+    if render_scale is not None:
+        quality = Quality(
+            render_scale,
+            quality.glitch,
+            quality.hologram,
+            quality.scanner,
+            quality.confetti,
+        )
+    return quality
 
 # UI Sound Effects
 # menu_move_sound = pygame.mixer.Sound("sounds/ui_move.wav")
@@ -41,92 +209,85 @@ clock = pygame.time.Clock()
 class CyberUI:
     @staticmethod
     def draw_glitch_text(text, font_size, position, color=NEON_PINK, alpha=255):
-        text_surf = CYBER_FONT.render(text, True, color)
-        text_surf.set_alpha(alpha)
+        text_surf, variants = render_glitch_text(text, font_size, color, alpha)
 
         # Primary text
         screen.blit(text_surf, position)
 
         # Glitch effect
+        if not quality.glitch:
+            return
         for i in range(3):
             offset = (
                 random.randint(-GLITCH_OFFSET, GLITCH_OFFSET),
                 random.randint(-GLITCH_OFFSET, GLITCH_OFFSET),
             )
-            glitch_surf = text_surf.copy()
-            glitch_surf.fill(
-                (random.randint(0, 255), 0, 0), special_flags=BLEND_RGB_ADD
-            )
+            glitch_surf = random.choice(variants)
             screen.blit(glitch_surf, (position[0] + offset[0], position[1] + offset[1]))
 
     @staticmethod
-    def create_cyber_button(text, rect, base_color, hover_color):
-        mouse_pos = pygame.mouse.get_pos()
+    def text_cache_info():
+        # Hits/misses of the glitch text cache, to check nothing re-renders
+        return render_glitch_text.cache_info()
+
+    @staticmethod
+    def create_cyber_button(text, rect, base_color, hover_color, time=None, mouse_pos=None):
+        mouse_pos = pygame.mouse.get_pos() if mouse_pos is None else mouse_pos
         hovered = rect.collidepoint(mouse_pos)
-        time = pygame.time.get_ticks()
+        time = pygame.time.get_ticks() if time is None else time
 
         # Animated border
         border_width = 2 + int(abs(math.sin(time * 0.005)) * 3)
         color = hover_color if hovered else base_color
 
         # Hologram effect
-        if hovered:
-            hologram = pygame.Surface(rect.size, SRCALPHA)
-            for i in range(rect.height // 2):
-                alpha = max(50 - i * 5, 0)  # Prevent negative alpha values
-                y = i * 4 + (time // 20) % 16
-                pygame.draw.line(
-                    hologram, (*base_color, alpha), (0, y), (rect.width, y), 2
-                )
-            screen.blit(hologram, rect.topleft)
+        if hovered and quality.hologram:
+            frames = hologram_frames(rect.size, base_color)
+            screen.blit(frames[(time // 20) % HOLOGRAM_PHASES], rect.topleft)
 
         # Button background
         pygame.draw.rect(screen, DARK_BG, rect.inflate(20, 20), border_radius=12)
         pygame.draw.rect(screen, color, rect, border_width, border_radius=8)
 
         # Text
-        text_rect = CYBER_FONT.render(text, True, color).get_rect(center=rect.center)
-        CyberUI.draw_glitch_text(text, 36, text_rect.topleft, color)
+        text_surf, _ = render_glitch_text(text, 72, color)
+        text_rect = text_surf.get_rect(center=rect.center)
+        CyberUI.draw_glitch_text(text, 72, text_rect.topleft, color)
+
+    @staticmethod
+    def level_select_buttons():
+        # (rect, level) of each menu button
+        buttons = []
+        y_pos = HEIGHT // 4  # Start higher to accommodate larger spacing
+        for text, level in MENU_OPTIONS:
+            buttons.append((pygame.Rect(WIDTH // 2 - 500, y_pos, 1000, 80), level))
+            y_pos += 150  # Increased from 100 to 150 for more spacing
+        return buttons
+
+    @staticmethod
+    def draw_level_select(buttons, selected, time=None, mouse_pos=None):
+        # One menu frame. Everything it blits is rendered on first use and
+        # cached, so frames after the first allocate no surfaces
+        screen.blit(menu_grid(), (0, 0))
+
+        # Title
+        CyberUI.draw_glitch_text(
+            "MAINFRAME ACCESS", 72, (WIDTH // 2 - 500, 50), CYBER_BLUE
+        )
+
+        # Buttons
+        for i, ((text, _), (rect, _)) in enumerate(zip(MENU_OPTIONS, buttons)):
+            color = NEON_PURPLE if i == selected else NEON_PINK
+            CyberUI.create_cyber_button(text, rect, color, CYBER_BLUE, time, mouse_pos)
 
     @staticmethod
     def level_select_menu():
+        init_display()
         selected = 0
-        options = [("NEURAL PATH", 0), ("CYBER CORE", 1), ("SYNTH MAZE", 2)]
+        button_rects = CyberUI.level_select_buttons()
 
         while True:
-            screen.fill(DARK_BG)
-
-            # Animated grid background
-            time = pygame.time.get_ticks()
-            for y in range(0, HEIGHT, 40):
-                pygame.draw.line(
-                    screen,
-                    (*CYBER_BLUE, 30),
-                    (time % 40 - 40, y),
-                    (WIDTH + time % 40, y),
-                )
-            for x in range(0, WIDTH, 40):
-                pygame.draw.line(
-                    screen,
-                    (*CYBER_BLUE, 30),
-                    (x, time % 40 - 40),
-                    (x, HEIGHT + time % 40),
-                )
-
-            # Title
-            CyberUI.draw_glitch_text(
-                "MAINFRAME ACCESS", 90, (WIDTH // 2 - 500, 50), CYBER_BLUE
-            )
-
-            # Buttons
-            button_rects = []
-            y_pos = HEIGHT // 4  # Start higher to accommodate larger spacing
-            for i, (text, level) in enumerate(options):
-                btn_rect = pygame.Rect(WIDTH // 2 - 500, y_pos, 1000, 80)
-                color = NEON_PURPLE if i == selected else NEON_PINK
-                CyberUI.create_cyber_button(text, btn_rect, color, CYBER_BLUE)
-                button_rects.append((btn_rect, level))
-                y_pos += 150  # Increased from 100 to 150 for more spacing
+            CyberUI.draw_level_select(button_rects, selected)
 
             # Input handling
             for event in pygame.event.get():
@@ -168,679 +329,1086 @@ class CyberUI:
         )
 
         # Central scanner
+        if not quality.scanner:
+            return
         scanner_y = (pygame.time.get_ticks() // 20) % HEIGHT
-        scanner = pygame.Surface((WIDTH - 600, 4), SRCALPHA)
-        scanner.fill((*NEON_PINK, 50))
-        screen.blit(scanner, (300, scanner_y))
-
+        screen.blit(hud_scanner(), (300, scanner_y))
 
-# Game settings
-CELL_SIZE = 64
-WIDTH = 25 * CELL_SIZE
-HEIGHT = 15 * CELL_SIZE + 100  # Extra space for UI
-FPS = 30
-CYBER_BLUE = (0, 255, 255)
-NEON_PINK = (255, 0, 255)
-NEON_YELLOW = (255, 255, 0)
-DARK_BG = (0, 0, 20)
-DOT_COLOR = (255, 255, 255)
-
-# Initialize screen and clock
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("CyberPunk-Man")
-clock = pygame.time.Clock()
-
-# Define levels
-levels = [
-    {
-        # Level 0: Revised Easy
-        "maze": [
-            [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 0, 0, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1, 0, 0, 1],
-            [1, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 1],
-            [1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1],
-            [1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 0, 0, 1, 1, 0, 0, 1, 1, 1, 0, 1, 1, 1, 1, 1],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 0, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 1],
-            [1, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 1],
-            [1, 0, 1, 1, 1, 0, 1, 1, 1, 1, 0, 1, 0, 1, 0, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1],
-            [1, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 1, 1, 0, 1, 1, 1, 0, 1, 0, 1, 0, 1, 0, 1, 0, 1, 0, 1, 1, 1, 0, 1, 1, 1],
-            [1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1],
-            [1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1],
-            [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-        ],
-        "power_pellets": [(2, 2), (22, 2), (2, 12), (22, 12)],
-    },
-    {  # Level 1: Medium (original maze)
-        "maze": [
-            [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 0, 1],
-            [1, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 1],
-            [1, 0, 1, 0, 1, 1, 1, 1, 1, 0, 1, 0, 1, 1, 1, 1, 1, 0, 1, 0, 1, 0, 1, 0, 1],
-            [1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1],
-            [1, 0, 1, 0, 1, 1, 0, 1, 1, 1, 1, 0, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1],
-            [1, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 0, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1],
-            [1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 0, 1, 0, 1, 1, 0, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1],
-            [1, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 1],
-            [1, 0, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 0, 1],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-        ],
-        "power_pellets": [(1, 1), (23, 1), (1, 13), (23, 13)],
-    },
-    {  # Level 2: Hard
-        "maze": [
-            [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-            [1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1],
-            [1, 0, 1, 1, 1, 0, 1, 0, 1, 1, 1, 0, 1, 0, 1, 1, 1, 0, 1, 0, 1, 1, 1, 0, 1],
-            [1, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1, 0, 1],
-            [1, 0, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 0, 1],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 0, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1, 0, 1],
-            [1, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 1],
-            [1, 0, 1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1, 0, 1, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 0, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1],
-            [1, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1, 0, 1],
-            [1, 0, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1, 1, 0, 1],
-            [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
-            [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
-        ],
-        "power_pellets": [(1, 1), (23, 1), (1, 13), (23, 13)],
-    },
-]
 
 # Add to constants
 CONFETTI_COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255)]
-
-
-class ConfettiParticle:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.color = random.choice(CONFETTI_COLORS)
-        self.angle = random.uniform(0, 2 * math.pi)
-        self.speed = random.uniform(2, 5)
-        self.velocity = (
-            math.cos(self.angle) * self.speed,
-            math.sin(self.angle) * self.speed,
-        )
-        self.size = random.randint(4, 8)
-        self.lifetime = random.randint(20, 40)
-        self.age = 0
-
-    def update(self):
-        self.x += self.velocity[0]
-        self.y += self.velocity[1]
-        self.velocity = (self.velocity[0] * 0.95, self.velocity[1] + 0.25)
-        self.age += 1
-        return self.age < self.lifetime
-
-    def draw(self):
-        alpha = 255 - int(255 * (self.age / self.lifetime))
-        surface = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-        pygame.draw.rect(surface, self.color + (alpha,), (0, 0, self.size, self.size))
-        screen.blit(surface, (self.x, self.y))
+CONFETTI_MIN_SIZE = 4
+CONFETTI_MAX_SIZE = 8
+CONFETTI_ALPHA_LEVELS = 16
+MAX_CONFETTI = 16384
 
 
 class ConfettiManager:
-    def __init__(self):
-        self.particles = []
+    """Confetti particles kept as parallel NumPy arrays.
+
+    Positions, velocities, ages, lifetimes, sizes and colors live in
+    preallocated arrays; update() integrates every live particle at once and
+    draw() blits pre-made squares for each color, size and fade level with a
+    single Surface.blits() call. Bursts beyond MAX_CONFETTI live particles are
+    dropped.
+    """
+
+    def __init__(self, capacity=MAX_CONFETTI, seed=None):
+        self.capacity = capacity
+        self.count = 0
+        self.rng = np.random.default_rng(seed)
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.age = np.zeros(capacity, dtype=np.int32)
+        self.lifetime = np.ones(capacity, dtype=np.int32)
+        self.size = np.zeros(capacity, dtype=np.int32)
+        self.color = np.zeros(capacity, dtype=np.int32)
+        self.stamps = None
+
+    def make_stamps(self):
+        # One faded square per (color, size, alpha level), indexed flat
+        stamps = []
+        for color in CONFETTI_COLORS:
+            for size in range(CONFETTI_MIN_SIZE, CONFETTI_MAX_SIZE + 1):
+                for level in range(CONFETTI_ALPHA_LEVELS):
+                    alpha = 255 * level // (CONFETTI_ALPHA_LEVELS - 1)
+                    stamp = pygame.Surface((size, size), SRCALPHA)
+                    stamp.fill(color + (alpha,))
+                    stamps.append(stamp)
+        return stamps
+
+    def clear(self):
+        self.count = 0
 
     def add_confetti(self, x, y, count=60):
-        for _ in range(count):
-            self.particles.append(ConfettiParticle(x, y))
+        count = min(count, self.capacity - self.count)
+        new = slice(self.count, self.count + count)
+        angle = self.rng.uniform(0, 2 * math.pi, count)
+        speed = self.rng.uniform(2, 5, count)
+        self.x[new] = x
+        self.y[new] = y
+        self.vx[new] = np.cos(angle) * speed
+        self.vy[new] = np.sin(angle) * speed
+        self.age[new] = 0
+        self.lifetime[new] = self.rng.integers(20, 41, count)
+        self.size[new] = self.rng.integers(CONFETTI_MIN_SIZE, CONFETTI_MAX_SIZE + 1, count)
+        self.color[new] = self.rng.integers(0, len(CONFETTI_COLORS), count)
+        self.count += count
 
     def update(self):
-        self.particles = [p for p in self.particles if p.update()]
+        n = self.count
+        if not n:
+            return
+        self.x[:n] += self.vx[:n]
+        self.y[:n] += self.vy[:n]
+        self.vx[:n] *= 0.95
+        self.vy[:n] += 0.25
+        self.age[:n] += 1
+
+        # Compact the survivors to the front of the arrays
+        alive = np.flatnonzero(self.age[:n] < self.lifetime[:n])
+        if len(alive) < n:
+            for array in (
+                self.x, self.y, self.vx, self.vy, self.age, self.lifetime, self.size, self.color
+            ):
+                array[: len(alive)] = array[alive]
+            self.count = len(alive)
+
+    def draw(self, offset_x=0, offset_y=0, surface=None, scale=1):
+        # Particles live in level pixels; the offset is the camera position
+        # and scale the render scale of the surface
+        n = self.count
+        if not n:
+            return
+        if self.stamps is None:
+            self.stamps = self.make_stamps()
+        alpha = 255 - (255 * self.age[:n]) // self.lifetime[:n]
+        level = alpha * (CONFETTI_ALPHA_LEVELS - 1) // 255
+        sizes = CONFETTI_MAX_SIZE - CONFETTI_MIN_SIZE + 1
+        index = (
+            self.color[:n] * sizes + self.size[:n] - CONFETTI_MIN_SIZE
+        ) * CONFETTI_ALPHA_LEVELS + level
+        stamps = self.stamps
+        (screen if surface is None else surface).blits(
+            [
+                (stamps[i], (x, y))
+                for i, x, y in zip(
+                    index.tolist(),
+                    ((self.x[:n] - offset_x) * scale).astype(np.int32).tolist(),
+                    ((self.y[:n] - offset_y) * scale).astype(np.int32).tolist(),
+                )
+            ],
+            doreturn=False,
+        )
 
-    def draw(self):
-        for p in self.particles:
-            p.draw()
+    def bounds(self, offset_x=0, offset_y=0):
+        n = self.count
+        if not n:
+            return None
+        left = int(self.x[:n].min())
+        top = int(self.y[:n].min())
+        right = int((self.x[:n] + self.size[:n]).max()) + 1
+        bottom = int((self.y[:n] + self.size[:n]).max()) + 1
+        return pygame.Rect(left - offset_x, top - offset_y, right - left, bottom - top)
 
 
 # Add to game initialization
 confetti = ConfettiManager()
 
 
-class CyberPacman:
-    def __init__(self):
-        self.reset_game()
-
-    def reset_state(self):
-        self.x = 12 * CELL_SIZE + CELL_SIZE // 2
-        self.y = 7 * CELL_SIZE + CELL_SIZE // 2
-        self.speed = CELL_SIZE // 4
-        self.direction = 0  # 0=Right, 1=Down, 2=Left, 3=Up
+def draw_pacman_shape(surface, center, radius, direction, mouth_open, power_mode):
+    x, y = center
+    angles = {
+        0: (mouth_open, 2 * math.pi - mouth_open),
+        3: (math.pi / 2 + mouth_open, math.pi / 2 - mouth_open),
+        2: (math.pi + mouth_open, math.pi - mouth_open),
+        1: (-math.pi / 2 + mouth_open, -math.pi / 2 - mouth_open),
+    }
+    pygame.draw.circle(surface, DARK_BG, (x, y), radius)
+    pygame.draw.arc(
+        surface,
+        (255, 255, 0),
+        (x - radius, y - radius, radius * 2, radius * 2),
+        *angles[direction],
+        radius,
+    )
+    if power_mode:
+        pygame.draw.circle(surface, CYBER_BLUE, (x, y), radius, 3)
+
+
+def draw_ghost_shape(surface, center, radius, color, wave_angle):
+    x, y = center
+
+    # Draw main body
+    pygame.draw.circle(surface, color, (x, y), radius)
+
+    # Draw eyes
+    eye_offset = radius // 2
+    eye_size = radius // 3
+    pupil_size = radius // 6
+    for eye_x in (x - eye_offset, x + eye_offset):
+        pygame.draw.circle(surface, (255, 255, 255), (eye_x, y - eye_offset // 2), eye_size)
+        pygame.draw.circle(surface, (0, 0, 200), (eye_x, y - eye_offset // 2), pupil_size)
+
+    # Draw wavy bottom effect
+    points = []
+    for i in range(5):
+        offset = math.sin(i * math.pi / 2 + wave_angle) * 3
+        points.append((x - radius + i * radius // 2, y + radius + offset))
+    pygame.draw.polygon(surface, color, points)
+
+
+class SpriteAtlas:
+    """Every pacman and ghost animation frame, drawn once and blitted after.
+
+    Pacman has PACMAN_PHASES mouth openings per direction, with and without
+    the power ring. Ghosts have GHOST_PHASES skirt waves for each body color,
+    including the blue flee and white flash variants. The frames are packed
+    into one sheet that is saved under SPRITE_CACHE_DIR, and reloaded from
+    there on the next start when the sprite settings still match. Frames are
+    size pixels square: drawn at CELL_SIZE, then scaled down for reduced
+    render scales.
+    """
+
+    def __init__(self, ghost_colors=None, size=CELL_SIZE):
+        if ghost_colors is None:
+            ghost_colors = list(engine.GHOST_COLORS)
+            ghost_colors += [FLEE_COLOR, FLASH_COLOR]
         self.radius = CELL_SIZE // 2 - 4
-        self.power_mode = False
-        self.power_timer = 0
-
-    def reset_game(self):
-        self.reset_state()
-        self.lives = 3
-        self.score = 0
-
-    def move(self, dx, dy, current_maze):
-        new_x = self.x + dx
-        new_y = self.y + dy
-
-        current_cell_x = int(self.x // CELL_SIZE)
-        current_cell_y = int(self.y // CELL_SIZE)
-
-        target_cell_x = current_cell_x
-        target_cell_y = current_cell_y
-
-        if dx > 0:
-            target_cell_x = current_cell_x + 1
-        elif dx < 0:
-            target_cell_x = current_cell_x - 1
-        elif dy > 0:
-            target_cell_y = current_cell_y + 1
-        elif dy < 0:
-            target_cell_y = current_cell_y - 1
-
-        current_cell_valid = (
-            0 <= current_cell_x < 25
-            and 0 <= current_cell_y < 15
-            and current_maze[current_cell_y][current_cell_x] == 0
+        self.size = size
+        self.keys = [
+            ("pacman", direction, phase, power)
+            for direction in range(4)
+            for phase in range(PACMAN_PHASES)
+            for power in (False, True)
+        ]
+        self.keys += [
+            ("ghost", tuple(color), phase)
+            for color in ghost_colors
+            for phase in range(GHOST_PHASES)
+        ]
+        self.sprites = {}
+        if not self.load():
+            for key in self.keys:
+                self.sprites[key] = self.render(key)
+            self.save()
+
+    def cache_path(self):
+        settings = (SPRITE_CACHE_VERSION, CELL_SIZE, self.radius, DARK_BG, CYBER_BLUE, self.keys)
+        if self.size != CELL_SIZE:
+            settings += (self.size,)
+        digest = hashlib.sha1(repr(settings).encode()).hexdigest()[:16]
+        return os.path.join(SPRITE_CACHE_DIR, f"sprites-{digest}.png")
+
+    def load(self):
+        try:
+            sheet = pygame.image.load(self.cache_path()).convert_alpha()
+        except (pygame.error, FileNotFoundError):
+            return False
+        size = self.size
+        if sheet.get_size() != (size * len(self.keys), size):
+            return False
+        for index, key in enumerate(self.keys):
+            self.sprites[key] = sheet.subsurface((index * size, 0, size, size))
+        return True
+
+    def save(self):
+        sheet = pygame.Surface((self.size * len(self.keys), self.size), SRCALPHA)
+        for index, key in enumerate(self.keys):
+            sheet.blit(self.sprites[key], (index * self.size, 0))
+        try:
+            os.makedirs(SPRITE_CACHE_DIR, exist_ok=True)
+            pygame.image.save(sheet, self.cache_path())
+        except (pygame.error, OSError):
+            pass  # The cache is only a startup shortcut
+
+    def render(self, key):
+        sprite = pygame.Surface((CELL_SIZE, CELL_SIZE), SRCALPHA)
+        center = (CELL_SIZE // 2, CELL_SIZE // 2)
+        if key[0] == "pacman":
+            _, direction, phase, power = key
+            mouth_open = 0.3 + 0.2 * math.sin(2 * math.pi * phase / PACMAN_PHASES)
+            draw_pacman_shape(sprite, center, self.radius, direction, mouth_open, power)
+        else:
+            _, color, phase = key
+            wave_angle = 2 * math.pi * phase / GHOST_PHASES
+            draw_ghost_shape(sprite, center, self.radius, color, wave_angle)
+        if self.size != CELL_SIZE:
+            sprite = pygame.transform.smoothscale(sprite, (self.size, self.size))
+        return sprite.convert_alpha()
+
+    def get(self, key):
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            # Colors outside the prebuilt set are drawn on first use
+            sprite = self.sprites[key] = self.render(key)
+        return sprite
+
+    def pacman(self, direction, power_mode, time):
+        # Same cycle as the old 0.3 + 0.2 * sin(time * 0.01) mouth
+        phase = int(time * 0.01 / (2 * math.pi) * PACMAN_PHASES) % PACMAN_PHASES
+        return self.get(("pacman", direction, phase, power_mode))
+
+    def ghost(self, color, time):
+        # Same cycle as the old sin(... + time * 0.005) skirt
+        phase = int(time * 0.005 / (2 * math.pi) * GHOST_PHASES) % GHOST_PHASES
+        return self.get(("ghost", tuple(color), phase))
+
+
+sprite_atlases = {}  # by sprite size
+
+
+def get_sprite_atlas(size=CELL_SIZE):
+    atlas = sprite_atlases.get(size)
+    if atlas is None:
+        atlas = sprite_atlases[size] = SpriteAtlas(size=size)
+    return atlas
+
+
+# Entities are drawn at (x, y), which the game loop interpolates between the
+# last two simulation ticks, and animate on game time rather than wall time.
+# surface and atlas default to the window and the full-size sprites
+
+
+class CyberPacman(engine.CyberPacman):
+    def bounds(self, x, y):
+        size = self.radius * 2 + 4
+        return pygame.Rect(x - self.radius - 2, y - self.radius - 2, size, size)
+
+    def draw(self, x, y, time, surface=None, atlas=None):
+        atlas = get_sprite_atlas() if atlas is None else atlas
+        sprite = atlas.pacman(self.direction, self.power_mode, time)
+        surface = screen if surface is None else surface
+        surface.blit(sprite, (x - atlas.size // 2, y - atlas.size // 2))
+
+
+class Ghost(engine.Ghost):
+    def bounds(self, x, y):
+        # The wavy skirt reaches a few pixels below the body circle
+        size = self.radius * 2 + 4
+        return pygame.Rect(x - self.radius - 2, y - self.radius - 2, size, size + 6)
+
+    def draw(self, x, y, time, surface=None, atlas=None):
+        color = FLEE_COLOR if self.flee else self.color
+        if self.flee and time % 200 < 100:
+            color = FLASH_COLOR  # Flash white when fleeing
+        atlas = get_sprite_atlas() if atlas is None else atlas
+        sprite = atlas.ghost(color, time)
+        surface = screen if surface is None else surface
+        surface.blit(sprite, (x - atlas.size // 2, y - atlas.size // 2))
+
+
+def draw_swarm(flee, color, xs, ys, time, surface=None, atlas=None):
+    # Ghosts share four body sprites plus the flee frame, so the whole swarm
+    # (the visible part of it: flee flags, colors and screen positions) is
+    # one blits() call
+    atlas = get_sprite_atlas() if atlas is None else atlas
+    flee_color = FLASH_COLOR if time % 200 < 100 else FLEE_COLOR
+    sprites = [atlas.ghost(ghost_color, time) for ghost_color in engine.GHOST_COLORS]
+    sprites.append(atlas.ghost(flee_color, time))
+    frame = np.where(flee, len(sprites) - 1, color)
+    (screen if surface is None else surface).blits(
+        [
+            (sprites[i], (x, y))
+            for i, x, y in zip(
+                frame.tolist(),
+                (xs - atlas.size // 2).tolist(),
+                (ys - atlas.size // 2).tolist(),
+            )
+        ],
+        doreturn=False,
+    )
+
+
+def swarm_bounds(xs, ys):
+    if not len(xs):
+        return None
+    left = int(xs.min()) - CELL_SIZE // 2
+    top = int(ys.min()) - CELL_SIZE // 2
+    right = int(xs.max()) + CELL_SIZE // 2
+    bottom = int(ys.max()) + CELL_SIZE // 2
+    return pygame.Rect(left, top, right - left, bottom - top)
+
+
+def draw_maze(current_maze, surface=None, left=0, top=0, columns=None, rows=None):
+    # The walls of the columns x rows cells from (left, top), that cell at the
+    # surface's top left corner; the whole maze by default
+    surface = screen if surface is None else surface
+    columns = current_maze.width if columns is None else columns
+    rows = current_maze.height if rows is None else rows
+    for y, row in enumerate(current_maze.rows[top : top + rows]):
+        for x, cell in enumerate(row[left : left + columns]):
+            if cell == 1:
+                rect = pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
+                pygame.draw.rect(surface, CYBER_BLUE, rect.inflate(-4, -4))
+                pygame.draw.rect(surface, DARK_BG, rect.inflate(-8, -8))
+
+
+def draw_dot(x, y, dot, surface=None, left=0, top=0):
+    surface = screen if surface is None else surface
+    center = ((x - left) * CELL_SIZE + CELL_SIZE // 2, (y - top) * CELL_SIZE + CELL_SIZE // 2)
+    if dot == 1:
+        pygame.draw.circle(surface, DOT_COLOR, center, 4)
+    elif dot == 2:
+        pygame.draw.circle(surface, NEON_PINK, center, 8)
+
+
+def draw_dots(current_dots, surface=None):
+    # current_dots: (x, y, dot) triples, as from GameState.iter_dots()
+    for x, y, dot in current_dots:
+        draw_dot(x, y, dot, surface)
+
+
+class Camera:
+    """Level pixel shown at the top left of the play area.
+
+    follow() centres the view on a point (pacman), clamped to the level edges,
+    so levels no bigger than the play area never scroll. visible() is the
+    culling test for sprites.
+    """
+
+    def __init__(self, width=PLAY_AREA[2], height=PLAY_AREA[3]):
+        self.width = width
+        self.height = height
+        self.x = 0
+        self.y = 0
+
+    def follow(self, x, y, current_maze):
+        level_width = current_maze.width * CELL_SIZE
+        level_height = current_maze.height * CELL_SIZE
+        self.x = int(min(max(x - self.width // 2, 0), max(level_width - self.width, 0)))
+        self.y = int(min(max(y - self.height // 2, 0), max(level_height - self.height, 0)))
+
+    def visible(self, x, y, margin=CELL_SIZE):
+        # Works on NumPy arrays of positions too
+        return (
+            (self.x - margin <= x)
+            & (x < self.x + self.width + margin)
+            & (self.y - margin <= y)
+            & (y < self.y + self.height + margin)
         )
 
-        target_cell_valid = (
-            0 <= target_cell_x < 25
-            and 0 <= target_cell_y < 15
-            and current_maze[target_cell_y][target_cell_x] == 0
-        )
 
-        if dx != 0:
-            new_y = current_cell_y * CELL_SIZE + CELL_SIZE // 2
-            valid = current_cell_valid and target_cell_valid
+class LevelCompositor:
+    """Pre-rendered maze and dots for the play field, in chunks.
+
+    The level is cut into chunks of CHUNK_CELLS x CHUNK_CELLS cells, each
+    drawn (walls plus remaining dots) the first time it comes into view and
+    kept in an LRU of MAX_CHUNKS. board is the screen-sized background:
+    scroll() rebuilds it from the visible chunks only when the camera moved,
+    so a frame costs one blit of the board however large the level is.
+    Eating a dot clears that cell in its chunk and on the board.
+
+    With a render scale below 1 the chunks are scaled down once when drawn
+    and the board is the window size times the scale.
+    """
+
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.board = None
+        self.chunks = collections.OrderedDict()
+        self.dots = None
+        self.view = None  # camera position the board was composed for
+        self.play_area = self.scaled(*PLAY_AREA)
+
+    def scaled(self, left, top, width, height):
+        # The board pixels covering a rect given in window pixels
+        x, y = math.floor(left * self.scale), math.floor(top * self.scale)
+        right = math.ceil((left + width) * self.scale)
+        bottom = math.ceil((top + height) * self.scale)
+        return pygame.Rect(x, y, right - x, bottom - y)
+
+    def load(self, current_maze, current_dots):
+        self.maze = current_maze
+        self.dots = bytearray(current_maze.width * current_maze.height)
+        for x, y, dot in current_dots:
+            self.dots[y * current_maze.width + x] = dot
+        self.chunks.clear()
+        if self.board is None:
+            self.board = pygame.Surface(self.scaled(0, 0, WIDTH, HEIGHT).size).convert()
+        self.board.fill(DARK_BG)
+        self.view = None
+
+    def chunk(self, chunk_x, chunk_y):
+        key = (chunk_x, chunk_y)
+        surface = self.chunks.get(key)
+        if surface is None:
+            surface = self.chunks[key] = self.render_chunk(chunk_x, chunk_y)
+            if len(self.chunks) > MAX_CHUNKS:
+                self.chunks.popitem(last=False)
         else:
-            new_x = current_cell_x * CELL_SIZE + CELL_SIZE // 2
-            valid = current_cell_valid and target_cell_valid
-
-        if valid:
-            self.x = new_x
-            self.y = new_y
+            self.chunks.move_to_end(key)
+        return surface
+
+    def render_chunk(self, chunk_x, chunk_y):
+        size = CHUNK_CELLS * CELL_SIZE
+        surface = pygame.Surface((size, size)).convert()
+        surface.fill(DARK_BG)
+        left, top = chunk_x * CHUNK_CELLS, chunk_y * CHUNK_CELLS
+        draw_maze(self.maze, surface, left, top, CHUNK_CELLS, CHUNK_CELLS)
+        width = self.maze.width
+        for y in range(top, min(top + CHUNK_CELLS, self.maze.height)):
+            for x in range(left, min(left + CHUNK_CELLS, width)):
+                if self.dots[y * width + x]:
+                    draw_dot(x, y, self.dots[y * width + x], surface, left, top)
+        if self.scale != 1:
+            surface = pygame.transform.smoothscale(surface, self.scaled(0, 0, size, size).size)
+        return surface
+
+    def scroll(self, camera):
+        # Recompose the board if the camera moved; True when it did
+        if self.view == (camera.x, camera.y):
+            return False
+        self.view = (camera.x, camera.y)
+        size = CHUNK_CELLS * CELL_SIZE
+        last_x = (self.maze.width - 1) // CHUNK_CELLS
+        last_y = (self.maze.height - 1) // CHUNK_CELLS
+        self.board.set_clip(self.play_area)
+        self.board.fill(DARK_BG)
+        last_y = min((camera.y + camera.height - 1) // size, last_y)
+        last_x = min((camera.x + camera.width - 1) // size, last_x)
+        for chunk_y in range(camera.y // size, last_y + 1):
+            for chunk_x in range(camera.x // size, last_x + 1):
+                self.board.blit(
+                    self.chunk(chunk_x, chunk_y),
+                    self.scaled(chunk_x * size - camera.x, chunk_y * size - camera.y, 0, 0),
+                )
+        self.board.set_clip(None)
+        return True
+
+    def erase_dot(self, x, y):
+        # Returns the board rect that changed, None if it is out of view
+        self.dots[y * self.maze.width + x] = 0
+        surface = self.chunks.get((x // CHUNK_CELLS, y // CHUNK_CELLS))
+        if surface is not None:
+            left, top = (x % CHUNK_CELLS) * CELL_SIZE, (y % CHUNK_CELLS) * CELL_SIZE
+            surface.fill(DARK_BG, self.scaled(left, top, CELL_SIZE, CELL_SIZE))
+        if self.view is None:
+            return None
+        cell = self.scaled(
+            x * CELL_SIZE - self.view[0], y * CELL_SIZE - self.view[1], CELL_SIZE, CELL_SIZE
+        ).clip(self.play_area)
+        if not cell:
+            return None
+        self.board.fill(DARK_BG, cell)
+        return cell
+
+
+class DirtyRects:
+    """Pushes only the parts of the screen that changed since the last frame.
+
+    Every frame, restore() paints the board back over whatever was drawn in
+    the previous frame (plus any board cells marked as changed), then each
+    sprite drawn on top is registered with add(). present() updates the old
+    and new rectangles only. invalidate() forces one full blit and flip, which
+    is used for level loads and for overlays such as game over.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.full = True
+        self.drawn = []
+        self.changed = []
+        self.erased = []
+
+    def invalidate(self):
+        self.full = True
+
+    def mark(self, rect):
+        self.changed.append(pygame.Rect(rect))
+
+    def add(self, rect):
+        if rect is not None:
+            self.drawn.append(pygame.Rect(rect))
+
+    def restore(self, background, surface=None):
+        surface = screen if surface is None else surface
+        if self.full or not self.enabled:
+            surface.blit(background, (0, 0))
+            self.erased = []
         else:
-            cell_left = current_cell_x * CELL_SIZE
-            cell_right = (current_cell_x + 1) * CELL_SIZE
-            cell_top = current_cell_y * CELL_SIZE
-            cell_bottom = (current_cell_y + 1) * CELL_SIZE
-
-            if dx > 0:
-                self.x = min(new_x, cell_right - self.radius - 1)
-            elif dx < 0:
-                self.x = max(new_x, cell_left + self.radius)
-            elif dy > 0:
-                self.y = min(new_y, cell_bottom - self.radius - 1)
-            elif dy < 0:
-                self.y = max(new_y, cell_top + self.radius)
-
-    def draw(self):
-        mouth_open = 0.3 + 0.2 * math.sin(pygame.time.get_ticks() * 0.01)
-        angles = {
-            0: (mouth_open, 2 * math.pi - mouth_open),
-            3: (math.pi / 2 + mouth_open, math.pi / 2 - mouth_open),
-            2: (math.pi + mouth_open, math.pi - mouth_open),
-            1: (-math.pi / 2 + mouth_open, -math.pi / 2 - mouth_open),
-        }
-        pygame.draw.circle(screen, DARK_BG, (self.x, self.y), self.radius)
-        pygame.draw.arc(
-            screen,
-            (255, 255, 0),
-            (
-                self.x - self.radius,
-                self.y - self.radius,
-                self.radius * 2,
-                self.radius * 2,
-            ),
-            *angles[self.direction],
-            self.radius,
-        )
-        if self.power_mode:
-            pygame.draw.circle(screen, CYBER_BLUE, (self.x, self.y), self.radius, 3)
-            self.speed = 3 * CELL_SIZE / 16
-        if not self.power_mode:
-            self.speed = CELL_SIZE / 8
-
-
-# ... [Previous code remains the same until Ghost class] ...
-
-
-class Ghost:
-    def __init__(self, color, x, y):
-        self.reset(color, x, y)
-
-    def reset(self, color, x, y):
-        self.x = x * CELL_SIZE + CELL_SIZE // 2
-        self.y = y * CELL_SIZE + CELL_SIZE // 2
-        self.color = color
-        self.direction = random.choice([0, 1, 2, 3])
-        self.desired_direction = self.direction
-        self.speed = CELL_SIZE // 16
-        self.flee = False
-        self.base_color = color
-        self.radius = CELL_SIZE // 2 - 4
-
-    def get_valid_directions(self, current_maze):
-        current_cell_x = int(self.x // CELL_SIZE)
-        current_cell_y = int(self.y // CELL_SIZE)
-        directions = []
-
-        # Check all four directions
-        for direction in [0, 1, 2, 3]:
-            dx, dy = [(1, 0), (0, 1), (-1, 0), (0, -1)][direction]
-            new_x = current_cell_x + dx
-            new_y = current_cell_y + dy
-
-            if 0 <= new_x < 25 and 0 <= new_y < 15:
-                if current_maze[new_y][new_x] == 0:
-                    directions.append(direction)
-
-        return directions
-
-    def is_centered(self):
-        return (self.x % CELL_SIZE) == CELL_SIZE // 2 and (
-            self.y % CELL_SIZE
-        ) == CELL_SIZE // 2
-
-    def move(self, current_maze):
-        if self.is_centered():
-            current_cell_x = int(self.x // CELL_SIZE)
-            current_cell_y = int(self.y // CELL_SIZE)
-
-            # Get all valid directions (non-wall paths)
-            valid_directions = []
-            for direction in [0, 1, 2, 3]:
-                dx, dy = [(1, 0), (0, 1), (-1, 0), (0, -1)][direction]
-                test_x = current_cell_x + dx
-                test_y = current_cell_y + dy
-                if 0 <= test_x < 25 and 0 <= test_y < 15:
-                    if current_maze[test_y][test_x] == 0:
-                        valid_directions.append(direction)
-
-            # Remove opposite direction initially
-            opposite_dir = (self.direction + 2) % 4
-            filtered_directions = [d for d in valid_directions if d != opposite_dir]
-
-            # Safety check: if no directions left but opposite is valid
-            if not filtered_directions and opposite_dir in valid_directions:
-                filtered_directions = [opposite_dir]
-
-            # Final fallback to prevent empty list
-            if not filtered_directions:
-                filtered_directions = valid_directions.copy()
-
-            # Choose new direction only if options exist
-            if filtered_directions:
-                # 25% chance to keep current direction if possible
-                if self.direction in filtered_directions and random.random() < 0.25:
-                    new_direction = self.direction
-                else:
-                    new_direction = random.choice(filtered_directions)
-
-                self.direction = new_direction
-
-        # Rest of movement code remains the same
-        dx_movement, dy_movement = [(1, 0), (0, 1), (-1, 0), (0, -1)][self.direction]
-        new_x = self.x + dx_movement * self.speed
-        new_y = self.y + dy_movement * self.speed
-
-        # Axis locking
-        current_cell_x = int(self.x // CELL_SIZE)
-        current_cell_y = int(self.y // CELL_SIZE)
-        if dx_movement != 0:
-            new_y = current_cell_y * CELL_SIZE + CELL_SIZE // 2
+            self.erased = self.drawn + self.changed
+            for rect in self.erased:
+                surface.blit(background, rect, rect)
+        self.drawn = []
+        self.changed = []
+
+    def present(self):
+        if self.full or not self.enabled:
+            pygame.display.flip()
         else:
-            new_x = current_cell_x * CELL_SIZE + CELL_SIZE // 2
-
-        # Final position validation
-        target_cell_x = int(new_x // CELL_SIZE)
-        target_cell_y = int(new_y // CELL_SIZE)
-        if (
-            0 <= target_cell_x < 25
-            and 0 <= target_cell_y < 15
-            and current_maze[target_cell_y][target_cell_x] == 0
-        ):
-            self.x = new_x
-            self.y = new_y
+            pygame.display.update(self.erased + self.drawn)
+        self.full = False
+
+
+def read_action():
+    keys = pygame.key.get_pressed()
+    action = None
+    if keys[pygame.K_LEFT]:
+        action = 2
+    if keys[pygame.K_RIGHT]:
+        action = 0
+    if keys[pygame.K_UP]:
+        action = 3
+    if keys[pygame.K_DOWN]:
+        action = 1
+    return action
+
+
+def draw_end_screen(title, button_text, button_text_x, score, restart_button):
+    screen.fill((0, 0, 0, 200), special_flags=pygame.BLEND_RGBA_MULT)
+    font = get_default_font(72)
+    text = font.render(title, True, NEON_PINK)
+    screen.blit(text, (WIDTH // 2 - text.get_width() // 2, HEIGHT // 2 - 100))
+    screen.blit(
+        font.render(f"FINAL SCORE: {score}", True, CYBER_BLUE),
+        (WIDTH // 2 - 150, HEIGHT // 2 - 50),
+    )
+    pygame.draw.rect(screen, NEON_PINK, restart_button)
+    screen.blit(
+        font.render(button_text, True, DARK_BG),
+        (restart_button.x + button_text_x, restart_button.y + 10),
+    )
+
+
+def draw_profiler_overlay(profiler):
+    # Frame-time graph of the last PROFILER_GRAPH_FRAMES frames, the p99 and
+    # the phases that cost the most, in a panel at the top right
+    panel = profiler_panel()
+    panel.fill((0, 0, 20, 210))
+    times = profiler.recent(PROFILER_GRAPH_FRAMES)
+    budget = 1000 / RENDER_FPS
+    graph_top, graph_height = 24, 60
+    scale = graph_height / (2 * budget)  # the graph tops out at two frame budgets
+
+    budget_y = graph_top + graph_height - budget * scale
+    pygame.draw.line(panel, NEON_PINK, (0, budget_y), (PROFILER_PANEL_WIDTH, budget_y))
+    if len(times) > 1:
+        step = PROFILER_PANEL_WIDTH / PROFILER_GRAPH_FRAMES
+        heights = np.minimum(times * scale, graph_height)
+        points = [
+            (i * step, graph_top + graph_height - h) for i, h in enumerate(heights.tolist())
+        ]
+        pygame.draw.lines(panel, TERMINAL_GREEN, False, points)
+
+    last = float(times[-1]) if len(times) else 0.0
+    p99 = profiler.percentile(99, PROFILER_GRAPH_FRAMES)
+    panel.blit(profiler_text(f"frame {last:5.1f} ms   p99 {p99:5.1f} ms", CYBER_BLUE), (6, 4))
+    y = graph_top + graph_height + 4
+    for name, ms in profiler.phase_means(PROFILER_GRAPH_FRAMES)[:PROFILER_TOP_PHASES]:
+        panel.blit(profiler_text(name, DOT_COLOR), (6, y))
+        panel.blit(profiler_text(f"{ms:6.2f} ms", DOT_COLOR), (180, y))
+        y += 16
+    return screen.blit(panel, (WIDTH - PROFILER_PANEL_WIDTH - 10, 10))
+
+
+class FixedTimestep:
+    """Turns real frame times into whole simulation ticks.
+
+    advance(ms) banks the time since the last frame and returns how many
+    ticks to run, at most MAX_CATCHUP_TICKS so a stall is dropped instead of
+    replayed in a burst. alpha is how far into the next tick the frame is
+    drawn, for interpolating positions.
+    """
+
+    def __init__(self, ticks_per_second=engine.TICKS_PER_SECOND):
+        self.tick_ms = 1000 / ticks_per_second
+        self.accumulator = 0.0
+
+    def advance(self, elapsed_ms):
+        self.accumulator += elapsed_ms
+        ticks = int(self.accumulator // self.tick_ms)
+        if ticks > MAX_CATCHUP_TICKS:
+            ticks = MAX_CATCHUP_TICKS
+            self.accumulator %= self.tick_ms
         else:
-            self.x = current_cell_x * CELL_SIZE + CELL_SIZE // 2
-            self.y = current_cell_y * CELL_SIZE + CELL_SIZE // 2
-
-    def draw(self):
-        # Main ghost body
-        color = (0, 0, 255) if self.flee else self.color
-        if self.flee and pygame.time.get_ticks() % 200 < 100:
-            color = (255, 255, 255)  # Flash white when fleeing
-
-        # Draw main body
-        pygame.draw.circle(screen, color, (self.x, self.y), self.radius)
-
-        # Draw eyes
-        eye_offset = self.radius // 2
-        eye_size = self.radius // 3
-        pupil_size = self.radius // 6
-
-        # Left eye
-        pygame.draw.circle(
-            screen,
-            (255, 255, 255),
-            (self.x - eye_offset, self.y - eye_offset // 2),
-            eye_size,
+            self.accumulator -= ticks * self.tick_ms
+        return ticks
+
+    @property
+    def alpha(self):
+        return self.accumulator / self.tick_ms
+
+
+def run_tick(game, action, compositor, tracker, recorder=None):
+    # One simulation tick plus the board updates its events call for; returns
+    # the positions from before the tick for interpolation
+    before = positions(game)
+    if game.done:
+        return before
+    if recorder is not None:
+        recorder.record(action)
+    for event in game.step(action):
+        if event[0] in ("dot", "pellet"):
+            cell = compositor.erase_dot(event[1], event[2])
+            if cell is not None:
+                tracker.mark(cell)
+        elif event[0] == "level":
+            compositor.load(game.maze, game.iter_dots())
+            tracker.invalidate()
+        elif event[0] == "ghost_eaten" and quality.confetti:
+            confetti.add_confetti(event[1], event[2])
+    return before
+
+
+def positions(game):
+    # Everything the renderer interpolates: pacman, the ghosts near enough to
+    # be drawn by index, then the swarm arrays
+    ghosts = {index: (ghost.x, ghost.y) for index, ghost in game.nearby_ghosts()}
+    swarm = getattr(game, "swarm", None)
+    if swarm is None:
+        return (game.pacman.x, game.pacman.y), ghosts, None
+    return (game.pacman.x, game.pacman.y), ghosts, (swarm.x.copy(), swarm.y.copy())
+
+
+def lerp(previous, current, alpha):
+    # Moves longer than a cell are respawns or level loads: snap to them
+    if abs(current - previous) > CELL_SIZE:
+        return current
+    return previous + (current - previous) * alpha
+
+
+def game_loop(
+    starting_level=0,
+    dirty_rects=False,
+    ghost_ai="random",
+    swarm=0,
+    fps=RENDER_FPS,
+    fast_forward=False,
+    seed=None,
+    record=None,
+    max_frames=None,
+    profile=None,
+    profile_frames=DEFAULT_FRAMES,
+    level_list=None,
+    capture=None,
+):
+    init_display()
+    level_list = engine.get_levels() if level_list is None else level_list
+    # Seeded even when no seed is given, so any game can be recorded
+    seed = random.getrandbits(63) if seed is None else seed
+    if swarm:
+        game = SwarmGameState(
+            starting_level,
+            seed=seed,
+            pacman_cls=CyberPacman,
+            ghost_count=swarm,
+            level_list=level_list,
         )
-        pygame.draw.circle(
-            screen,
-            (0, 0, 200),
-            (self.x - eye_offset, self.y - eye_offset // 2),
-            pupil_size,
+    else:
+        # Levels bigger than the view scroll; ghosts that cannot be on screen
+        # then take the engine's cheap whole-cell moves. The radius leaves a
+        # few cells over the view, as a sleeping ghost only wakes on its turn
+        fits = all(
+            level.width <= VIEW_COLUMNS and level.height <= VIEW_ROWS for level in level_list
         )
-
-        # Right eye
-        pygame.draw.circle(
-            screen,
-            (255, 255, 255),
-            (self.x + eye_offset, self.y - eye_offset // 2),
-            eye_size,
-        )
-        pygame.draw.circle(
-            screen,
-            (0, 0, 200),
-            (self.x + eye_offset, self.y - eye_offset // 2),
-            pupil_size,
+        game = GameState(
+            starting_level,
+            seed=seed,
+            pacman_cls=CyberPacman,
+            ghost_cls=Ghost,
+            ghost_ai=ghost_ai,
+            level_list=level_list,
+            active_radius=None if fits else max(VIEW_COLUMNS, VIEW_ROWS) + 3,
         )
-
-        # Draw wavy bottom effect
-        points = []
-        for i in range(5):
-            angle = i * math.pi / 2 + pygame.time.get_ticks() * 0.005
-            offset = math.sin(angle) * 3
-            points.append(
-                (
-                    self.x - self.radius + i * self.radius // 2,
-                    self.y + self.radius + offset,
-                )
-            )
-        pygame.draw.polygon(screen, color, points)
-
-
-def draw_maze(current_maze):
-    for y, row in enumerate(current_maze):
-        for x, cell in enumerate(row):
-            if cell == 1:
-                rect = pygame.Rect(x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE)
-                pygame.draw.rect(screen, CYBER_BLUE, rect.inflate(-4, -4))
-                pygame.draw.rect(screen, DARK_BG, rect.inflate(-8, -8))
-
-
-def draw_dots(current_dots):
-    for y, row in enumerate(current_dots):
-        for x, dot in enumerate(row):
-            if dot == 1:
-                pygame.draw.circle(
-                    screen,
-                    DOT_COLOR,
-                    (x * CELL_SIZE + CELL_SIZE // 2, y * CELL_SIZE + CELL_SIZE // 2),
-                    4,
-                )
-            elif dot == 2:
-                pygame.draw.circle(
-                    screen,
-                    NEON_PINK,
-                    (x * CELL_SIZE + CELL_SIZE // 2, y * CELL_SIZE + CELL_SIZE // 2),
-                    8,
-                )
-
-
-def level_select_menu():
-    selected_level = 0  # Default to first level
-    buttons = []
-
-    # Create level buttons
-    level_options = [("Level 1", 0), ("Level 2", 1), ("Level 3", 2)]
-
-    font = pygame.font.Font(None, 74)
-    title_text = font.render("SELECT LEVEL", True, NEON_PINK)
-
-    button_font = pygame.font.Font(None, 50)
-    y_pos = HEIGHT // 3
-
-    for option, level_num in level_options:
-        text = button_font.render(option, True, CYBER_BLUE)
-        button_rect = pygame.Rect(WIDTH // 2 - 150, y_pos, 300, 60)
-        buttons.append((button_rect, text, level_num))
-        y_pos += 100
-
+    # With record, the most recent game is written there when it ends or on quit
+    recorder = Recorder(game) if record else None
+    pacman = game.pacman
+
+    # With profile set ("" to only show the overlay), every frame is split
+    # into timed phases; F3 toggles the overlay, the session is saved on exit
+    profiler = NULL_PROFILER if profile is None else FrameProfiler(profile_frames)
+    show_profile = profiler.enabled
+    profiler.wrap(pacman, "move", "pacman move")
+    profiler.wrap(game, "move_ghosts", "ghost moves")
+    profiler.wrap(game, "collide_ghosts", "collisions")
+    profiler.wrap(game, "check_level_complete", "level check")
+    phase = profiler.phase
+
+    # Below full render scale the play field is drawn onto world, a smaller
+    # copy of the window, with sprites to match, and stretched over the
+    # window once per frame; the HUD and overlays are drawn after that
+    scale = quality.render_scale
+    compositor = LevelCompositor(scale)
+    compositor.load(game.maze, game.iter_dots())
+    world = screen if scale == 1 else compositor.board.copy()
+    atlas = get_sprite_atlas(compositor.scaled(0, 0, CELL_SIZE, CELL_SIZE).width)
+    camera = Camera()
+    tracker = DirtyRects(dirty_rects and scale == 1)
+    hud_font = get_default_font(36)
     running = True
-    while running:
-        screen.fill(DARK_BG)
-        screen.blit(title_text, (WIDTH // 2 - title_text.get_width() // 2, 50))
-
-        mouse_pos = pygame.mouse.get_pos()
-
-        for button_rect, text, level_num in buttons:
-            color = NEON_YELLOW if button_rect.collidepoint(mouse_pos) else NEON_PINK
-            pygame.draw.rect(screen, color, button_rect, border_radius=10)
-            screen.blit(
-                text,
-                (
-                    button_rect.centerx - text.get_width() // 2,
-                    button_rect.centery - text.get_height() // 2,
-                ),
-            )
-
-        pygame.display.flip()
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                for button_rect, _, level_num in buttons:
-                    if button_rect.collidepoint(event.pos):
-                        return level_num
-            if event.type == pygame.KEYDOWN:
-                if event.key in [pygame.K_1, pygame.K_KP1]:
-                    return 0
-                elif event.key in [pygame.K_2, pygame.K_KP2]:
-                    return 1
-                elif event.key in [pygame.K_3, pygame.K_KP3]:
-                    return 2
-                elif event.key == pygame.K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
-
-        clock.tick(FPS)
-
-
-def game_loop(starting_level=0):
-    pacman = CyberPacman()
-    current_level = starting_level
-    ghost_spawn = (12, 9)
-    ghosts = []
-    dots = []
-    power_pellets = []
-
-    def initialize_level():
-        nonlocal dots, power_pellets, ghosts
-        level_data = levels[current_level]
-        maze = level_data["maze"]
-        power_pellets = level_data["power_pellets"]
-
-        # Initialize dots
-        dots = [[1 if cell == 0 else 0 for cell in row] for row in maze]
-        for x, y in power_pellets:
-            dots[y][x] = 2
-
-        # Reset ghosts
-        ghosts = [
-            Ghost((255, 0, 0), 10, 5),
-            Ghost((0, 255, 0), 14, 5),
-            Ghost((255, 192, 203), 10, 9),
-            Ghost(NEON_PINK, 14, 9),
-        ]
-        pacman.reset_state()
-
-    initialize_level()
-    running = True
-    game_over = False
-    level_complete = False
-    victory = False
     restart_button = pygame.Rect(WIDTH // 2 - 100, HEIGHT // 2 + 50, 200, 50)
 
-    while running:
-        CyberUI.draw_hud(pacman.score, pacman.lives, current_level)
-        screen.fill(DARK_BG)
-        confetti.update()
-        confetti.draw()
-        for event in pygame.event.get():
+    # The simulation runs at TICKS_PER_SECOND whatever the frame rate; frames
+    # in between draw the entities part way between the last two ticks.
+    # Fast-forward (Tab) runs as many ticks as fit in each frame instead.
+    timestep = FixedTimestep()
+    game_time = 0  # ticks since the loop started, drives the animations
+    previous = positions(game)
+    frames = 0
+    clock.tick()
+
+    while running and frames != max_frames:
+        frames += 1
+        profiler.begin_frame(game.level)
+        with phase("clock tick"):
+            elapsed = clock.tick(fps)
+        with phase("events"):
+            events = pygame.event.get()
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
             if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
                 running = False
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_TAB:
+                fast_forward = not fast_forward
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                show_profile = profiler.enabled and not show_profile
             if event.type == pygame.MOUSEBUTTONDOWN:
-                if game_over and restart_button.collidepoint(event.pos):
-                    current_level = 0
-                    initialize_level()
-                    pacman.reset_game()
-                    game_over = False
-                elif victory and restart_button.collidepoint(event.pos):
-                    current_level = 0
-                    initialize_level()
-                    pacman.reset_game()
-                    victory = False
-
-        if not game_over and not victory and not level_complete:
-            keys = pygame.key.get_pressed()
-            if keys[pygame.K_LEFT]:
-                pacman.direction = 2
-            if keys[pygame.K_RIGHT]:
-                pacman.direction = 0
-            if keys[pygame.K_UP]:
-                pacman.direction = 3
-            if keys[pygame.K_DOWN]:
-                pacman.direction = 1
-
-            dx, dy = 0, 0
-            if pacman.direction == 0:
-                dx = pacman.speed
-            elif pacman.direction == 1:
-                dy = pacman.speed
-            elif pacman.direction == 2:
-                dx = -pacman.speed
+                if game.done and restart_button.collidepoint(event.pos):
+                    game.reset(0, seed=random.getrandbits(63))
+                    recorder = Recorder(game) if record else None
+                    compositor.load(game.maze, game.iter_dots())
+                    tracker.invalidate()
+                    previous = positions(game)
+
+        with phase("input"):
+            action = read_action()
+        with phase("simulation"):
+            if fast_forward:
+                deadline = pygame.time.get_ticks() + 1000 // (fps or FPS)
+                ticks = 0
+                while pygame.time.get_ticks() < deadline and not game.done:
+                    ticks += 1
+                    previous = run_tick(game, action, compositor, tracker, recorder)
+                alpha = 1.0
             else:
-                dy = -pacman.speed
-            pacman.move(dx, dy, levels[current_level]["maze"])
-
-            current_cell_x = int(pacman.x // CELL_SIZE)
-            current_cell_y = int(pacman.y // CELL_SIZE)
-            if dots[current_cell_y][current_cell_x]:
-                if dots[current_cell_y][current_cell_x] == 2:
-                    pacman.power_mode = True
-                    pacman.power_timer = pygame.time.get_ticks()
-                    for ghost in ghosts:
-                        ghost.flee = True
-                pacman.score += 100 if dots[current_cell_y][current_cell_x] == 2 else 10
-                dots[current_cell_y][current_cell_x] = 0
-
-            if (
-                pacman.power_mode
-                and pygame.time.get_ticks() - pacman.power_timer > 7000
-            ):
-                pacman.power_mode = False
-                for ghost in ghosts:
-                    ghost.flee = False
-
-            for ghost in ghosts:
-                ghost.move(levels[current_level]["maze"])
-
-            for ghost in ghosts:
-                distance = math.hypot(pacman.x - ghost.x, pacman.y - ghost.y)
-                if distance < CELL_SIZE // 2:
-                    if pacman.power_mode and ghost.flee:
-                        confetti.add_confetti(ghost.x, ghost.y)
-                        ghost.x = ghost_spawn[0] * CELL_SIZE + CELL_SIZE // 2
-                        ghost.y = ghost_spawn[1] * CELL_SIZE + CELL_SIZE // 2
-                        ghost.flee = False
-                        pacman.score += 200
-
-                    elif not pacman.power_mode and not ghost.flee:
-                        pacman.lives -= 1
-                        if pacman.lives <= 0:
-                            game_over = True
-                        else:
-                            pacman.reset_state()
-                        break
-
-            if not any(cell in row for row in dots for cell in (1, 2)):
-                if current_level < len(levels) - 1:
-                    current_level += 1
-                    initialize_level()
-                else:
-                    victory = True
-
-        draw_maze(levels[current_level]["maze"])
-        draw_dots(dots)
-        pacman.draw()
-        for ghost in ghosts:
-            ghost.draw()
+                ticks = timestep.advance(elapsed)
+                for _ in range(ticks):
+                    previous = run_tick(game, action, compositor, tracker, recorder)
+                alpha = timestep.alpha
+        game_time += ticks
+        if recorder is not None and game.done:
+            recorder.save(record, game)
+            recorder = None
+        with phase("confetti update"):
+            for _ in range(min(ticks, MAX_CATCHUP_TICKS)):
+                confetti.update()
+
+        time = (game_time + alpha) * 1000 / engine.TICKS_PER_SECOND
+        current = positions(game)
+        (previous_x, previous_y), (x, y) = previous[0], current[0]
+        pacman_x, pacman_y = lerp(previous_x, x, alpha), lerp(previous_y, y, alpha)
+
+        # The camera follows pacman; only what is in view gets drawn, in
+        # world coordinates (level pixels minus the camera position, times
+        # the render scale)
+        camera.follow(pacman_x, pacman_y, game.maze)
+        left, top = camera.x, camera.y
+
+        # The board replaces the full-screen fill and the maze/dot draw calls
+        with phase("board"):
+            if compositor.scroll(camera):
+                tracker.invalidate()
+            tracker.restore(compositor.board, world)
+        world.set_clip(compositor.play_area)
+        with phase("confetti draw"):
+            confetti.draw(left, top, world, scale)
+            tracker.add(confetti.bounds(left, top))
+        with phase("pacman draw"):
+            x, y = (pacman_x - left) * scale, (pacman_y - top) * scale
+            pacman.draw(x, y, time, world, atlas)
+            tracker.add(pacman.bounds(x, y))
+        with phase("ghost draw"):
+            for index, (x, y) in current[1].items():
+                if camera.visible(x, y):
+                    ghost = game.ghosts[index]
+                    previous_x, previous_y = previous[1].get(index, (x, y))
+                    x = (lerp(previous_x, x, alpha) - left) * scale
+                    y = (lerp(previous_y, y, alpha) - top) * scale
+                    ghost.draw(x, y, time, world, atlas)
+                    tracker.add(ghost.bounds(x, y))
+            if swarm:
+                (previous_x, previous_y), (xs, ys) = previous[2], current[2]
+                shown = np.flatnonzero(camera.visible(xs, ys))
+                previous_x, previous_y, xs, ys = (
+                    previous_x[shown], previous_y[shown], xs[shown], ys[shown]
+                )
+                # Same snapping rule as lerp(), for every shown swarm ghost at once
+                jump = (np.abs(xs - previous_x) > CELL_SIZE) | (
+                    np.abs(ys - previous_y) > CELL_SIZE
+                )
+                xs = np.where(jump, xs, previous_x + (xs - previous_x) * alpha).astype(np.int64)
+                ys = np.where(jump, ys, previous_y + (ys - previous_y) * alpha).astype(np.int64)
+                xs = ((xs - left) * scale).astype(np.int64)
+                ys = ((ys - top) * scale).astype(np.int64)
+                draw_swarm(
+                    game.swarm.flee[shown], game.swarm.color[shown], xs, ys, time, world, atlas
+                )
+                tracker.add(swarm_bounds(xs, ys))
+        world.set_clip(None)
+        if world is not screen:
+            with phase("scale"):
+                pygame.transform.scale(world, (WIDTH, HEIGHT), screen)
+
+        with phase("hud"):
+            tracker.add(
+                screen.blit(
+                    hud_font.render(f"SCORE: {pacman.score}", True, CYBER_BLUE),
+                    (10, HEIGHT - 80),
+                )
+            )
+            tracker.add(
+                screen.blit(
+                    hud_font.render(f"LIVES: {pacman.lives}", True, CYBER_BLUE),
+                    (10, HEIGHT - 50),
+                )
+            )
+            tracker.add(
+                screen.blit(
+                    hud_font.render(f"LEVEL: {game.level+1}", True, CYBER_BLUE),
+                    (WIDTH - 200, HEIGHT - 80),
+                )
+            )
 
-        font = pygame.font.Font(None, 36)
-        screen.blit(
-            font.render(f"SCORE: {pacman.score}", True, CYBER_BLUE), (10, HEIGHT - 80)
-        )
-        screen.blit(
-            font.render(f"LIVES: {pacman.lives}", True, CYBER_BLUE), (10, HEIGHT - 50)
-        )
-        screen.blit(
-            font.render(f"LEVEL: {current_level+1}", True, CYBER_BLUE),
-            (WIDTH - 200, HEIGHT - 80),
+        if game.done:
+            # Overlays dim the whole screen, so fall back to a full flip
+            tracker.invalidate()
+            with phase("end screen"):
+                if game.game_over:
+                    draw_end_screen("GAME OVER", "RESTART", 50, pacman.score, restart_button)
+                else:
+                    draw_end_screen("YOU WON!", "PLAY AGAIN", 30, pacman.score, restart_button)
+        if show_profile:
+            with phase("profiler overlay"):
+                tracker.add(draw_profiler_overlay(profiler))
+
+        with phase("present"):
+            tracker.present()
+        # A capture.FrameCapture copies the presented frame for its writer
+        # thread; its counters go in the window title, not the recording
+        if capture is not None:
+            with phase("capture"):
+                capture.grab(screen)
+            if frames % RENDER_FPS == 0:
+                pygame.display.set_caption(f"CyberPunk-Man  {capture.status()}")
+        profiler.end_frame()
+
+    if recorder is not None:
+        recorder.save(record, game)
+    if profile:
+        profiler.save(profile)
+    return game
+
+
+def maze_size(text):
+    # "256x256" -> (256, 256), for --maze-size
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    if min(width, height) < mazegen.MIN_SIZE:
+        raise argparse.ArgumentTypeError(
+            f"mazes are at least {mazegen.MIN_SIZE}x{mazegen.MIN_SIZE}"
         )
+    return width, height
 
-        if game_over:
-            screen.fill((0, 0, 0, 200), special_flags=pygame.BLEND_RGBA_MULT)
-            font = pygame.font.Font(None, 72)
-            text = font.render("GAME OVER", True, NEON_PINK)
-            screen.blit(text, (WIDTH // 2 - text.get_width() // 2, HEIGHT // 2 - 100))
-            screen.blit(
-                font.render(f"FINAL SCORE: {pacman.score}", True, CYBER_BLUE),
-                (WIDTH // 2 - 150, HEIGHT // 2 - 50),
-            )
-            pygame.draw.rect(screen, NEON_PINK, restart_button)
-            screen.blit(
-                font.render("RESTART", True, DARK_BG),
-                (restart_button.x + 50, restart_button.y + 10),
-            )
 
-        if victory:
-            screen.fill((0, 0, 0, 200), special_flags=pygame.BLEND_RGBA_MULT)
-            font = pygame.font.Font(None, 72)
-            text = font.render("YOU WON!", True, NEON_PINK)
-            screen.blit(text, (WIDTH // 2 - text.get_width() // 2, HEIGHT // 2 - 100))
-            screen.blit(
-                font.render(f"FINAL SCORE: {pacman.score}", True, CYBER_BLUE),
-                (WIDTH // 2 - 150, HEIGHT // 2 - 50),
-            )
-            pygame.draw.rect(screen, NEON_PINK, restart_button)
-            screen.blit(
-                font.render("PLAY AGAIN", True, DARK_BG),
-                (restart_button.x + 30, restart_button.y + 10),
-            )
+def bounded_int(name, low, high):
+    # An argparse type for whole numbers from low to high, as replays store
+    # them (--seed, --swarm)
+    def parse(text):
+        try:
+            value = int(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected a whole number, got {text!r}")
+        if not low <= value <= high:
+            raise argparse.ArgumentTypeError(f"{name} must be between {low} and {high}")
+        return value
 
-        pygame.display.flip()
-        clock.tick(FPS)
+    return parse
 
-    pygame.quit()
-    sys.exit()
+
+def scale_factor(text):
+    # "0.5" or "50%" -> 0.5, for --render-scale
+    try:
+        scale = float(text[:-1]) / 100 if text.endswith("%") else float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a scale such as 0.5 or 50%, got {text!r}")
+    if not MIN_RENDER_SCALE <= scale <= 1:
+        raise argparse.ArgumentTypeError(f"render scale must be between {MIN_RENDER_SCALE} and 1")
+    return scale
 
 
 if __name__ == "__main__":
-    # starting_level = level_select_menu()
-    starting_level = CyberUI.level_select_menu()
-    game_loop(starting_level)
+    if sys.argv[1:2] == ["tournament"]:
+        # Forwarded to the headless runner, kept in tournament.py so its
+        # pool workers never import the display code
+        import tournament
+
+        sys.exit(tournament.main(sys.argv[2:]))
+    parser = argparse.ArgumentParser(description="CyberPunk-Man v2.0")
+    parser.add_argument(
+        "--dirty-rects",
+        action="store_true",
+        help="only push changed screen areas instead of flipping the whole window",
+    )
+    parser.add_argument(
+        "--ghost-ai",
+        choices=engine.GHOST_AI_MODES,
+        default="random",
+        help="random ghosts (classic) or chase ghosts that hunt with shortest paths",
+    )
+    parser.add_argument(
+        "--fps",
+        type=int,
+        default=RENDER_FPS,
+        help="frame rate cap (0 for none); game speed does not depend on it",
+    )
+    parser.add_argument(
+        "--fast-forward",
+        action="store_true",
+        help="run the simulation as fast as possible (toggle in game with Tab)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="PATH",
+        help="time every frame phase and show the overlay (F3); save the session "
+        "as a Chrome trace (.json) or CSV (.csv) on exit",
+    )
+    parser.add_argument(
+        "--profile-frames",
+        type=int,
+        default=DEFAULT_FRAMES,
+        help="frames the profiler keeps",
+    )
+    parser.add_argument(
+        "--seed",
+        type=bounded_int("seed", 0, MAX_SEED),
+        default=None,
+        help="seed for the first game",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        help="save a replay of the game here (see replay.py)",
+    )
+    parser.add_argument(
+        "--capture",
+        metavar="PATH",
+        help="record the game at --capture-fps: a directory for a PNG sequence, "
+        "or a .raw file for a raw video stream",
+    )
+    parser.add_argument(
+        "--capture-fps",
+        type=int,
+        default=CAPTURE_FPS,
+        help="frames recorded per second with --capture",
+    )
+    parser.add_argument(
+        "--swarm",
+        type=bounded_int("swarm ghost count", 0, MAX_SWARM),
+        default=0,
+        metavar="GHOSTS",
+        help="swarm mode: this many random-walking ghosts instead of the usual four",
+    )
+    parser.add_argument(
+        "--maze-size",
+        type=maze_size,
+        nargs="?",
+        const=GENERATED_SIZE,
+        metavar="WxH",
+        help="play a procedurally generated maze of this size "
+        f"(default {GENERATED_SIZE[0]}x{GENERATED_SIZE[1]}, seeded by --seed)",
+    )
+    parser.add_argument(
+        "--quality",
+        choices=QUALITY_PRESETS,
+        default="high",
+        help="high draws everything at full resolution; medium draws the play field "
+        "at 75%% without glitch copies or the scanner; low at 50%% with no effects or confetti",
+    )
+    parser.add_argument(
+        "--render-scale",
+        type=scale_factor,
+        metavar="SCALE",
+        help="resolution the play field is drawn at before being stretched to the window "
+        "(0.5 or 50%%), overriding the preset's",
+    )
+    args = parser.parse_args()
+    set_quality(args.quality, args.render_scale)
+
+    level_list = None
+    if args.maze_size:
+        width, height = args.maze_size
+        if args.record:
+            parser.error("--record only works with the level packs")
+        if args.ghost_ai == "chase" and width * height > MAX_CHASE_CELLS:
+            parser.error(f"chase ghosts only work on mazes up to {MAX_CHASE_CELLS} cells")
+        level_list = [mazegen.generate(width, height, seed=args.seed)]
+        starting_level = 0
+    else:
+        starting_level = CyberUI.level_select_menu()
+    capture = FrameCapture(args.capture, init_display(), args.capture_fps) if args.capture else None
+    game_loop(
+        starting_level,
+        dirty_rects=args.dirty_rects,
+        ghost_ai=args.ghost_ai,
+        swarm=args.swarm,
+        fps=args.fps,
+        fast_forward=args.fast_forward,
+        seed=args.seed,
+        record=args.record,
+        profile=args.profile,
+        profile_frames=args.profile_frames,
+        level_list=level_list,
+        capture=capture,
+    )
+    if capture is not None:
+        print(capture.close())
+    pygame.quit()
+    sys.exit()
@@ -0,0 +1,308 @@
+"""Maze geometry shared by the engine, the batch simulator and the AI.
+
+Nothing here depends on pixel sizes or pygame: a Maze is a grid of wall
+cells, and its NavGraph is everything derived from the walls that movement
+code needs to look up instead of recomputing every tick.
+"""
+
+import functools
+import hashlib
+import os
+import struct
+from array import array
+from collections import deque
+
+DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]  # 0=Right, 1=Down, 2=Left, 3=Up
+# Ascending direction tuple for every 4-bit direction mask
+MASK_DIRECTIONS = [tuple(d for d in range(4) if mask >> d & 1) for mask in range(16)]
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+UNREACHABLE = 0xFFFF
+NO_HOP = 0xFF
+
+
+def cell_bits(mask, size):
+    # One "0"/"1" character per cell index, so large masks are walked in
+    # linear time instead of one big-int operation per cell
+    return bin(mask)[:1:-1].ljust(size, "0")
+
+
+def iter_cells(mask, width):
+    # (x, y) of every set bit, lowest first
+    bits = bin(mask)[:1:-1]
+    index = bits.find("1")
+    while index != -1:
+        yield index % width, index // width
+        index = bits.find("1", index + 1)
+
+
+def direction_masks(maze):
+    # NavGraph.dir_mask: per cell, a bit for each direction to an open neighbour
+    width, height = maze.width, maze.height
+    is_open = cell_bits(maze.open_cells, width * height)
+    masks = bytearray(width * height)
+    for x, y in iter_cells(maze.open_cells, width):
+        for direction, (dx, dy) in enumerate(DIRECTIONS):
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and is_open[ny * width + nx] == "1":
+                masks[y * width + x] |= 1 << direction
+    return masks
+
+
+class Maze:
+    """Walls of one level packed into an integer bitmask.
+
+    Cell (x, y) is bit y * width + x. rows keeps the original nested lists
+    for the renderer. A Maze made by from_walls() (see levelpack) can carry
+    the precompiled NavGraph.dir_mask, so the walls never need probing.
+    """
+
+    dir_mask = None
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.height = len(rows)
+        self.width = len(rows[0])
+        self.walls = 0
+        for y, row in enumerate(rows):
+            for x, cell in enumerate(row):
+                if cell == 1:
+                    self.walls |= 1 << (y * self.width + x)
+        self.open_cells = ~self.walls & ((1 << (self.width * self.height)) - 1)
+
+    @classmethod
+    def from_walls(cls, width, height, walls, dir_mask=None):
+        maze = cls.__new__(cls)
+        maze.width = width
+        maze.height = height
+        maze.walls = walls
+        maze.open_cells = ~walls & ((1 << (width * height)) - 1)
+        maze.dir_mask = dir_mask
+        return maze
+
+    @functools.cached_property
+    def rows(self):
+        walls = cell_bits(self.walls, self.width * self.height)
+        return [
+            [int(cell) for cell in walls[y * self.width : (y + 1) * self.width]]
+            for y in range(self.height)
+        ]
+
+    def bit(self, x, y):
+        return 1 << (y * self.width + x)
+
+    def is_open(self, x, y):
+        return (
+            0 <= x < self.width
+            and 0 <= y < self.height
+            and not self.walls >> (y * self.width + x) & 1
+        )
+
+    def content_hash(self):
+        return hashlib.sha1(f"{self.width}x{self.height}:{self.walls}".encode()).hexdigest()
+
+    @functools.cached_property
+    def nav(self):
+        return NavGraph(self)
+
+    @functools.cached_property
+    def distances(self):
+        return DistanceTable.load_or_build(self)
+
+
+class NavGraph:
+    """Per-level movement tables, built once from the walls.
+
+    For every cell index (y * width + x):
+        dir_mask[i]          4-bit mask of directions leading to an open cell
+        directions[i]        the same directions as an ascending tuple
+        ghost_options[i][d]  directions a ghost arriving with direction d may
+                             take: no U-turn unless it is the only way out
+        dead_end[i]          open cell with a single exit
+    offsets[d] is the index step for direction d, and corners holds the open
+    cell closest to each maze corner (top-left, top-right, bottom-left,
+    bottom-right).
+
+    Junctions and dead ends (open cells that do not have exactly two exits)
+    are the nodes of a corridor graph: edges[i] lists (direction, node,
+    length) for each corridor leaving node i, length counted in cells.
+    """
+
+    def __init__(self, maze):
+        self.width = maze.width
+        self.height = maze.height
+        size = maze.width * maze.height
+        self.offsets = [dy * maze.width + dx for dx, dy in DIRECTIONS]
+        self.directions = [()] * size
+        self.ghost_options = [((), (), (), ())] * size
+        self.dead_end = bytearray(size)
+
+        if maze.dir_mask is not None:
+            self.dir_mask = bytearray(maze.dir_mask)
+        else:
+            self.dir_mask = direction_masks(maze)
+
+        for index in range(size):
+            valid = MASK_DIRECTIONS[self.dir_mask[index]]
+            if not valid:
+                continue
+            self.directions[index] = valid
+            self.dead_end[index] = len(valid) == 1
+
+            options = []
+            for heading in range(4):
+                opposite = (heading + 2) % 4
+                # Falls back to the U-turn (or nothing) at a dead end
+                options.append(tuple(d for d in valid if d != opposite) or valid)
+            self.ghost_options[index] = tuple(options)
+
+        self.nodes = [
+            index
+            for index in range(size)
+            if self.directions[index] and len(self.directions[index]) != 2
+        ]
+        self.node_set = set(self.nodes)
+        self.edges = {node: self.walk_corridors(node) for node in self.nodes}
+
+        open_indices = [index for index in range(size) if self.directions[index]]
+        self.corners = [
+            min(
+                open_indices,
+                key=lambda i: abs(i % self.width - cx) + abs(i // self.width - cy),
+            )
+            for cx, cy in (
+                (0, 0),
+                (self.width - 1, 0),
+                (0, self.height - 1),
+                (self.width - 1, self.height - 1),
+            )
+        ]
+
+    def index(self, x, y):
+        return y * self.width + x
+
+    def walk_corridors(self, node):
+        edges = []
+        for direction in self.directions[node]:
+            index, heading, length = node, direction, 0
+            while True:
+                dx, dy = DIRECTIONS[heading]
+                index += dy * self.width + dx
+                length += 1
+                if index in self.node_set:
+                    edges.append((direction, index, length))
+                    break
+                # Corridor cell: two exits, keep going out the one we did not enter by
+                back = (heading + 2) % 4
+                heading = next(d for d in self.directions[index] if d != back)
+        return edges
+
+
+class DistanceTable:
+    """All-pairs shortest paths between the open cells of a maze.
+
+    Open cells are numbered in cell-index order (cell_id maps a cell index to
+    that number, -1 for walls). For open cells a and b:
+        dist[a * n + b]      path length in cells (UNREACHABLE if none)
+        next_hop[a * n + b]  direction of the first step from a towards b
+                             (NO_HOP when a == b or b is unreachable)
+    Both are flat arrays (uint16 and bytes), built with one BFS per open cell
+    and cached under CACHE_DIR by a hash of the walls.
+    """
+
+    MAGIC = b"CPDT"
+    VERSION = 1
+
+    def __init__(self, maze, dist=None, next_hop=None):
+        self.width = maze.width
+        self.cell_id = array("i", [-1]) * (maze.width * maze.height)
+        self.cells = array(
+            "i", (y * maze.width + x for x, y in iter_cells(maze.open_cells, maze.width))
+        )
+        for number, index in enumerate(self.cells):
+            self.cell_id[index] = number
+        self.n = len(self.cells)
+        if dist is None:
+            dist, next_hop = self.build(maze.nav)
+        self.dist = dist
+        self.next_hop = next_hop
+
+    def build(self, nav):
+        n = self.n
+        dist = array("H", [UNREACHABLE]) * (n * n)
+        next_hop = bytearray([NO_HOP]) * (n * n)
+        offsets = nav.offsets
+        for source in range(n):
+            row = source * n
+            dist[row + source] = 0
+            start = self.cells[source]
+            queue = deque()
+            for direction in nav.directions[start]:
+                cell = self.cell_id[start + offsets[direction]]
+                dist[row + cell] = 1
+                next_hop[row + cell] = direction
+                queue.append(cell)
+            while queue:
+                cell = queue.popleft()
+                index = self.cells[cell]
+                for direction in nav.directions[index]:
+                    other = self.cell_id[index + offsets[direction]]
+                    if dist[row + other] == UNREACHABLE:
+                        dist[row + other] = dist[row + cell] + 1
+                        next_hop[row + other] = next_hop[row + cell]
+                        queue.append(other)
+        return dist, bytes(next_hop)
+
+    def distance(self, a, b):
+        # a and b are cell indices (y * width + x)
+        return self.dist[self.cell_id[a] * self.n + self.cell_id[b]]
+
+    def hop(self, a, b):
+        return self.next_hop[self.cell_id[a] * self.n + self.cell_id[b]]
+
+    @classmethod
+    def cache_path(cls, maze):
+        return os.path.join(CACHE_DIR, f"distances-{maze.content_hash()[:16]}.bin")
+
+    @classmethod
+    def load_or_build(cls, maze):
+        path = cls.cache_path(maze)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            data = None
+        if data is not None:
+            table = cls.decode(maze, data)
+            if table is not None:
+                return table
+        table = cls(maze)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # Written aside and renamed, so a parallel worker never reads half
+            # a table and an interrupted write leaves no broken one
+            partial = f"{path}.{os.getpid()}.tmp"
+            with open(partial, "wb") as f:
+                f.write(table.encode())
+            os.replace(partial, path)
+        except OSError:
+            pass  # The cache only saves the BFS on the next start
+        return table
+
+    def encode(self):
+        header = struct.pack("<4sHI", self.MAGIC, self.VERSION, self.n)
+        return header + self.dist.tobytes() + self.next_hop
+
+    @classmethod
+    def decode(cls, maze, data):
+        header_size = struct.calcsize("<4sHI")
+        if len(data) < header_size:
+            return None  # empty or cut short
+        magic, version, n = struct.unpack_from("<4sHI", data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            return None
+        if n != bin(maze.open_cells).count("1") or len(data) != header_size + 3 * n * n:
+            return None
+        dist = array("H")
+        dist.frombytes(data[header_size : header_size + 2 * n * n])
+        return cls(maze, dist, data[header_size + 2 * n * n :])
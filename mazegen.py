@@ -0,0 +1,162 @@
+"""Procedural mazes of any size, as levels the engine can play.
+
+    python mazegen.py 256 256 --seed 7     # generate one and report on it
+
+generate() carves a perfect maze with an iterative depth-first search over
+the odd cells, then knocks through the wall at the end of every dead end
+so there are loops to escape ghosts through, like a hand-made level. Pacman
+starts at the open cell nearest the centre, the ghost home is a few cells
+below, and there is one ghost per GHOST_CELLS open cells (at least four),
+none starting within GHOST_CLEARANCE cells of pacman. The open cell nearest
+each corner gets a power pellet, plus one more per PELLET_CELLS open cells.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from levelpack import Level
+from maze import DIRECTIONS
+
+MIN_SIZE = 7
+GHOST_CELLS = 400
+GHOST_CLEARANCE = 8
+PELLET_CELLS = 1000
+HOME_OFFSET = 3  # cells below pacman the ghost home is looked for
+CELL_DIGITS = bytes.maketrans(b"\x00\x01", b"01")  # grid bytes to binary digits
+
+
+def carve(width, height, rng):
+    # bytearray of width * height cells, 1 for wall: a perfect maze between
+    # the odd cells, then every dead end opened into a neighbouring corridor
+    grid = bytearray([1]) * (width * height)
+    start = (1, 1)
+    grid[width + 1] = 0
+    stack = [start]
+    while stack:
+        x, y = stack[-1]
+        options = [
+            (x + 2 * dx, y + 2 * dy, dx, dy)
+            for dx, dy in DIRECTIONS
+            if 0 < x + 2 * dx < width - 1
+            and 0 < y + 2 * dy < height - 1
+            and grid[(y + 2 * dy) * width + x + 2 * dx]
+        ]
+        if not options:
+            stack.pop()
+            continue
+        nx, ny, dx, dy = rng.choice(options)
+        grid[(y + dy) * width + x + dx] = 0
+        grid[ny * width + nx] = 0
+        stack.append((nx, ny))
+
+    for y in range(1, height - 1, 2):
+        for x in range(1, width - 1, 2):
+            exits = [
+                (dx, dy) for dx, dy in DIRECTIONS if not grid[(y + dy) * width + x + dx]
+            ]
+            if len(exits) != 1:
+                continue
+            walls = [
+                (dx, dy)
+                for dx, dy in DIRECTIONS
+                if 0 < x + 2 * dx < width - 1
+                and 0 < y + 2 * dy < height - 1
+                and grid[(y + dy) * width + x + dx]
+            ]
+            if walls:
+                dx, dy = rng.choice(walls)
+                grid[(y + dy) * width + x + dx] = 0
+    return grid
+
+
+def nearest_open(grid, width, height, x, y):
+    # The open cell closest to (x, y), searching outwards ring by ring
+    for radius in range(max(width, height)):
+        ring = [
+            (cx, cy)
+            for cy in range(y - radius, y + radius + 1)
+            for cx in range(x - radius, x + radius + 1)
+            if max(abs(cx - x), abs(cy - y)) == radius
+            and 0 <= cx < width
+            and 0 <= cy < height
+            and not grid[cy * width + cx]
+        ]
+        if ring:
+            return min(ring, key=lambda cell: (abs(cell[0] - x) + abs(cell[1] - y), cell))
+    raise ValueError("maze has no open cells")
+
+
+def generate(width, height, seed=None, ghosts=None):
+    if width < MIN_SIZE or height < MIN_SIZE:
+        raise ValueError(f"mazes need to be at least {MIN_SIZE}x{MIN_SIZE}")
+    rng = random.Random(seed)
+    grid = carve(width, height, rng)
+    open_cells = [index for index in range(width * height) if not grid[index]]
+
+    pacman = nearest_open(grid, width, height, width // 2, height // 2)
+    home_y = min(pacman[1] + HOME_OFFSET, height - 1)
+    home = nearest_open(grid, width, height, pacman[0], home_y)
+
+    far = [
+        (x, y)
+        for x, y in ((index % width, index // width) for index in open_cells)
+        if abs(x - pacman[0]) + abs(y - pacman[1]) >= GHOST_CLEARANCE
+    ]
+    if ghosts is None:
+        ghosts = max(4, len(open_cells) // GHOST_CELLS)
+    starts = rng.sample(far, min(ghosts, len(far))) if far else [home]
+
+    pellet_cells = {
+        nearest_open(grid, width, height, x, y)
+        for x, y in ((0, 0), (width - 1, 0), (0, height - 1), (width - 1, height - 1))
+    }
+    extra = len(open_cells) // PELLET_CELLS
+    pellet_cells.update(
+        (index % width, index // width) for index in rng.sample(open_cells, extra)
+    )
+
+    walls = int(grid[::-1].translate(CELL_DIGITS), 2)
+    dots = ~walls & ((1 << (width * height)) - 1)
+    pellets = sum(1 << (y * width + x) for x, y in pellet_cells)
+    name = f"Generated {width}x{height}" + (f" #{seed}" if seed is not None else "")
+    return Level(name, width, height, walls, dots, pellets, pacman, home, starts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a CyberPunk-Man maze")
+    parser.add_argument("width", type=int)
+    parser.add_argument("height", type=int)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--ghosts", type=int, default=None, help="ghost count (default by size)")
+    parser.add_argument("--show", action="store_true", help="print the maze")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    level = generate(args.width, args.height, args.seed, args.ghosts)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{level.name}: {bin(level.dots).count('1')} dots, "
+        f"{bin(level.pellets).count('1')} pellets, {len(level.ghost_starts)} ghosts "
+        f"in {elapsed * 1000:.1f} ms"
+    )
+    if args.show:
+        ghosts = set(level.ghost_starts)
+        for y, row in enumerate(level.rows):
+            print(
+                "".join(
+                    "#" if wall
+                    else "P" if (x, y) == level.pacman_start
+                    else "H" if (x, y) == level.ghost_home
+                    else "G" if (x, y) in ghosts
+                    else "o" if level.pellets >> (y * level.width + x) & 1
+                    else "."
+                    for x, wall in enumerate(row)
+                )
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
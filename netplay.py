@@ -0,0 +1,1002 @@
+"""Multiplayer over the network: an authoritative asyncio server and clients
+that predict their own moves.
+
+    python netplay.py serve --players 2 --mode versus    # rooms of two on port 7777
+    python netplay.py play localhost:7777                # join a room with a window
+    python netplay.py loadtest --clients 64              # simulated clients on localhost
+
+MultiGameState puts several pacmans in one maze, sharing its dots and ghosts.
+In "versus" every player scores and loses lives on their own; in "coop" the
+players share one score and one pool of lives.
+
+The server groups connections into rooms of --players as they arrive and
+steps every room at a fixed tick rate. Each tick it applies the oldest queued
+input of every player, then sends each client a snapshot delta-compressed
+against the previous one. A snapshot holds only the players and ghosts that
+changed, as offsets from where they were last sent, plus the cells of the
+dots eaten and the score gained. The body is encoded once per room; only the
+acknowledged input differs between clients. Everything goes over TCP, so
+every snapshot arrives, in order, and can build on the one before.
+
+Clients predict. Their input is applied to a local copy of the game straight
+away. Every snapshot then resets that copy to the server's state and replays
+the inputs the server has not acknowledged yet.
+
+Messages are framed "<HB" (payload length, message type):
+
+    HELLO     "<4sH"      magic b"CPNP", version                  client -> server
+    START     "<QBBBBBB"  seed, level, mode, ghost AI, players, your player, tick rate
+    INPUT     "<IB"       sequence number, action (0-3 or NO_ACTION)  client -> server
+    SNAPSHOT  "<I"        sequence number of the last input applied, then
+              "<IBBBHH"   tick, level, flags, players, ghosts and dots that follow
+              "<BbbBiBH"  per player: index, dx, dy, state, score gained, lives,
+                          power ticks left
+              "<HbbB"     per ghost: index, dx, dy, state
+              "<I"        per dot eaten: cell index (y * width + x)
+    END       "<II"       final tick, state_checksum() of the final state
+
+A state byte holds the direction in bits 0-1 and the power (players) or flee
+(ghosts) flag in bit 2. With FULL (bit 7) set, dx and dy are unused and an
+absolute "<HH" position follows the record.
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import multiprocessing
+import random
+import struct
+import sys
+import time
+import zlib
+from collections import deque
+
+import pygame
+
+import main
+from engine import (
+    CELL_SIZE,
+    DIRECTIONS,
+    DOT_SCORE,
+    GHOST_AI_MODES,
+    GHOST_SCORE,
+    MAX_TICKS,
+    PELLET_SCORE,
+    POWER_TICKS,
+    TICKS_PER_SECOND,
+    CyberPacman,
+    GameState,
+    Ghost,
+    get_levels,
+)
+from maze import iter_cells
+from policies import random_policy
+
+MODES = ("versus", "coop")
+MAX_PLAYERS = 16
+MAX_TICK_RATE = 255  # START's tick rate and level are single bytes
+MAX_LEVEL = 255
+DEFAULT_PORT = 7777
+NO_ACTION = 4
+MAX_QUEUED_INPUTS = 4  # inputs kept per player; older ones are dropped
+MAX_BUFFERED = 1 << 20  # bytes queued for a client before it is dropped
+
+MAGIC = b"CPNP"
+VERSION = 2
+HELLO_MESSAGE, START_MESSAGE, INPUT_MESSAGE, SNAPSHOT_MESSAGE, END_MESSAGE = range(1, 6)
+FRAME = struct.Struct("<HB")
+HELLO = struct.Struct("<4sH")
+START = struct.Struct("<QBBBBBB")
+INPUT = struct.Struct("<IB")
+ACK = struct.Struct("<I")
+SNAPSHOT = struct.Struct("<IBBBHH")
+PLAYER = struct.Struct("<BbbBiBH")
+GHOST = struct.Struct("<HbbB")
+POSITION = struct.Struct("<HH")
+DOT = struct.Struct("<I")
+END = struct.Struct("<II")
+
+GAME_OVER, VICTORY = 1, 2  # snapshot flags
+POWER = 4  # state byte flags
+FULL = 0x80
+
+
+class MultiGameState(GameState):
+    """Several pacmans in one maze, sharing its dots and ghosts.
+
+    step() takes a list with one action per player. Players move in order,
+    so a dot goes to whoever reaches it first. A power pellet makes the
+    ghosts flee, but only the player who ate it (every player in coop) can
+    eat them. A player at zero lives is out, and the game is over once every
+    player is out. Events carry the player as their last item, e.g.
+    ("dot", x, y, player) and ("death", ghost_index, player), plus
+    ("out", player). self.pacman is the first player still in the game,
+    the one chase ghosts hunt.
+    """
+
+    def __init__(
+        self,
+        players=2,
+        mode="versus",
+        level=0,
+        seed=None,
+        pacman_cls=CyberPacman,
+        ghost_cls=Ghost,
+        ghost_ai="random",
+        level_list=None,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"unknown mode {mode!r}, expected one of {MODES}")
+        if not 1 <= players <= MAX_PLAYERS:
+            raise ValueError(f"games take 1 to {MAX_PLAYERS} players")
+        self.mode = mode
+        self.players = [pacman_cls() for _ in range(players)]
+        super().__init__(level, seed, pacman_cls, ghost_cls, ghost_ai, level_list)
+
+    def reset(self, level=0, seed=None):
+        self.pacman = self.players[0]
+        super().reset(level, seed)
+        for player in self.players:
+            player.reset_game()
+
+    def initialize_level(self):
+        super().initialize_level()
+        for player in self.players:
+            player.start = self.layout.pacman_start
+            player.reset_state()
+
+    def copy(self):
+        clone = super().copy()
+        clone.players = [copy.copy(player) for player in self.players]
+        clone.pacman = clone.players[self.players.index(self.pacman)]
+        return clone
+
+    def team(self, number):
+        # The players whose score, lives and power go with player number's
+        if self.mode == "coop":
+            return self.players
+        return [self.players[number]]
+
+    def move_player(self, number, action, events):
+        player = self.players[number]
+        if action is not None:
+            player.direction = action
+        dx, dy = DIRECTIONS[player.direction]
+        player.move(dx * player.speed, dy * player.speed, self.maze)
+
+        x, y = int(player.x // CELL_SIZE), int(player.y // CELL_SIZE)
+        bit = self.maze.bit(x, y)
+        if not self.dots & bit:
+            return
+        self.dots ^= bit
+        self.dots_left -= 1
+        if self.pellets & bit:
+            self.pellets ^= bit
+            for teammate in self.team(number):
+                if teammate.lives > 0:
+                    teammate.power_mode = True
+                    teammate.power_timer = self.tick
+            self.set_fleeing(True)
+            points = PELLET_SCORE
+            events.append(("pellet", x, y, number))
+        else:
+            points = DOT_SCORE
+            events.append(("dot", x, y, number))
+        for teammate in self.team(number):
+            teammate.score += points
+
+    def collide_ghosts(self, events):
+        catch_distance = (CELL_SIZE // 2) ** 2
+        home_x, home_y = self.layout.ghost_home
+        for number, player in enumerate(self.players):
+            if player.lives <= 0:
+                continue
+            for index, ghost in self.nearby_ghosts():
+                ddx = player.x - ghost.x
+                ddy = player.y - ghost.y
+                if ddx * ddx + ddy * ddy >= catch_distance:
+                    continue
+                if player.power_mode and ghost.flee:
+                    events.append(("ghost_eaten", ghost.x, ghost.y, number))
+                    ghost.x = home_x * CELL_SIZE + CELL_SIZE // 2
+                    ghost.y = home_y * CELL_SIZE + CELL_SIZE // 2
+                    ghost.flee = False
+                    for teammate in self.team(number):
+                        teammate.score += GHOST_SCORE
+                elif not player.power_mode and not ghost.flee:
+                    self.catch_player(number, index, events)
+                    break
+        if not self.game_over and all(player.lives <= 0 for player in self.players):
+            self.game_over = True
+            events.append(("game_over",))
+
+    def catch_player(self, number, index, events):
+        events.append(("death", index, number))
+        for teammate in self.team(number):
+            teammate.lives -= 1
+            if teammate.lives <= 0:
+                events.append(("out", self.players.index(teammate)))
+        self.players[number].reset_state()
+
+    def step(self, actions=None):
+        if self.done:
+            return []
+        events = []
+        self.tick += 1
+        if actions is None:
+            actions = [None] * len(self.players)
+        for number, action in enumerate(actions):
+            if self.players[number].lives > 0:
+                self.move_player(number, action, events)
+
+        power_ended = False
+        for number, player in enumerate(self.players):
+            if player.power_mode and self.tick - player.power_timer > POWER_TICKS:
+                player.power_mode = False
+                power_ended = True
+                events.append(("power_end", number))
+        if power_ended and not any(player.power_mode for player in self.players):
+            self.set_fleeing(False)
+
+        self.pacman = next(
+            (player for player in self.players if player.lives > 0), self.players[0]
+        )
+        self.move_ghosts()
+        self.collide_ghosts(events)
+        self.check_level_complete(events)
+
+        for player in self.players:
+            player.update_speed()
+        return events
+
+
+def power_left(game, player):
+    # Ticks of power mode player has left, 0 without power
+    if not player.power_mode:
+        return 0
+    return POWER_TICKS - (game.tick - player.power_timer)
+
+
+def state_checksum(game):
+    # CRC of everything snapshots carry, to check a client's copy of the
+    # game against the server's
+    state = [
+        game.level,
+        game.dots,
+        game.pellets,
+        [
+            (int(player.x), int(player.y), player.direction, power_left(game, player),
+             player.score, player.lives)
+            for player in game.players
+        ],
+        [(int(ghost.x), int(ghost.y), ghost.direction, ghost.flee) for ghost in game.ghosts],
+    ]
+    return zlib.crc32(repr(state).encode())
+
+
+def frame(kind, payload):
+    return FRAME.pack(len(payload), kind) + payload
+
+
+async def read_message(reader):
+    # (message type, payload) of the next message
+    length, kind = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return kind, await reader.readexactly(length)
+
+
+def position_record(x, y, last):
+    # dx, dy, FULL bit and absolute position bytes for an entity at (x, y)
+    # that was last sent at last (None when never sent)
+    if last is not None:
+        dx, dy = x - last[0], y - last[1]
+        if -128 <= dx < 128 and -128 <= dy < 128:
+            return dx, dy, 0, b""
+    return 0, 0, FULL, POSITION.pack(x, y)
+
+
+class SnapshotEncoder:
+    """Builds the snapshot bodies of one game, each a delta on the last.
+
+    Clients start from the level's dots, as START tells them the level. The
+    first snapshot of a level sends every player and ghost in full; after a
+    level change the clients reset their dots themselves.
+    """
+
+    def __init__(self, game):
+        self.game = game
+        self.start_level()
+        self.scores = [0] * len(game.players)
+
+    def start_level(self):
+        self.level = self.game.level
+        self.players = [None] * len(self.game.players)
+        self.ghosts = [None] * len(self.game.ghosts)
+
+    def encode(self, events):
+        game = self.game
+        if game.level != self.level:
+            self.start_level()
+            eaten = []
+        else:
+            width = game.maze.width
+            eaten = [
+                event[2] * width + event[1] for event in events if event[0] in ("dot", "pellet")
+            ]
+
+        records = []
+        players = 0
+        for index, player in enumerate(game.players):
+            x, y = int(player.x), int(player.y)
+            state = player.direction | (POWER if player.power_mode else 0)
+            # The tick power started only changes with a pellet; the ticks
+            # left go with every record sent
+            power = player.power_timer if player.power_mode else None
+            sent = (x, y, state, player.score, player.lives, power)
+            last = self.players[index]
+            if sent == last:
+                continue
+            dx, dy, full, position = position_record(x, y, last)
+            score = player.score - self.scores[index]
+            records.append(
+                PLAYER.pack(
+                    index, dx, dy, state | full, score, player.lives, power_left(game, player)
+                )
+                + position
+            )
+            self.players[index] = sent
+            self.scores[index] = player.score
+            players += 1
+
+        ghosts = 0
+        for index, ghost in enumerate(game.ghosts):
+            x, y = int(ghost.x), int(ghost.y)
+            sent = (x, y, ghost.direction | (POWER if ghost.flee else 0))
+            last = self.ghosts[index]
+            if sent == last:
+                continue
+            dx, dy, full, position = position_record(x, y, last)
+            records.append(GHOST.pack(index, dx, dy, sent[2] | full) + position)
+            self.ghosts[index] = sent
+            ghosts += 1
+
+        flags = (GAME_OVER if game.game_over else 0) | (VICTORY if game.victory else 0)
+        header = SNAPSHOT.pack(game.tick, game.level, flags, players, ghosts, len(eaten))
+        return header + b"".join(records) + b"".join(DOT.pack(cell) for cell in eaten)
+
+
+def apply_snapshot(game, data, offset=0):
+    # Brings game (the client's copy of the server state) up to the snapshot
+    # body at data[offset:]
+    tick, level, flags, players, ghosts, eaten = SNAPSHOT.unpack_from(data, offset)
+    offset += SNAPSHOT.size
+    if level != game.level:
+        game.level = level
+        game.initialize_level()
+    game.tick = tick
+    game.game_over = bool(flags & GAME_OVER)
+    game.victory = bool(flags & VICTORY)
+
+    for _ in range(players):
+        index, dx, dy, state, score, lives, power = PLAYER.unpack_from(data, offset)
+        offset += PLAYER.size
+        player = game.players[index]
+        if state & FULL:
+            player.x, player.y = POSITION.unpack_from(data, offset)
+            offset += POSITION.size
+        else:
+            player.x, player.y = int(player.x) + dx, int(player.y) + dy
+        player.direction = state & 3
+        player.power_mode = bool(state & POWER)
+        player.power_timer = tick - (POWER_TICKS - power)
+        player.score += score
+        player.lives = lives
+        player.update_speed()
+
+    for _ in range(ghosts):
+        index, dx, dy, state = GHOST.unpack_from(data, offset)
+        offset += GHOST.size
+        ghost = game.ghosts[index]
+        if state & FULL:
+            ghost.x, ghost.y = POSITION.unpack_from(data, offset)
+            offset += POSITION.size
+        else:
+            ghost.x, ghost.y = int(ghost.x) + dx, int(ghost.y) + dy
+        ghost.direction = state & 3
+        ghost.flee = bool(state & POWER)
+
+    for _ in range(eaten):
+        bit = 1 << DOT.unpack_from(data, offset)[0]
+        offset += DOT.size
+        if game.dots & bit:
+            game.dots ^= bit
+            game.pellets &= ~bit
+            game.dots_left -= 1
+
+
+class Connection:
+    def __init__(self, writer):
+        self.writer = writer
+        self.inputs = deque()  # (sequence, action) received, not applied yet
+        self.ack = 0
+        self.closed = False
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.started = None
+        self.ended = None
+
+    def send(self, data):
+        if self.closed:
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+            # Never wait on a client: one that cannot keep up is dropped
+            self.close()
+            return
+        self.writer.write(data)
+        self.bytes_sent += len(data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+    def next_action(self):
+        # The oldest queued input (acknowledged), or None to keep going
+        inputs = self.inputs
+        while len(inputs) > MAX_QUEUED_INPUTS:
+            inputs.popleft()
+        if not inputs:
+            return None
+        self.ack, action = inputs.popleft()
+        return None if action == NO_ACTION else action
+
+
+class Room:
+    """One game and the connections playing it."""
+
+    def __init__(self, connections, mode, seed, level, ghost_ai, tick_rate, max_ticks):
+        self.connections = connections
+        self.max_ticks = max_ticks
+        self.game = MultiGameState(len(connections), mode, level, seed, ghost_ai=ghost_ai)
+        self.encoder = SnapshotEncoder(self.game)
+        for number, connection in enumerate(connections):
+            start = START.pack(
+                seed,
+                level,
+                MODES.index(mode),
+                GHOST_AI_MODES.index(ghost_ai),
+                len(connections),
+                number,
+                tick_rate,
+            )
+            connection.send(frame(START_MESSAGE, start))
+
+    @property
+    def finished(self):
+        return self.game.done or self.game.tick >= self.max_ticks
+
+    def tick(self):
+        actions = [connection.next_action() for connection in self.connections]
+        body = self.encoder.encode(self.game.step(actions))
+        for connection in self.connections:
+            connection.send(frame(SNAPSHOT_MESSAGE, ACK.pack(connection.ack) + body))
+
+    def finish(self):
+        end = frame(END_MESSAGE, END.pack(self.game.tick, state_checksum(self.game)))
+        for connection in self.connections:
+            connection.send(end)
+            connection.close()
+
+
+class Server:
+    """Accepts players, groups them into rooms and ticks every room.
+
+    With rooms set, run() returns once that many rooms have finished (the
+    load test); otherwise it serves until cancelled. Every tick's CPU time
+    (time.process_time, so the rest of the machine does not count) is kept
+    in tick_seconds.
+    """
+
+    def __init__(
+        self,
+        players=2,
+        mode="versus",
+        seed=None,
+        level=0,
+        ghost_ai="random",
+        tick_rate=TICKS_PER_SECOND,
+        max_ticks=MAX_TICKS,
+        rooms=None,
+        verbose=False,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"unknown mode {mode!r}, expected one of {MODES}")
+        if not 1 <= players <= MAX_PLAYERS:
+            raise ValueError(f"rooms take 1 to {MAX_PLAYERS} players")
+        if not 1 <= tick_rate <= MAX_TICK_RATE:
+            raise ValueError(f"tick rate must be between 1 and {MAX_TICK_RATE}")
+        last_level = min(len(get_levels()) - 1, MAX_LEVEL)
+        if not 0 <= level <= last_level:
+            raise ValueError(f"level must be between 0 and {last_level}")
+        self.players = players
+        self.mode = mode
+        self.seed = seed
+        self.level = level
+        self.ghost_ai = ghost_ai
+        self.tick_rate = tick_rate
+        self.max_ticks = max_ticks
+        self.rooms_left = rooms
+        self.verbose = verbose
+        self.rng = random.Random(seed)
+        self.waiting = []
+        self.rooms = []
+        self.connections = []
+        self.tick_seconds = []
+        self.late_ticks = 0
+        self.port = None
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT, started=None):
+        server = await asyncio.start_server(self.handle, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        if started is not None:
+            started(self.port)
+        async with server:
+            await self.run()
+
+    async def handle(self, reader, writer):
+        try:
+            kind, payload = await read_message(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        if kind != HELLO_MESSAGE or payload != HELLO.pack(MAGIC, VERSION):
+            writer.close()
+            return
+        connection = Connection(writer)
+        connection.bytes_received += FRAME.size + len(payload)
+        self.connections.append(connection)
+        self.waiting.append(connection)
+        if len(self.waiting) == self.players:
+            self.open_room(self.waiting)
+            self.waiting = []
+        try:
+            while not connection.closed:
+                kind, payload = await read_message(reader)
+                connection.bytes_received += FRAME.size + len(payload)
+                if kind == INPUT_MESSAGE:
+                    connection.inputs.append(INPUT.unpack(payload))
+        except (asyncio.IncompleteReadError, ConnectionError, struct.error):
+            pass
+        # A player who leaves keeps running straight until the room ends
+        connection.close()
+        if connection in self.waiting:
+            self.waiting.remove(connection)
+
+    def open_room(self, connections):
+        seed = self.rng.getrandbits(63)
+        room = Room(
+            connections,
+            self.mode,
+            seed,
+            self.level,
+            self.ghost_ai,
+            self.tick_rate,
+            self.max_ticks,
+        )
+        now = time.perf_counter()
+        for connection in connections:
+            connection.started = now
+        self.rooms.append(room)
+        if self.verbose:
+            print(f"room of {len(connections)} opened, seed {seed}")
+
+    def close_room(self, room):
+        room.finish()
+        now = time.perf_counter()
+        for connection in room.connections:
+            connection.ended = now
+        self.rooms.remove(room)
+        if self.rooms_left is not None:
+            self.rooms_left -= 1
+        if self.verbose:
+            scores = ", ".join(str(player.score) for player in room.game.players)
+            print(f"room finished at tick {room.game.tick}, scores {scores}")
+
+    async def run(self):
+        # Fixed-rate ticks; a tick that starts late is counted and the
+        # schedule restarts from now rather than running ticks back to back
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tick_rate
+        next_tick = loop.time()
+        while self.rooms_left is None or self.rooms_left > 0:
+            if self.rooms:
+                start = time.process_time()
+                for room in list(self.rooms):
+                    room.tick()
+                    if room.finished:
+                        self.close_room(room)
+                self.tick_seconds.append(time.process_time() - start)
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay < 0:
+                self.late_ticks += 1
+                next_tick = loop.time()
+            await asyncio.sleep(max(delay, 0))
+
+    def report(self):
+        ticks = sorted(self.tick_seconds) or [0.0]
+        served = [connection for connection in self.connections if connection.ended]
+        seconds = [connection.ended - connection.started for connection in served]
+        return {
+            "ticks": len(self.tick_seconds),
+            "late_ticks": self.late_ticks,
+            "tick_cpu_ms_mean": 1000 * sum(ticks) / len(ticks),
+            "tick_cpu_ms_p50": 1000 * ticks[len(ticks) // 2],
+            "tick_cpu_ms_p99": 1000 * ticks[min(len(ticks) * 99 // 100, len(ticks) - 1)],
+            "tick_cpu_ms_max": 1000 * ticks[-1],
+            "clients": len(served),
+            "bytes_per_client_second_down": sum(
+                connection.bytes_sent / max(elapsed, 1e-9)
+                for connection, elapsed in zip(served, seconds)
+            ) / max(len(served), 1),
+            "bytes_per_client_second_up": sum(
+                connection.bytes_received / max(elapsed, 1e-9)
+                for connection, elapsed in zip(served, seconds)
+            ) / max(len(served), 1),
+        }
+
+
+class Client:
+    """One player's side of a room.
+
+    state is the game as the server's snapshots describe it; game is the
+    local prediction, state plus the inputs the server has not applied yet,
+    and what a client draws. tick(action) sends an action and applies it to
+    the prediction at once; receive() applies server messages until the room
+    ends, then sets in_sync to whether state matches the server's checksum.
+    """
+
+    def __init__(self, reader, writer, start, pacman_cls=CyberPacman, ghost_cls=Ghost):
+        seed, level, mode, ghost_ai, players, player, tick_rate = START.unpack(start)
+        self.reader = reader
+        self.writer = writer
+        self.player = player
+        self.tick_rate = tick_rate
+        self.state = MultiGameState(
+            players, MODES[mode], level, seed, pacman_cls, ghost_cls, GHOST_AI_MODES[ghost_ai]
+        )
+        self.game = self.state.copy()
+        self.pending = deque()  # (sequence, action) not acknowledged yet
+        self.sequence = 0
+        self.in_sync = None
+        self.bytes_received = FRAME.size + len(start)
+        self.corrections = 0
+        self.correction_pixels = 0.0  # how far reconciling moved our pacman, in total
+
+    @classmethod
+    async def connect(cls, host, port, pacman_cls=CyberPacman, ghost_cls=Ghost):
+        # Joins a room; returns once the server has started it
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(frame(HELLO_MESSAGE, HELLO.pack(MAGIC, VERSION)))
+        kind, payload = await read_message(reader)
+        if kind != START_MESSAGE:
+            writer.close()
+            raise ConnectionError(f"expected START from the server, got message {kind}")
+        return cls(reader, writer, payload, pacman_cls, ghost_cls)
+
+    @property
+    def pacman(self):
+        return self.game.players[self.player]
+
+    def actions(self, action):
+        # Other players are predicted to keep going the way they were
+        actions = [None] * len(self.game.players)
+        actions[self.player] = action
+        return actions
+
+    def tick(self, action):
+        self.sequence += 1
+        self.writer.write(
+            frame(INPUT_MESSAGE, INPUT.pack(self.sequence, NO_ACTION if action is None else action))
+        )
+        self.pending.append((self.sequence, action))
+        self.game.step(self.actions(action))
+
+    def reconcile(self, payload):
+        (ack,) = ACK.unpack_from(payload)
+        apply_snapshot(self.state, payload, ACK.size)
+        while self.pending and self.pending[0][0] <= ack:
+            self.pending.popleft()
+        before = self.pacman
+        game = self.state.copy()
+        for _, action in self.pending:
+            game.step(self.actions(action))
+        after = game.players[self.player]
+        self.corrections += 1
+        self.correction_pixels += abs(after.x - before.x) + abs(after.y - before.y)
+        self.game = game
+
+    async def receive(self):
+        while True:
+            try:
+                kind, payload = await read_message(self.reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            self.bytes_received += FRAME.size + len(payload)
+            if kind == SNAPSHOT_MESSAGE:
+                self.reconcile(payload)
+            elif kind == END_MESSAGE:
+                _, checksum = END.unpack(payload)
+                self.in_sync = checksum == state_checksum(self.state)
+                return
+
+    def close(self):
+        self.writer.close()
+
+
+async def play(host, port):
+    # A window on one player's prediction; the board follows the server's dots
+    client = await Client.connect(host, port, main.CyberPacman, main.Ghost)
+    receiving = asyncio.create_task(client.receive())
+    screen = main.init_display()
+    compositor = main.LevelCompositor()
+    state = client.state
+    compositor.load(state.maze, state.iter_dots())
+    level, dots = state.level, state.dots
+    camera = main.Camera()
+    hud_font = main.get_default_font(36)
+    loop = asyncio.get_running_loop()
+    interval = 1 / client.tick_rate
+    next_tick = loop.time()
+    while not receiving.done():
+        if any(
+            event.type == pygame.QUIT
+            or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE)
+            for event in pygame.event.get()
+        ):
+            break
+        client.tick(main.read_action())
+
+        if state.level != level:
+            compositor.load(state.maze, state.iter_dots())
+        else:
+            for x, y in iter_cells(dots & ~state.dots, state.maze.width):
+                compositor.erase_dot(x, y)
+        level, dots = state.level, state.dots
+
+        game, pacman = client.game, client.pacman
+        camera.follow(pacman.x, pacman.y, game.maze)
+        compositor.scroll(camera)
+        screen.blit(compositor.board, (0, 0))
+        screen.set_clip(compositor.play_area)
+        time_ms = game.tick * 1000 / TICKS_PER_SECOND
+        for ghost in game.ghosts:
+            if camera.visible(ghost.x, ghost.y):
+                ghost.draw(ghost.x - camera.x, ghost.y - camera.y, time_ms)
+        for player in game.players:
+            if player.lives > 0:
+                player.draw(player.x - camera.x, player.y - camera.y, time_ms)
+        screen.set_clip(None)
+        screen.fill(main.DARK_BG, (0, main.HEIGHT - main.HUD_HEIGHT, main.WIDTH, main.HUD_HEIGHT))
+        hud = (
+            f"PLAYER {client.player + 1}/{len(game.players)}  "
+            f"SCORE: {pacman.score}  LIVES: {pacman.lives}"
+        )
+        screen.blit(hud_font.render(hud, True, main.CYBER_BLUE), (10, main.HEIGHT - 80))
+        pygame.display.flip()
+
+        next_tick += interval
+        await asyncio.sleep(max(next_tick - loop.time(), 0))
+    receiving.cancel()
+    client.close()
+    pygame.quit()
+
+
+def serve_process(options, queue):
+    # Load test server, in its own process so its CPU time is its own
+    server = Server(**options)
+    asyncio.run(server.serve("127.0.0.1", 0, started=queue.put))
+    queue.put(server.report())
+
+
+async def simulate_clients(port, clients, seed):
+    # clients random-turning players, each ticking at the server's rate;
+    # returns their totals
+    loop = asyncio.get_running_loop()
+
+    async def simulate(number):
+        client = await Client.connect("127.0.0.1", port)
+        started = time.perf_counter()
+        rng = random.Random(seed + number)
+        receiving = asyncio.create_task(client.receive())
+        interval = 1 / client.tick_rate
+        next_tick = loop.time()
+        while not receiving.done():
+            client.tick(random_policy(client.game, rng))
+            next_tick += interval
+            await asyncio.sleep(max(next_tick - loop.time(), 0))
+        client.close()
+        return client, time.perf_counter() - started
+
+    simulated = await asyncio.gather(*(simulate(number) for number in range(clients)))
+    return {
+        "clients": clients,
+        "in_sync": sum(bool(client.in_sync) for client, _ in simulated),
+        "inputs": sum(client.sequence for client, _ in simulated),
+        "seconds": sum(seconds for _, seconds in simulated),
+        "corrections": sum(client.corrections for client, _ in simulated),
+        "correction_pixels": sum(client.correction_pixels for client, _ in simulated),
+    }
+
+
+def client_process(port, clients, seed, queue):
+    queue.put(asyncio.run(simulate_clients(port, clients, seed)))
+
+
+def load_test(clients, players, mode, ticks, tick_rate, seed, processes=None):
+    # The server and the simulated clients each get their own processes
+    # (client_processes of them), so the clients do not eat into the
+    # server's CPU time on a machine with the cores to spare
+    if clients % players:
+        raise ValueError(f"{clients} clients do not fill rooms of {players}")
+    if processes is None:
+        processes = max((multiprocessing.cpu_count() or 2) - 1, 1)
+    processes = min(processes, clients)
+    options = {
+        "players": players,
+        "mode": mode,
+        "seed": seed,
+        "tick_rate": tick_rate,
+        "max_ticks": ticks,
+        "rooms": clients // players,
+    }
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve_process, args=(options, queue))
+    server.start()
+    port = queue.get(timeout=30)
+
+    results = multiprocessing.Queue()
+    workers = []
+    for number in range(processes):
+        first, last = clients * number // processes, clients * (number + 1) // processes
+        worker = multiprocessing.Process(
+            target=client_process, args=(port, last - first, seed + first, results)
+        )
+        worker.start()
+        workers.append(worker)
+    totals = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    report = queue.get(timeout=30)
+    server.join()
+
+    def total(name):
+        return sum(result[name] for result in totals)
+
+    report.update(
+        {
+            "players_per_room": players,
+            "mode": mode,
+            "tick_rate": tick_rate,
+            "client_processes": processes,
+            "clients_in_sync": total("in_sync"),
+            "client_inputs_per_second": total("inputs") / max(total("seconds"), 1e-9),
+            "correction_pixels_mean": total("correction_pixels") / max(total("corrections"), 1),
+        }
+    )
+    return report
+
+
+def format_report(report):
+    budget = 1000 / report["tick_rate"]
+    return "\n".join(
+        [
+            f"{report['clients']} clients in rooms of {report['players_per_room']} "
+            f"({report['mode']}), {report['ticks']} server ticks at {report['tick_rate']}/s",
+            f"server CPU per tick: mean {report['tick_cpu_ms_mean']:.3f} ms  "
+            f"p50 {report['tick_cpu_ms_p50']:.3f}  p99 {report['tick_cpu_ms_p99']:.3f}  "
+            f"max {report['tick_cpu_ms_max']:.3f}  (budget {budget:.1f} ms, "
+            f"{report['late_ticks']} late ticks)",
+            f"per client: {report['bytes_per_client_second_down']:.0f} bytes/s down, "
+            f"{report['bytes_per_client_second_up']:.0f} bytes/s up, "
+            f"{report['client_inputs_per_second']:.1f} inputs/s sent "
+            f"({report['client_processes']} client processes)",
+            f"prediction: {report['correction_pixels_mean']:.2f} px corrected per snapshot, "
+            f"{report['clients_in_sync']}/{report['clients']} clients in sync at the end",
+        ]
+    )
+
+
+def address(text):
+    # "host:port" or "host" -> (host, port), for play
+    host, _, port = text.rpartition(":") if ":" in text else (text, "", str(DEFAULT_PORT))
+    try:
+        return host or "127.0.0.1", int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected HOST:PORT, got {text!r}")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="CyberPunk-Man multiplayer")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run a server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    play_parser = commands.add_parser("play", help="join a server with a window")
+    play_parser.add_argument(
+        "address", type=address, nargs="?", default=("127.0.0.1", DEFAULT_PORT)
+    )
+    load = commands.add_parser("loadtest", help="simulated clients against a local server")
+    load.add_argument("--clients", type=int, default=64)
+    load.add_argument("--ticks", type=int, default=10 * TICKS_PER_SECOND, help="ticks per room")
+    load.add_argument(
+        "--client-processes",
+        type=int,
+        default=None,
+        help="processes the simulated clients are spread over (default one per spare core)",
+    )
+    load.add_argument("--json", help="also write the report to this file")
+    # Bounded here so a bad value stops the command instead of the first room
+    for command in (serve, load):
+        command.add_argument(
+            "--players",
+            type=main.bounded_int("players", 1, MAX_PLAYERS),
+            default=2,
+            help="players per room",
+        )
+        command.add_argument("--mode", choices=MODES, default="versus")
+        command.add_argument(
+            "--tick-rate",
+            type=main.bounded_int("tick rate", 1, MAX_TICK_RATE),
+            default=TICKS_PER_SECOND,
+        )
+        command.add_argument("--seed", type=int, default=None, help="seeds the rooms' games")
+    serve.add_argument("--ghost-ai", choices=GHOST_AI_MODES, default="random")
+    serve.add_argument(
+        "--level",
+        type=main.bounded_int("level", 0, min(len(get_levels()) - 1, MAX_LEVEL)),
+        default=0,
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        server = Server(
+            args.players,
+            args.mode,
+            args.seed,
+            args.level,
+            args.ghost_ai,
+            args.tick_rate,
+            verbose=True,
+        )
+        print(f"serving rooms of {args.players} ({args.mode}) on {args.host}:{args.port}")
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "play":
+        asyncio.run(play(*args.address))
+    else:
+        if args.clients % args.players:
+            parser.error(f"--clients must be a multiple of --players ({args.players})")
+        seed = random.getrandbits(32) if args.seed is None else args.seed
+        report = load_test(
+            args.clients,
+            args.players,
+            args.mode,
+            args.ticks,
+            args.tick_rate,
+            seed,
+            args.client_processes,
+        )
+        print(format_report(report))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+        return 0 if report["clients_in_sync"] == report["clients"] else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
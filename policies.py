@@ -0,0 +1,71 @@
+"""Scripted pacman policies for headless games.
+
+A policy is a function policy(game, rng) -> action that looks at an
+engine.GameState and returns a direction (0=Right, 1=Down, 2=Left, 3=Up) or
+None to keep going the same way.
+"""
+
+from collections import deque
+
+from engine import CELL_SIZE, DIRECTIONS
+
+
+def pacman_cell(game):
+    return int(game.pacman.x // CELL_SIZE), int(game.pacman.y // CELL_SIZE)
+
+
+def first_step_to_dot(game, blocked=()):
+    # Breadth-first search to the nearest dot, returning the first direction
+    start = pacman_cell(game)
+    maze = game.maze
+    seen = {start}
+    queue = deque()
+    for direction, (dx, dy) in enumerate(DIRECTIONS):
+        cell = (start[0] + dx, start[1] + dy)
+        if maze.is_open(*cell) and cell not in blocked:
+            seen.add(cell)
+            queue.append((cell, direction))
+
+    while queue:
+        (x, y), direction = queue.popleft()
+        if game.dots & maze.bit(x, y):
+            return direction
+        for dx, dy in DIRECTIONS:
+            cell = (x + dx, y + dy)
+            if cell not in seen and maze.is_open(*cell) and cell not in blocked:
+                seen.add(cell)
+                queue.append((cell, direction))
+    return None
+
+
+def random_policy(game, rng):
+    if rng.random() < 0.1:
+        return rng.randrange(4)
+    return None
+
+
+def greedy_policy(game, rng):
+    return first_step_to_dot(game)
+
+
+def evasive_policy(game, rng):
+    # Greedy, but never path through cells next to a ghost that can kill us
+    blocked = set()
+    for ghost in game.ghosts:
+        if ghost.flee:
+            continue
+        gx, gy = int(ghost.x // CELL_SIZE), int(ghost.y // CELL_SIZE)
+        blocked.add((gx, gy))
+        for dx, dy in DIRECTIONS:
+            blocked.add((gx + dx, gy + dy))
+    action = first_step_to_dot(game, blocked)
+    if action is None:
+        action = first_step_to_dot(game)
+    return action
+
+
+POLICIES = {
+    "random": random_policy,
+    "greedy": greedy_policy,
+    "evasive": evasive_policy,
+}
@@ -0,0 +1,205 @@
+"""Opt-in frame profiler for the game loop.
+
+    python main.py --profile session.json   # Chrome trace (chrome://tracing, Perfetto)
+    python main.py --profile session.csv    # one row per frame, one column per phase
+
+FrameProfiler keeps the last `capacity` frames in a ring buffer: the frame
+time, the level being played and the milliseconds spent in each named phase.
+Phases are timed with `with profiler.phase(name):`, or by wrap(), which swaps
+a method on one object for a timed version so code that knows nothing about
+profiling (GameState.step and the hooks it calls) still reports its parts.
+Each phase interval is also kept for the trace export. NULL_PROFILER has the
+same interface and records nothing.
+"""
+
+import csv
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+DEFAULT_FRAMES = 3600  # a minute at 60 FPS
+MAX_PHASES = 32
+EVENTS_PER_FRAME = 64  # phase intervals kept per frame for the trace
+
+
+class Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, self.start, time.perf_counter())
+
+
+class FrameProfiler:
+    enabled = True
+
+    def __init__(self, capacity=DEFAULT_FRAMES):
+        self.capacity = capacity
+        self.names = []
+        self.columns = {}
+        self.frame_ms = np.zeros(capacity)
+        self.frame_start = np.zeros(capacity)  # seconds since the session began
+        self.levels = np.zeros(capacity, dtype=np.int64)
+        self.phase_ms = np.zeros((capacity, MAX_PHASES))
+        self.events = deque(maxlen=capacity * EVENTS_PER_FRAME)
+        self.frames = 0
+        self.origin = time.perf_counter()
+        self.start = None
+        self.level = 0
+
+    def column(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            if len(self.names) == MAX_PHASES:
+                raise ValueError(f"more than {MAX_PHASES} profiler phases")
+            column = self.columns[name] = len(self.names)
+            self.names.append(name)
+        return column
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def add(self, name, start, end):
+        row = self.frames % self.capacity
+        self.phase_ms[row, self.column(name)] += (end - start) * 1000
+        self.events.append((self.frames, name, start - self.origin, end - start))
+
+    def wrap(self, obj, attribute, name):
+        method = getattr(obj, attribute)
+        add = self.add
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                add(name, start, clock())
+
+        setattr(obj, attribute, timed)
+
+    def begin_frame(self, level=0):
+        self.start = time.perf_counter()
+        self.level = level
+        self.phase_ms[self.frames % self.capacity] = 0
+
+    def end_frame(self):
+        end = time.perf_counter()
+        row = self.frames % self.capacity
+        self.frame_ms[row] = (end - self.start) * 1000
+        self.frame_start[row] = self.start - self.origin
+        self.levels[row] = self.level
+        self.frames += 1
+
+    def rows(self, count=None):
+        # Ring rows of the last `count` finished frames, oldest first
+        stored = min(self.frames, self.capacity)
+        count = stored if count is None else min(count, stored)
+        return np.arange(self.frames - count, self.frames) % self.capacity
+
+    def recent(self, count=None):
+        return self.frame_ms[self.rows(count)]
+
+    def percentile(self, p, count=None):
+        times = self.recent(count)
+        return float(np.percentile(times, p)) if len(times) else 0.0
+
+    def phase_means(self, count=None):
+        # (name, mean ms per frame) over the last `count` frames, slowest first
+        rows = self.rows(count)
+        if not len(rows):
+            return []
+        means = self.phase_ms[rows, : len(self.names)].mean(axis=0)
+        return sorted(zip(self.names, means.tolist()), key=lambda item: -item[1])
+
+    def write_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "level", "start_ms", "frame_ms", *self.names])
+            first = self.frames - len(self.rows())
+            for number, row in enumerate(self.rows(), first):
+                writer.writerow(
+                    [
+                        number,
+                        int(self.levels[row]),
+                        round(self.frame_start[row] * 1000, 3),
+                        round(self.frame_ms[row], 4),
+                        *(round(ms, 4) for ms in self.phase_ms[row, : len(self.names)]),
+                    ]
+                )
+
+    def write_chrome_trace(self, path):
+        # Complete ("X") events in microseconds: a frame slice with its phases
+        # nested underneath on the same thread
+        first = self.frames - len(self.rows())
+        trace = []
+        for number, row in enumerate(self.rows(), first):
+            trace.append(
+                {
+                    "name": "frame",
+                    "cat": "frame",
+                    "ph": "X",
+                    "ts": self.frame_start[row] * 1e6,
+                    "dur": self.frame_ms[row] * 1000,
+                    "pid": 1,
+                    "tid": 1,
+                    "args": {"frame": number, "level": int(self.levels[row])},
+                }
+            )
+        for frame, name, start, duration in self.events:
+            if frame >= first:
+                trace.append(
+                    {
+                        "name": name,
+                        "cat": "phase",
+                        "ph": "X",
+                        "ts": start * 1e6,
+                        "dur": duration * 1e6,
+                        "pid": 1,
+                        "tid": 1,
+                    }
+                )
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+    def save(self, path):
+        if path.endswith(".csv"):
+            self.write_csv(path)
+        else:
+            self.write_chrome_trace(path)
+
+
+class NullPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+class NullProfiler:
+    enabled = False
+    null_phase = NullPhase()
+
+    def phase(self, name):
+        return self.null_phase
+
+    def wrap(self, obj, attribute, name):
+        pass
+
+    def begin_frame(self, level=0):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
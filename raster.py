@@ -0,0 +1,244 @@
+"""Observation frames for whole batches of games, rasterized with NumPy.
+
+    rasterizer = Rasterizer(tile=8)                  # 8 pixels per cell
+    frames = rasterizer.render_batch(batch_game)     # (n, H * 8, W * 8, 3) RGB
+    channels = Rasterizer(tile=8, mode="channels").render_batch(batch_game)
+
+Instead of pygame draw calls, every frame is assembled from small stamps
+made once per Rasterizer: one tile per cell kind (empty, wall, dot, pellet)
+and one sprite per pacman direction and power state and per ghost color,
+all drawn with main.py's own shapes at CELL_SIZE and scaled down to tile
+pixels. The board of every game is a single gather of the tiles by cell
+kind, and the sprites of every game are written at their pixel positions
+with one fancy-indexed assignment each for pacman and the ghosts.
+
+mode "rgb" gives uint8 (n, height, width, 3) frames like the rendered game
+(without the HUD or the pacman mouth animation). mode "channels" gives
+uint8 (n, CHANNELS, height, width) one-hot frames with a channel each for
+walls, dots, pellets, pacman, ghosts and fleeing ghosts, marking the pixels
+the RGB stamps would cover.
+"""
+
+import numpy as np
+import pygame
+
+import main
+from batch import unpack_mask
+from engine import CELL_SIZE, GHOST_COLORS
+
+MODES = ("rgb", "channels")
+CHANNELS = 6
+WALLS, DOTS, PELLETS, PACMAN, GHOSTS, FLEEING = range(CHANNELS)
+EMPTY_CELL, WALL_CELL, DOT_CELL, PELLET_CELL = range(4)
+MOUTH_OPEN = 0.3  # the one pacman mouth opening the stamps use
+
+
+def stamp(surface, tile):
+    # A CELL_SIZE drawing as (tile, tile, 3) RGB and (tile, tile) coverage
+    surface = pygame.transform.smoothscale(surface, (tile, tile))
+    rgb = pygame.surfarray.array3d(surface).transpose(1, 0, 2)
+    if surface.get_flags() & pygame.SRCALPHA:
+        covered = pygame.surfarray.array_alpha(surface).T > 127
+    else:
+        covered = (rgb != main.DARK_BG).any(axis=2)
+    return rgb, covered
+
+
+def cell_stamps(tile):
+    # The four cell kinds on the dark background, drawn as draw_maze and
+    # draw_dot draw them
+    stamps = []
+    for kind in range(4):
+        surface = pygame.Surface((CELL_SIZE, CELL_SIZE))
+        surface.fill(main.DARK_BG)
+        if kind == WALL_CELL:
+            rect = pygame.Rect(0, 0, CELL_SIZE, CELL_SIZE)
+            pygame.draw.rect(surface, main.CYBER_BLUE, rect.inflate(-4, -4))
+            pygame.draw.rect(surface, main.DARK_BG, rect.inflate(-8, -8))
+        elif kind in (DOT_CELL, PELLET_CELL):
+            main.draw_dot(0, 0, kind - 1, surface)
+        stamps.append(stamp(surface, tile))
+    return stamps
+
+
+def sprite_stamps(tile):
+    # Pacman by (direction, power), then ghosts by color, flee color last
+    radius = CELL_SIZE // 2 - 4
+    center = (CELL_SIZE // 2, CELL_SIZE // 2)
+    pacman = []
+    for direction in range(4):
+        for power in (False, True):
+            surface = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
+            main.draw_pacman_shape(surface, center, radius, direction, MOUTH_OPEN, power)
+            pacman.append(stamp(surface, tile))
+    ghosts = []
+    for color in list(GHOST_COLORS) + [main.FLEE_COLOR]:
+        surface = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
+        main.draw_ghost_shape(surface, center, radius, color, 0)
+        ghosts.append(stamp(surface, tile))
+    return pacman, ghosts
+
+
+class Rasterizer:
+    """Turns the cell grids and entity positions of n games into frames.
+
+    tile is the frame pixels per cell (CELL_SIZE would be full resolution).
+    The board tiles and sprites are built once here; render() itself only
+    indexes NumPy arrays.
+    """
+
+    def __init__(self, tile=8, mode="rgb"):
+        if mode not in MODES:
+            raise ValueError(f"unknown mode {mode!r}, expected one of {MODES}")
+        if not 1 <= tile <= CELL_SIZE:
+            raise ValueError(f"tile must be between 1 and {CELL_SIZE} pixels")
+        self.tile = tile
+        self.mode = mode
+        cells = cell_stamps(tile)
+        pacman, ghosts = sprite_stamps(tile)
+        # The board is gathered one tile row at a time: tile_rows holds row r
+        # of kind k's tile at k * tile + r (rgb), or row r of its plane c at
+        # (k * 3 + c) * tile + r (channels)
+        if mode == "rgb":
+            tiles = np.array([rgb for rgb, _ in cells], dtype=np.uint8)
+            self.tile_rows = tiles.reshape(4 * tile, tile * 3)
+            self.pacman_pixels = np.array([rgb for rgb, _ in pacman], dtype=np.uint8)
+            self.ghost_pixels = np.array([rgb for rgb, _ in ghosts], dtype=np.uint8)
+        else:
+            # One-hot wall, dot and pellet planes; sprites only need their
+            # coverage
+            planes = np.zeros((4, 3, tile, tile), dtype=np.uint8)
+            for kind, channel in ((WALL_CELL, WALLS), (DOT_CELL, DOTS), (PELLET_CELL, PELLETS)):
+                planes[kind, channel] = cells[kind][1]
+            self.tile_rows = planes.reshape(4 * 3 * tile, tile)
+            self.pacman_pixels = self.ghost_pixels = None
+        self.pacman_masks = np.array([covered for _, covered in pacman])
+        self.ghost_masks = np.array([covered for _, covered in ghosts])
+
+    def frame_shape(self, n, width, height):
+        size = (height * self.tile, width * self.tile)
+        if self.mode == "rgb":
+            return (n,) + size + (3,)
+        return (n, CHANNELS) + size
+
+    def render(
+        self,
+        walls,
+        dots,
+        pacman_x,
+        pacman_y,
+        pacman_direction,
+        power_mode,
+        ghost_x,
+        ghost_y,
+        ghost_flee,
+        out=None,
+    ):
+        """Frames of n games, written into out when given.
+
+        walls (n, H, W) bool, dots (n, H, W) with 1 for a dot and 2 for a
+        pellet, pacman_* and power_mode (n,), ghost_* (n, G); positions are
+        level pixels, the centres of the sprites as in engine.GameState.
+        """
+        n, height, width = walls.shape
+        tile = self.tile
+        shape = self.frame_shape(n, width, height)
+        if out is None:
+            out = np.empty(shape, dtype=np.uint8)
+        elif out.shape != shape or out.dtype != np.uint8:
+            raise ValueError(f"frames go in a uint8 array of {shape}, not {out.shape}")
+
+        # Board: every tile row of every cell taken straight into place
+        dots = np.asarray(dots)
+        kind = np.where(walls, WALL_CELL, np.where(dots > 0, dots + 1, EMPTY_CELL))
+        rows = np.arange(tile)[:, None]
+        if self.mode == "rgb":
+            index = kind[:, :, None, :] * tile + rows  # (n, H, tile, W)
+            board = out.reshape(n, height, tile, width, tile * 3)
+        else:
+            planes = (np.arange(3) * tile)[:, None, None, None]
+            index = kind[:, None, :, None, :] * (3 * tile) + planes + rows  # (n, 3, H, tile, W)
+            board = out.reshape(n, CHANNELS, height, tile, width, tile)[:, :PACMAN]
+            out[:, PACMAN:] = 0
+        np.take(self.tile_rows, index, axis=0, out=board)
+
+        games = np.arange(n)
+        sprite = np.asarray(pacman_direction) * 2 + np.asarray(power_mode, dtype=np.int64)
+        self.stamp(
+            out, games, pacman_x, pacman_y, sprite, self.pacman_masks, self.pacman_pixels, PACMAN
+        )
+        ghost_flee = np.asarray(ghost_flee)
+        ghosts = ghost_flee.shape[1]
+        colors = np.arange(ghosts) % len(GHOST_COLORS)
+        sprite = np.where(ghost_flee, len(GHOST_COLORS), colors).ravel()
+        channel = np.where(ghost_flee, FLEEING, GHOSTS).ravel()
+        self.stamp(
+            out,
+            np.repeat(games, ghosts),
+            np.asarray(ghost_x).ravel(),
+            np.asarray(ghost_y).ravel(),
+            sprite,
+            self.ghost_masks,
+            self.ghost_pixels,
+            channel,
+        )
+        return out
+
+    def stamp(self, out, games, x, y, sprite, masks, pixels, channel):
+        # Every covered pixel of each game's sprite in one assignment; later
+        # sprites win where they overlap, as with blits
+        tile = self.tile
+        if self.mode == "rgb":
+            _, frame_height, frame_width, _ = out.shape
+        else:
+            _, _, frame_height, frame_width = out.shape
+        x = np.asarray(x).astype(np.int64) * tile // CELL_SIZE - tile // 2
+        y = np.asarray(y).astype(np.int64) * tile // CELL_SIZE - tile // 2
+        left = np.clip(x, 0, frame_width - tile)
+        top = np.clip(y, 0, frame_height - tile)
+        index, row, column = np.nonzero(masks[sprite])
+        rows = top[index] + row
+        columns = left[index] + column
+        if self.mode == "rgb":
+            out[games[index], rows, columns] = pixels[sprite[index], row, column]
+        else:
+            channel = np.broadcast_to(channel, sprite.shape)
+            out[games[index], channel[index], rows, columns] = 1
+
+    def render_batch(self, game, out=None):
+        # Frames of every game in a batch.BatchGame
+        return self.render(
+            ~game.open_cells[game.level, 1:-1, 1:-1],
+            game.dots,
+            game.x,
+            game.y,
+            game.direction,
+            game.power_mode,
+            game.ghost_x,
+            game.ghost_y,
+            game.ghost_flee,
+            out,
+        )
+
+    def render_games(self, games, out=None):
+        # Frames of a list of engine.GameState of the same size and ghost count
+        height, width = games[0].maze.height, games[0].maze.width
+        walls = np.array([unpack_mask(game.layout.walls, width, height) for game in games])
+        dots = np.array(
+            [
+                unpack_mask(game.dots, width, height) + unpack_mask(game.pellets, width, height)
+                for game in games
+            ]
+        )
+        return self.render(
+            walls.astype(bool),
+            dots,
+            np.array([game.pacman.x for game in games]),
+            np.array([game.pacman.y for game in games]),
+            np.array([game.pacman.direction for game in games]),
+            np.array([game.pacman.power_mode for game in games]),
+            np.array([[ghost.x for ghost in game.ghosts] for game in games]),
+            np.array([[ghost.y for ghost in game.ghosts] for game in games]),
+            np.array([[ghost.flee for ghost in game.ghosts] for game in games]),
+            out,
+        )
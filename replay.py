@@ -0,0 +1,200 @@
+"""Record games as a seed plus per-tick inputs, and replay them headlessly.
+
+    python main.py --record bug.cprp       # play, the last game is saved
+    python replay.py bug.cprp              # re-simulate it at full speed
+
+Every random draw in a game comes from generators seeded with the game seed,
+so feeding the recorded actions back through GameState.step() rebuilds the
+game exactly. The file ends up a few hundred bytes for minutes of play:
+
+    header  "<4sHQBBHIQ"  magic b"CPRP", version, seed, starting level,
+                          ghost AI (index into GHOST_AI_MODES), swarm ghost
+                          count (0 for the classic four), ticks, and the
+                          first 8 bytes of state_digest() of the final state
+    runs                  (action byte, LEB128 run length) to the end of the
+                          file; action is a direction 0-3 or NO_ACTION
+"""
+
+import argparse
+import hashlib
+import struct
+import sys
+import time
+
+from engine import GHOST_AI_MODES, GameState
+from swarm import SwarmGameState
+
+MAGIC = b"CPRP"
+VERSION = 1
+HEADER = struct.Struct("<4sHQBBHIQ")
+# The largest seed and swarm ghost count the header's Q and H fields hold
+MAX_SEED = (1 << 64) - 1
+MAX_SWARM = 0xFFFF
+NO_ACTION = 4
+
+
+def state_digest(game):
+    # Everything step() reads or writes, including where the random streams are
+    pacman = game.pacman
+    state = [
+        game.level,
+        game.tick,
+        game.game_over,
+        game.victory,
+        game.dots,
+        game.pellets,
+        game.dots_left,
+        pacman.x,
+        pacman.y,
+        pacman.direction,
+        pacman.speed,
+        pacman.score,
+        pacman.lives,
+        pacman.power_mode,
+        pacman.power_timer,
+        [(ghost.x, ghost.y, ghost.direction, ghost.flee) for ghost in game.ghosts],
+        game.rng.getstate(),
+    ]
+    digest = hashlib.blake2b(repr(state).encode(), digest_size=8)
+    swarm = getattr(game, "swarm", None)
+    if swarm is not None:
+        for array in (swarm.x, swarm.y, swarm.direction, swarm.flee):
+            digest.update(array.tobytes())
+        digest.update(repr(swarm.rng.bit_generator.state).encode())
+    return int.from_bytes(digest.digest(), "little")
+
+
+class Recorder:
+    """Collects the action of every tick of one game as (action, count) runs."""
+
+    def __init__(self, game):
+        self.seed = game.seed
+        self.level = game.level
+        self.ghost_ai = game.ghost_ai
+        self.swarm = getattr(game, "ghost_count", 0)
+        # Checked now rather than when saving, after the game was played
+        if not 0 <= self.seed <= MAX_SEED:
+            raise ValueError(f"replays take seeds from 0 to {MAX_SEED}, not {self.seed}")
+        if self.swarm > MAX_SWARM:
+            raise ValueError(f"replays take up to {MAX_SWARM} swarm ghosts, not {self.swarm}")
+        self.ticks = 0
+        self.runs = []
+
+    def record(self, action):
+        action = NO_ACTION if action is None else action
+        if self.runs and self.runs[-1][0] == action:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([action, 1])
+        self.ticks += 1
+
+    def encode(self, game):
+        data = bytearray(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                self.seed,
+                self.level,
+                GHOST_AI_MODES.index(self.ghost_ai),
+                self.swarm,
+                self.ticks,
+                state_digest(game),
+            )
+        )
+        for action, count in self.runs:
+            data.append(action)
+            while count >= 0x80:
+                data.append(count & 0x7F | 0x80)
+                count >>= 7
+            data.append(count)
+        return bytes(data)
+
+    def save(self, path, game):
+        with open(path, "wb") as f:
+            f.write(self.encode(game))
+
+
+class Replay:
+    def __init__(self, seed, level, ghost_ai, swarm, ticks, digest, runs):
+        self.seed = seed
+        self.level = level
+        self.ghost_ai = ghost_ai
+        self.swarm = swarm
+        self.ticks = ticks
+        self.digest = digest
+        self.runs = runs
+
+    @classmethod
+    def decode(cls, data):
+        if len(data) < HEADER.size:
+            raise ValueError("replay file is truncated")
+        magic, version, seed, level, ghost_ai, swarm, ticks, digest = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a CyberPunk-Man replay (or a newer version)")
+        runs = []
+        position = HEADER.size
+        while position < len(data):
+            action = data[position]
+            count = shift = 0
+            while True:
+                position += 1
+                if position >= len(data):
+                    raise ValueError("replay file is truncated")
+                byte = data[position]
+                count |= (byte & 0x7F) << shift
+                shift += 7
+                if byte < 0x80:
+                    break
+            position += 1
+            runs.append((action, count))
+        if sum(count for _, count in runs) != ticks:
+            raise ValueError("replay runs do not add up to the recorded ticks")
+        return cls(seed, level, GHOST_AI_MODES[ghost_ai], swarm, ticks, digest, runs)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.decode(f.read())
+
+    def new_game(self):
+        if self.swarm:
+            return SwarmGameState(self.level, seed=self.seed, ghost_count=self.swarm)
+        return GameState(self.level, seed=self.seed, ghost_ai=self.ghost_ai)
+
+    def play(self):
+        # Re-simulate every tick; the result should match digest exactly
+        game = self.new_game()
+        step = game.step
+        for action, count in self.runs:
+            action = None if action == NO_ACTION else action
+            for _ in range(count):
+                step(action)
+        return game
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-simulate a CyberPunk-Man replay")
+    parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    replay = Replay.load(args.path)
+    start = time.perf_counter()
+    game = replay.play()
+    elapsed = time.perf_counter() - start
+
+    match = state_digest(game) == replay.digest
+    print(
+        f"seed {replay.seed}  level {replay.level}  ghost AI {replay.ghost_ai}"
+        + (f"  swarm {replay.swarm}" if replay.swarm else "")
+    )
+    print(
+        f"{replay.ticks} ticks in {elapsed:.3f}s "
+        f"({replay.ticks / max(elapsed, 1e-9):.0f} ticks/s), {len(replay.runs)} input runs"
+    )
+    print(f"final: level {game.level}  score {game.pacman.score}  lives {game.pacman.lives}")
+    print("state matches the recording" if match else "STATE DIFFERS from the recording")
+    return 0 if match else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Swarm mode: hundreds or thousands of ghosts kept in NumPy arrays.
+
+GhostSwarm advances every ghost with one vectorised update per tick, using
+the same random-walk rules as engine.Ghost. Collisions with pacman go through
+a SpatialGrid of per-cell buckets, so only the ghosts around pacman are
+checked. SwarmGameState plugs the swarm into the normal GameState rules.
+"""
+
+import copy
+
+import numpy as np
+
+from batch import DX, DY, GHOST_SPEED, HALF, MASK_CHOICES, MASK_COUNTS
+from engine import (
+    CELL_SIZE,
+    GHOST_COLORS,
+    GHOST_SCORE,
+    CyberPacman,
+    GameState,
+)
+
+SWARM_GHOSTS = 1000
+SPAWN_CLEARANCE = 4  # no ghost starts within this many cells of pacman
+CATCH_DISTANCE = (CELL_SIZE // 2) ** 2
+
+
+class SpatialGrid:
+    """Ghost indices bucketed by the maze cell they are in.
+
+    rebuild() groups the ghosts by cell once per tick; near() then returns the
+    ghosts in the 3x3 block of cells around a cell. Anything within
+    CELL_SIZE // 2 of a point is in that block, so it is all a collision
+    check needs to look at.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.order = np.zeros(0, dtype=np.int64)
+        self.starts = np.zeros(width * height + 1, dtype=np.int64)
+
+    def rebuild(self, cells):
+        # Counting sort: ghosts of one cell end up next to each other in order
+        self.order = np.argsort(cells, kind="stable")
+        self.starts[1:] = np.cumsum(np.bincount(cells, minlength=self.width * self.height))
+
+    def bucket(self, cell):
+        return self.order[self.starts[cell] : self.starts[cell + 1]]
+
+    def near(self, cell_x, cell_y):
+        found = [
+            self.bucket(y * self.width + x)
+            for y in range(max(cell_y - 1, 0), min(cell_y + 2, self.height))
+            for x in range(max(cell_x - 1, 0), min(cell_x + 2, self.width))
+        ]
+        return np.sort(np.concatenate(found))
+
+
+class GhostSwarm:
+    """Positions, directions and flee flags of every swarm ghost as arrays.
+
+    color[i] indexes GHOST_COLORS, so the renderer can reuse the four ghost
+    sprites. Nobody starts within SPAWN_CLEARANCE cells of pacman_start.
+    """
+
+    def __init__(self, maze, count, rng, pacman_start):
+        self.rng = rng
+        self.width = maze.width
+        self.dir_mask = np.frombuffer(bytes(maze.nav.dir_mask), dtype=np.uint8).astype(
+            np.int64
+        )
+        self.grid = SpatialGrid(maze.width, maze.height)
+
+        # Spread over the open cells away from pacman, several per cell if need be
+        cells = np.flatnonzero(self.dir_mask)
+        far = (
+            np.abs(cells % maze.width - pacman_start[0])
+            + np.abs(cells // maze.width - pacman_start[1])
+            >= SPAWN_CLEARANCE
+        )
+        start = rng.choice(cells[far], size=count)
+        self.x = start % maze.width * CELL_SIZE + HALF
+        self.y = start // maze.width * CELL_SIZE + HALF
+        self.direction = rng.integers(0, 4, size=count)
+        self.flee = np.zeros(count, dtype=bool)
+        self.color = np.arange(count) % len(GHOST_COLORS)
+
+    def __len__(self):
+        return len(self.x)
+
+    def copy(self):
+        clone = copy.copy(self)
+        clone.rng = copy.deepcopy(self.rng)
+        clone.grid = SpatialGrid(self.grid.width, self.grid.height)
+        for name in ("x", "y", "direction", "flee"):
+            setattr(clone, name, getattr(self, name).copy())
+        return clone
+
+    def cells(self):
+        return (self.y // CELL_SIZE) * self.width + self.x // CELL_SIZE
+
+    def move(self):
+        n = len(self)
+        cell_x = self.x // CELL_SIZE
+        cell_y = self.y // CELL_SIZE
+        centered = (self.x % CELL_SIZE == HALF) & (self.y % CELL_SIZE == HALF)
+
+        # Same choice as Ghost.move: no U-turn unless it is the only way out,
+        # 25% chance to keep going straight
+        valid = self.dir_mask[cell_y * self.width + cell_x]
+        filtered = valid & ~(1 << (self.direction + 2) % 4)
+        filtered = np.where(filtered == 0, valid, filtered)
+        keep = (filtered >> self.direction & 1).astype(bool) & (self.rng.random(n) < 0.25)
+        counts = MASK_COUNTS[filtered]
+        pick = (self.rng.random(n) * counts).astype(np.int64)
+        turn = centered & (counts > 0) & ~keep
+        self.direction = np.where(turn, MASK_CHOICES[filtered, pick], self.direction)
+
+        dx = DX[self.direction]
+        new_x = np.where(dx != 0, self.x + dx * GHOST_SPEED, cell_x * CELL_SIZE + HALF)
+        new_y = np.where(
+            dx != 0, cell_y * CELL_SIZE + HALF, self.y + DY[self.direction] * GHOST_SPEED
+        )
+        ok = ((new_x // CELL_SIZE == cell_x) & (new_y // CELL_SIZE == cell_y)) | (
+            valid >> self.direction & 1
+        ).astype(bool)
+        self.x = np.where(ok, new_x, cell_x * CELL_SIZE + HALF)
+        self.y = np.where(ok, new_y, cell_y * CELL_SIZE + HALF)
+        self.grid.rebuild(self.cells())
+
+    def near(self, x, y):
+        # Indices of the ghosts within catching distance of pixel (x, y)
+        candidates = self.grid.near(int(x // CELL_SIZE), int(y // CELL_SIZE))
+        ddx = self.x[candidates] - x
+        ddy = self.y[candidates] - y
+        return candidates[ddx * ddx + ddy * ddy < CATCH_DISTANCE]
+
+
+class SwarmGameState(GameState):
+    """GameState with a GhostSwarm of ghost_count ghosts instead of four Ghosts.
+
+    The swarm only random-walks, so ghost_ai is always "random". game.ghosts
+    is empty; draw and inspect game.swarm instead. Death events carry the
+    swarm index of the ghost.
+    """
+
+    def __init__(
+        self,
+        level=0,
+        seed=None,
+        pacman_cls=CyberPacman,
+        ghost_count=SWARM_GHOSTS,
+        level_list=None,
+    ):
+        self.ghost_count = ghost_count
+        self.swarm_rng = np.random.default_rng(seed)
+        super().__init__(level, seed, pacman_cls, level_list=level_list)
+
+    def reset(self, level=0, seed=None):
+        if seed is not None:
+            self.swarm_rng = np.random.default_rng(seed)
+        super().reset(level, seed)
+
+    def spawn_ghosts(self):
+        self.ghosts = []
+        self.swarm = GhostSwarm(
+            self.maze, self.ghost_count, self.swarm_rng, self.layout.pacman_start
+        )
+        self.swarm.grid.rebuild(self.swarm.cells())
+
+    def copy(self):
+        clone = super().copy()
+        clone.swarm = self.swarm.copy()
+        clone.swarm.grid.rebuild(clone.swarm.cells())
+        clone.swarm_rng = clone.swarm.rng
+        return clone
+
+    def set_fleeing(self, flee):
+        self.swarm.flee[:] = flee
+
+    def move_ghosts(self):
+        self.swarm.move()
+
+    def collide_ghosts(self, events):
+        pacman = self.pacman
+        swarm = self.swarm
+        home_x, home_y = self.layout.ghost_home
+        for index in swarm.near(pacman.x, pacman.y).tolist():
+            if pacman.power_mode and swarm.flee[index]:
+                events.append(("ghost_eaten", int(swarm.x[index]), int(swarm.y[index])))
+                swarm.x[index] = home_x * CELL_SIZE + HALF
+                swarm.y[index] = home_y * CELL_SIZE + HALF
+                swarm.flee[index] = False
+                pacman.score += GHOST_SCORE
+            elif not pacman.power_mode and not swarm.flee[index]:
+                self.catch(index, events)
+                break
@@ -0,0 +1,226 @@
+"""Run many seeded headless games on every CPU core and report the results.
+
+    python tournament.py --games 10000 --levels 0 1 2 --policies greedy random
+    python main.py tournament --games 10000      # the same, from main.py
+
+Each (level, policy) pair is split into chunks of consecutive seeds. Workers
+play a whole chunk and send back one aggregated Stats record. At most
+CHUNKS_PER_WORKER chunks per worker are handed to the pool at a time, so
+memory use does not grow with the number of games.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from collections import deque
+
+from engine import GHOST_AI_MODES, MAX_TICKS, GameState, TICKS_PER_SECOND, get_levels
+from policies import POLICIES
+
+GHOST_NAMES = ["red", "green", "pink", "magenta"]
+CHUNKS_PER_WORKER = 4  # chunks queued per worker before waiting for results
+
+
+class Stats:
+    def __init__(self):
+        self.games = 0
+        self.score_sum = 0
+        self.score_sq_sum = 0
+        self.score_min = None
+        self.score_max = None
+        self.ticks_sum = 0
+        self.dots_sum = 0
+        self.outcomes = {}
+        self.deaths = {}
+
+    def add_game(self, score, ticks, dots, outcome, deaths):
+        self.games += 1
+        self.score_sum += score
+        self.score_sq_sum += score * score
+        self.score_min = score if self.score_min is None else min(self.score_min, score)
+        self.score_max = score if self.score_max is None else max(self.score_max, score)
+        self.ticks_sum += ticks
+        self.dots_sum += dots
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        for cause in deaths:
+            self.deaths[cause] = self.deaths.get(cause, 0) + 1
+
+    def merge(self, other):
+        if not other.games:
+            return
+        self.games += other.games
+        self.score_sum += other.score_sum
+        self.score_sq_sum += other.score_sq_sum
+        for name in ("score_min", "score_max"):
+            pick = min if name == "score_min" else max
+            mine, theirs = getattr(self, name), getattr(other, name)
+            setattr(self, name, theirs if mine is None else pick(mine, theirs))
+        self.ticks_sum += other.ticks_sum
+        self.dots_sum += other.dots_sum
+        for key, value in other.outcomes.items():
+            self.outcomes[key] = self.outcomes.get(key, 0) + value
+        for key, value in other.deaths.items():
+            self.deaths[key] = self.deaths.get(key, 0) + value
+
+    def summary(self):
+        games = max(self.games, 1)
+        mean = self.score_sum / games
+        variance = max(self.score_sq_sum / games - mean * mean, 0)
+        return {
+            "games": self.games,
+            "score_mean": round(mean, 2),
+            "score_std": round(math.sqrt(variance), 2),
+            "score_min": self.score_min,
+            "score_max": self.score_max,
+            "survival_seconds_mean": round(self.ticks_sum / games / TICKS_PER_SECOND, 2),
+            "dots_cleared_mean": round(self.dots_sum / games, 2),
+            "outcomes": dict(sorted(self.outcomes.items())),
+            "death_causes": dict(sorted(self.deaths.items())),
+        }
+
+
+def play_game(level, policy_name, seed, max_ticks=MAX_TICKS, ghost_ai="random"):
+    game = GameState(level, seed=seed, ghost_ai=ghost_ai)
+    policy = POLICIES[policy_name]
+    rng = random.Random(f"{policy_name}:{seed}")
+    dots = 0
+    deaths = []
+    while not game.done and game.tick < max_ticks:
+        for event in game.step(policy(game, rng)):
+            if event[0] in ("dot", "pellet"):
+                dots += 1
+            elif event[0] == "death":
+                # Ghost colors repeat past the first four, as engine assigns them
+                deaths.append(f"ghost {GHOST_NAMES[event[1] % len(GHOST_NAMES)]}")
+    if game.victory:
+        outcome = "victory"
+    elif game.game_over:
+        outcome = "game_over"
+    else:
+        outcome = "timeout"
+    return game.pacman.score, game.tick, dots, outcome, deaths
+
+
+def play_chunk(task):
+    level, policy_name, first_seed, last_seed, max_ticks, ghost_ai = task
+    stats = Stats()
+    for seed in range(first_seed, last_seed):
+        stats.add_game(*play_game(level, policy_name, seed, max_ticks, ghost_ai))
+    return level, policy_name, stats
+
+
+def make_tasks(games, level_ids, policy_names, chunk_size, base_seed, max_ticks, ghost_ai):
+    # Generated lazily; run_tournament only takes as many as it can queue
+    for level in level_ids:
+        for policy_name in policy_names:
+            for start in range(0, games, chunk_size):
+                stop = min(start + chunk_size, games)
+                yield (
+                    level,
+                    policy_name,
+                    base_seed + start,
+                    base_seed + stop,
+                    max_ticks,
+                    ghost_ai,
+                )
+
+
+def run_tournament(
+    games,
+    level_ids=None,
+    policy_names=None,
+    processes=None,
+    chunk_size=None,
+    base_seed=0,
+    max_ticks=MAX_TICKS,
+    ghost_ai="random",
+):
+    level_ids = list(range(len(get_levels()))) if level_ids is None else level_ids
+    policy_names = list(POLICIES) if policy_names is None else policy_names
+    processes = processes or os.cpu_count() or 1
+    if chunk_size is None:
+        # A few chunks per worker keeps every core busy until the end
+        chunk_size = max(1, min(1000, games // (processes * 4) or 1))
+
+    results = {(level, name): Stats() for level in level_ids for name in policy_names}
+    tasks = make_tasks(
+        games, level_ids, policy_names, chunk_size, base_seed, max_ticks, ghost_ai
+    )
+    # imap_unordered would drain the whole task generator into the pool's
+    # queue, so chunks are submitted one by one behind a bounded window
+    in_flight = deque()
+    with multiprocessing.Pool(processes) as pool:
+        for task in tasks:
+            if len(in_flight) >= processes * CHUNKS_PER_WORKER:
+                level, policy_name, stats = in_flight.popleft().get()
+                results[(level, policy_name)].merge(stats)
+            in_flight.append(pool.apply_async(play_chunk, (task,)))
+        while in_flight:
+            level, policy_name, stats = in_flight.popleft().get()
+            results[(level, policy_name)].merge(stats)
+    return results
+
+
+def format_report(results, elapsed):
+    lines = []
+    total = sum(stats.games for stats in results.values())
+    lines.append(f"{total} games in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.1f} games/s)")
+    for (level, policy_name), stats in sorted(results.items()):
+        summary = stats.summary()
+        lines.append(
+            f"level {level}  {policy_name:<8} "
+            f"score {summary['score_mean']:>8} +/- {summary['score_std']:<8} "
+            f"survival {summary['survival_seconds_mean']:>7}s  "
+            f"dots {summary['dots_cleared_mean']:>6}"
+        )
+        lines.append(f"    outcomes: {summary['outcomes']}")
+        lines.append(f"    deaths:   {summary['death_causes']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless CyberPunk-Man tournament")
+    parser.add_argument("--games", type=int, default=1000, help="games per level and policy")
+    parser.add_argument("--levels", type=int, nargs="+", default=None)
+    parser.add_argument("--policies", nargs="+", choices=sorted(POLICIES), default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS)
+    parser.add_argument("--ghost-ai", choices=GHOST_AI_MODES, default="random")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = run_tournament(
+        args.games,
+        args.levels,
+        args.policies,
+        args.processes,
+        args.chunk_size,
+        args.seed,
+        args.max_ticks,
+        args.ghost_ai,
+    )
+    elapsed = time.perf_counter() - start
+    print(format_report(results, elapsed))
+
+    if args.json:
+        report = {
+            "elapsed_seconds": round(elapsed, 3),
+            "ghost_ai": args.ghost_ai,
+            "results": [
+                {"level": level, "policy": policy_name, **stats.summary()}
+                for (level, policy_name), stats in sorted(results.items())
+            ],
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()